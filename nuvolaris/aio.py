@@ -0,0 +1,114 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# asyncio support for the handlers
+# blocking code is offloaded to a thread pool of the operator,
+# limited by a semaphore for each backend (the kube api, a kind
+# of handler...) so a slow backend cannot take all the threads
+# the limits can be changed with NUVOLARIS_CONCURRENCY_<BACKEND>
+# the threads are reused, so each call runs in a fresh workspace (see nuvolaris.workspace)
+import os, asyncio, functools, contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+import nuvolaris.workspace as nws
+
+THREADS = int(os.environ.get("NUVOLARIS_ASYNC_THREADS", "32"))
+DEFAULT_LIMIT = 8
+LIMITS = {
+    # the whisk handlers configure the global config, one at a time
+    "whisk": 1,
+    "runtimes": 1,
+    "wsku": 8,
+    "workflows": 4,
+    "kube": 16,
+    "http": 16,
+}
+
+_executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="aio")
+_semaphores = {}
+
+def limit_of(backend):
+    """
+    >>> limit_of("whisk"), limit_of("unknown")
+    (1, 8)
+    """
+    value = os.environ.get(f"NUVOLARIS_CONCURRENCY_{backend.upper()}")
+    return int(value or LIMITS.get(backend, DEFAULT_LIMIT))
+
+# the semaphore of a backend in the running loop
+def semaphore(backend):
+    key = (id(asyncio.get_running_loop()), backend)
+    sem = _semaphores.get(key)
+    if sem is None:
+        sem = _semaphores[key] = asyncio.Semaphore(limit_of(backend))
+    return sem
+
+# limit the concurrency of the block for the backend
+@asynccontextmanager
+async def limited(backend=None):
+    if not backend:
+        yield
+        return
+    async with semaphore(backend):
+        yield
+
+# run a function in a fresh workspace with the given name
+def _isolated(workspace, function, *args, **kwargs):
+    with nws.isolated(workspace):
+        return function(*args, **kwargs)
+
+# run a blocking function in the operator threads, in a copy of the current context
+# and in a fresh workspace, named after the resource if given
+async def offload(function, *args, backend=None, workspace=None, **kwargs):
+    """
+    >>> import threading
+    >>> asyncio.run(offload(lambda x: x * 2, 21, backend="kube"))
+    42
+    >>> asyncio.run(offload(threading.current_thread)).name.startswith("aio")
+    True
+    >>> def render(): nws.current().write("test/__a.yaml", "a"); return nws.current().name
+    >>> asyncio.run(offload(render, workspace="wsk/controller"))
+    'wsk/controller'
+    >>> asyncio.run(offload(lambda: nws.current().exists("test/__a.yaml")))
+    False
+    """
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, _isolated, workspace, function, *args, **kwargs)
+    async with limited(backend):
+        return await asyncio.get_running_loop().run_in_executor(_executor, call)
+
+# decorator turning a blocking handler in a coroutine, offloaded and limited by the backend
+# each call runs in a fresh workspace named after the handled resource
+def handler(backend):
+    """
+    >>> @handler("wsku")
+    ... def create(name, **kwargs): return f"created {name} in {nws.current().name}"
+    >>> asyncio.iscoroutinefunction(create), asyncio.run(create(name="demo"))
+    (True, 'created demo in wsku/demo')
+    >>> from kopf._core.actions.invocation import is_async_fn
+    >>> is_async_fn(create)
+    True
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            workspace = kwargs.get("name") and f"{backend}/{kwargs['name']}"
+            return await offload(function, *args, backend=backend, workspace=workspace, **kwargs)
+        # kopf follows __wrapped__ to decide if a handler is async
+        del wrapper.__wrapped__
+        return wrapper
+    return decorator
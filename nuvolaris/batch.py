@@ -0,0 +1,82 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# coalesces the items submitted by concurrent handlers in batches
+# the first item of a batch waits for a window (or until the batch is full),
+# then the whole batch is processed by one call of a blocking function,
+# offloaded to the operator threads, and each handler gets back its own result
+# the waiting handlers do not hold any thread
+import asyncio, logging
+import nuvolaris.aio as aio
+
+class Batcher:
+    """
+    >>> def process(items):
+    ...     return [Exception(f"{item} failed") if item == "bad" else item.upper() for item in items]
+    >>> b = Batcher(process, window=0.05, size=3)
+    >>> async def submit(*items):
+    ...     return await asyncio.gather(*[b.submit(item) for item in items], return_exceptions=True)
+    >>> [str(res) for res in asyncio.run(submit("a", "bad", "c", "d"))]
+    ['A', 'bad failed', 'C', 'D']
+    >>> b.batches
+    [3, 1]
+    """
+    def __init__(self, function, window, size, backend=None):
+        self.function = function
+        self.window = window
+        self.size = size
+        self.backend = backend
+        self.loop = None
+        self.pending = []
+        self.timer = None
+        self.batches = []
+
+    # submit an item and wait for its result
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop, self.pending, self.timer = loop, [], None
+        future = loop.create_future()
+        self.pending.append((item, future))
+        if len(self.pending) >= self.size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        pending, self.pending = self.pending, []
+        if pending:
+            self.batches.append(len(pending))
+            asyncio.ensure_future(self._process(pending))
+
+    async def _process(self, pending):
+        logging.info(f"processing a batch of {len(pending)} items")
+        try:
+            results = await aio.offload(self.function, [item for item, _ in pending], backend=self.backend)
+        except Exception as e:
+            results = [e] * len(pending)
+        for (_, future), res in zip(pending, results):
+            if future.done():
+                continue
+            if isinstance(res, Exception):
+                future.set_exception(res)
+            else:
+                future.set_result(res)
@@ -15,23 +15,98 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import bcrypt
+import os, threading
+from concurrent.futures import ThreadPoolExecutor
+import nuvolaris.lazy as lazy
+bcrypt = lazy.module("bcrypt")
 
-def hash_password(password: str) -> str:
+# the bcrypt cost factor, when not given by the user spec
+ROUNDS = int(os.environ.get("NUVOLARIS_BCRYPT_ROUNDS", "12"))
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+
+# the hashing is cpu bound, but bcrypt releases the GIL while hashing
+# so a pool of threads hashes in parallel without spawning processes
+THREADS = int(os.environ.get("NUVOLARIS_BCRYPT_THREADS", "0")) or min(os.cpu_count() or 1, 4)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def rounds_of(value) -> int:
+    """
+    A valid bcrypt cost factor from a spec value, or the default one.
+
+    >>> rounds_of(None) == ROUNDS, rounds_of("10"), rounds_of(2), rounds_of("x") == ROUNDS
+    (True, 10, 4, True)
+    """
+    try:
+        return min(max(int(value), MIN_ROUNDS), MAX_ROUNDS)
+    except (TypeError, ValueError):
+        return ROUNDS
+
+def hash_password(password: str, rounds: int = None) -> str:
     """
     Apply bcrypt hash algorithm to password.
 
     Args:
         password (str): Password to hash
+        rounds (int): bcrypt cost factor, ROUNDS if not given
 
     Returns:
         str: Hashed password
+
+    >>> hashed = hash_password("pwd", 4)
+    >>> hashed.startswith("$2b$04$"), verify_password("pwd", hashed)
+    (True, True)
     """
     password_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds or ROUNDS)
     hashed_password = bcrypt.hashpw(password_bytes, salt)
     return hashed_password.decode('utf-8')
 
+# the pool is started at the first use
+def pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="bcrypt")
+        return _pool
+
+# stop the pool, waiting for the pending hashes, at the operator shutdown
+# a later use starts a new one
+def shutdown():
+    """
+    >>> _ = hash_passwords([("pwd", 4)]); shutdown(); _pool is None
+    True
+    >>> len(hash_passwords([("pwd", 4)])); shutdown()
+    1
+    """
+    global _pool
+    with _pool_lock:
+        current, _pool = _pool, None
+    if current is not None:
+        current.shutdown(wait=True)
+
+def hash_passwords(passwords: list) -> list:
+    """
+    Hash concurrently in the thread pool a list of passwords and cost factors.
+
+    Args:
+        passwords (list): tuples of the password and the cost factor
+
+    Returns:
+        list: Hashed passwords
+
+    >>> hashed = hash_passwords([("pwd1", 4), ("pwd2", 5)])
+    >>> [h[:7] for h in hashed], verify_password("pwd2", hashed[1])
+    (['$2b$04$', '$2b$05$'], True)
+    """
+    if not passwords:
+        return []
+    futures = [pool().submit(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds or ROUNDS))
+               for password, rounds in passwords]
+    return [future.result().decode('utf-8') for future in futures]
+
 def verify_password(password: str, hashed_password: str) -> bool:
     """
     Verify if hashed password matches password.
@@ -0,0 +1,156 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# per component checkpoints of a reconciliation
+# each component records in the status of the resource (under "checkpoints")
+# its phase, the fingerprint of the configuration it was deployed with,
+# the time, its state and the config values it put, so a reconciliation interrupted
+# by a restart continues from the components not yet completed with the same configuration
+# (the config values of the skipped components are put back, as the later
+# components and the delete handler read them)
+import json, hashlib, logging, threading
+from datetime import datetime, timezone
+import nuvolaris.kube as kube
+import nuvolaris.config as cfg
+from nuvolaris.util import nuv_retry
+
+FIELD = "checkpoints"
+
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+# fingerprint of json serializable values
+def fingerprint(*values):
+    """
+    >>> fingerprint({"a": 1, "b": 2}) == fingerprint({"b": 2, "a": 1})
+    True
+    >>> fingerprint({"a": 1}) == fingerprint({"a": 2}), len(fingerprint("x"))
+    (False, 16)
+    """
+    data = json.dumps(values, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+@nuv_retry(deadline_seconds=15)
+def _patch(target, checkpoints, namespace):
+    data = json.dumps({"status": {FIELD: checkpoints}})
+    return kube.kubectl("patch", target, "--subresource=status", "--type", "merge", "-p", data, namespace=namespace)
+
+class Checkpoints:
+    """
+    the checkpoints of a resource, loaded from its status
+
+    >>> kube.mocker.config("patch", "whisk.nuvolaris.org/controller patched")
+    >>> cp = Checkpoints("wsk/controller", {FIELD: {"redis": {"phase": DONE, "fingerprint": "f1", "state": {"redis": "on"}}}})
+    >>> cp.completed("redis", "f1"), cp.completed("redis", "f2"), cp.completed("couchdb", "f1")
+    ({'redis': 'on'}, None, None)
+    >>> state = {}
+    >>> cp.run("couchdb", "f1", ["couchdb"], state, lambda: state.update(couchdb="on"))
+    >>> state, cp.saved["couchdb"]["phase"], kube.mocker.peek().split(" -p ")[0]
+    ({'couchdb': 'on'}, 'done', 'patch wsk/controller --subresource=status --type merge')
+    >>> cp.run("redis", "f1", ["redis"], state, lambda: state.update(redis="error"))
+    >>> state["redis"]
+    'on'
+    >>> kube.mocker.reset()
+
+    the config values of a component are put back when it is skipped after a restart,
+    so the delete of a resumed reconciliation still finds the objects to delete
+
+    >>> import nuvolaris.redis as redis
+    >>> spec = {"apiVersion": "v1", "kind": "List", "items": [{"apiVersion": "apps/v1", "kind": "StatefulSet", "metadata": {"name": "redis"}}]}
+    >>> kube.mocker.config("patch", "whisk.nuvolaris.org/controller patched")
+    >>> cp = Checkpoints("wsk/controller")
+    >>> cp.run("redis", "f1", ["redis"], {}, lambda: cfg.put("state.redis.spec", spec) and cfg.put("nuvolaris.kafka.url", "kafka:9092"))
+    >>> cfg.clean()
+    >>> resumed = Checkpoints("wsk/controller", {FIELD: cp.saved})
+    >>> resumed.run("redis", "f1", ["redis"], {}, lambda: 1/0)
+    >>> cfg.get("nuvolaris.kafka.url")
+    'kafka:9092'
+    >>> cfg.clean(); resumed.restore("f2"); cfg.get("state.redis.spec")
+    >>> resumed.restore("f1"); cfg.get("state.redis.spec")["kind"]
+    'List'
+    >>> kube.mocker.config("delete", "statefulset.apps/redis deleted")
+    >>> redis.delete(), kube.mocker.peek()
+    ('statefulset.apps/redis deleted', 'delete -f -')
+    >>> kube.mocker.reset(); cfg.clean()
+    """
+    def __init__(self, target, status=None, namespace="nuvolaris"):
+        self.target = target
+        self.namespace = namespace
+        self.saved = dict((status or {}).get(FIELD) or {})
+        self.lock = threading.Lock()
+        self.failed = False
+
+    # the recorded state of a component completed with the fingerprint, or None
+    def completed(self, component, fp):
+        with self.lock:
+            entry = self.saved.get(component) or {}
+        if entry.get("phase") == DONE and entry.get("fingerprint") == fp:
+            return entry.get("state") or {}
+        return None
+
+    # put back the config values of the components completed with the fingerprint
+    def restore(self, fp):
+        with self.lock:
+            entries = list(self.saved.items())
+        for component, entry in entries:
+            if entry.get("phase") == DONE and entry.get("fingerprint") == fp:
+                for key, value in (entry.get("config") or {}).items():
+                    cfg.put(key, value)
+
+    # write the checkpoint of a component
+    # errors are logged and stop further writes, the reconciliation goes on without checkpoints
+    def record(self, component, phase, fp, state=None, config=None):
+        entry = {
+            "phase": phase,
+            "fingerprint": fp,
+            "time": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "state": state or {},
+            "config": config or {}
+        }
+        with self.lock:
+            self.saved[component] = entry
+            if self.failed:
+                return
+        try:
+            _patch(self.target, {component: entry}, self.namespace)
+        except Exception as e:
+            logging.error(f"cannot record the checkpoint of {component} in {self.target}: {e}")
+            self.failed = True
+
+    # run the function deploying a component, unless already completed with the same fingerprint
+    # the state of the component is read from the given keys of the state dict
+    def run(self, component, fp, keys, state, function):
+        saved = self.completed(component, fp)
+        if saved is not None:
+            logging.info(f"{component} already completed, skipped")
+            state.update(saved)
+            with self.lock:
+                config = self.saved[component].get("config") or {}
+            for key, value in config.items():
+                cfg.put(key, value)
+            return
+        self.record(component, RUNNING, fp)
+        with cfg.recording() as config:
+            try:
+                function()
+            except:
+                self.record(component, ERROR, fp)
+                raise
+        current = {key: state[key] for key in keys if key in state}
+        phase = "error" in current.values() and ERROR or DONE
+        self.record(component, phase, fp, current, config)
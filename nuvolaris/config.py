@@ -15,11 +15,22 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import flatdict, json, os
+import flatdict, json, os, threading, time, contextvars
 import logging
+from contextlib import contextmanager
 
 _config = {}
 
+# the values put by the current block, see recording
+_recorder = contextvars.ContextVar("nuvolaris_config_recorder", default=None)
+
+# memoized detection results, by cluster and detection related spec values
+DETECT_TTL = int(os.environ.get("NUVOLARIS_DETECT_TTL", "3600"))
+DETECT_KEYS = ["nuvolaris.kube", "nuvolaris.storageclass", "nuvolaris.provisioner",
+               "components.cosi", "cosi.bucket_storageclass", "cosi.rgwservice_name", "cosi.rgwservice_port"]
+_detected = {}
+_detected_lock = threading.Lock()
+
 # define a configuration 
 # the configuration is a map, followed by a list of labels 
 # the map can be a serialized json and will be flattened to a map of values.
@@ -55,8 +66,33 @@ def get(key, envvar=None, defval=None):
 
 def put(key, value):
     _config[key] = value
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder[key] = value
     return True
 
+# collect the values put by a block (and the threads running in a copy of its context)
+# so they can be saved and put back later
+@contextmanager
+def recording():
+    """
+    >>> with recording() as outer:
+    ...     _ = put("a", 1)
+    ...     with recording() as inner:
+    ...         _ = put("b", 2)
+    >>> outer, inner
+    ({'a': 1, 'b': 2}, {'b': 2})
+    """
+    outer = _recorder.get()
+    values = {}
+    token = _recorder.set(values)
+    try:
+        yield values
+    finally:
+        _recorder.reset(token)
+        if outer is not None:
+            outer.update(values)
+
 def delete(key):
     if key in _config:
         del _config[key]
@@ -86,7 +122,7 @@ def detect_labels(labels=None):
     # read labels if not available
     if not labels:
         import nuvolaris.kube as kube
-        labels = kube.kubectl("get", "nodes", jsonpath='{.items[].metadata.labels}')        
+        labels, = kube.select("nodes", ['{.items[].metadata.labels}'])
     
     res = {}
     kube = None
@@ -246,11 +282,64 @@ def detect_env():
     else:
         logging.warn(f"OW invoker image detection skipped. Using {get('invoker.image')}")
 
-def detect():
-    detect_storage()
-    detect_labels()
+def _cluster():
+    try:
+        import nuvolaris.kube_api as kapi
+        return kapi.client().url
+    except Exception:
+        return os.environ.get("KUBERNETES_SERVICE_HOST", "")
+
+# the memo key of a detection: the cluster and the spec values driving the detection
+def detect_key():
+    """
+    >>> configure({"nuvolaris": {"storageclass": "standard"}})
+    True
+    >>> detect_key()[1:3]
+    (('nuvolaris.kube', 'auto'), ('nuvolaris.storageclass', 'standard'))
+    """
+    return (_cluster(),) + tuple((key, _config.get(key)) for key in DETECT_KEYS)
+
+# forget the memoized detections, for example when nodes or storage classes change
+def invalidate_detection():
+    with _detected_lock:
+        _detected.clear()
+
+# a detection pass fetches nodes, storage classes and services only once
+# with cached the detected values are reused for DETECT_TTL seconds
+# unless invalidate_detection is called
+def detect(cached=False):
+    """
+    >>> import nuvolaris.kube as kube
+    >>> kube.mocker.config("get nodes", '{"items": [{"metadata": {"labels": {"nuvolaris.io/kube": "kind"}}}]}')
+    >>> configure({"nuvolaris": {"storageclass": "standard", "provisioner": "local"}})
+    True
+    >>> detect(cached=True); get("nuvolaris.kube")
+    'kind'
+    >>> configure({"nuvolaris": {"storageclass": "standard", "provisioner": "local"}})
+    True
+    >>> detect(cached=True); get("nuvolaris.kube"), len(kube.mocker.queue)
+    ('kind', 1)
+    >>> invalidate_detection(); kube.mocker.reset()
+    """
+    import nuvolaris.kube as kube
+    key = detect_key()
+    if cached:
+        with _detected_lock:
+            found = _detected.get(key)
+        if found and time.time() - found[0] < DETECT_TTL:
+            logging.info("*** reusing the detected cluster configuration")
+            _config.update(found[1])
+            detect_env()
+            return
+    before = dict(_config)
+    with kube.snapshot():
+        detect_storage()
+        detect_labels()
+        detect_object_storage()
+    values = {k: v for k, v in _config.items() if k not in before or before[k] != v}
+    with _detected_lock:
+        _detected[key] = (time.time(), values)
     detect_env()
-    detect_object_storage()
 
 def dump_config():
     import nuvolaris.config as cfg
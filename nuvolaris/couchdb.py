@@ -15,24 +15,22 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, os, logging, json
-import nuvolaris.kustomize as kus
+import os, logging, json
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
+kus = lazy.module("nuvolaris.kustomize")
 import nuvolaris.kube as kube
 import nuvolaris.couchdb_util as cu
 import nuvolaris.config as cfg
 import nuvolaris.couchdb_util
 import nuvolaris.util as util
+ntp = lazy.module("nuvolaris.template")
 
 from nuvolaris.user_config import UserConfig
 from nuvolaris.user_metadata import UserMetadata
 
-from jinja2 import Environment, FileSystemLoader
-loader = FileSystemLoader(["./nuvolaris/templates", "./nuvolaris/files"])
-env = Environment(loader=loader)
-
 def update_templated_doc(db, database, template, data):
-    tpl = env.get_template(template)
-    doc = json.loads(tpl.render(data))
+    doc = json.loads(ntp.expand_template(template, data))
     return db.update_doc(database, doc)
 
 def create(owner=None):
@@ -251,6 +249,40 @@ def create_ow_user(ucfg: UserConfig, user_metadata: UserMetadata):
         logging.error(f"failed to authorize Openwhisk namespace {subject} authorization id and key: {e}")
         return None
 
+def create_ow_users(entries):
+    """
+    Bulk version of create_ow_user, entries are (state, ucfg, user_metadata) of many users.
+    The subjects are written with one _bulk_docs request, the result of each user is stored in its state
+    """
+    valid = []
+    for state, ucfg, user_metadata in entries:
+        state['couchdb'] = None
+        if util.validate_ow_auth(ucfg.get("auth")):
+            valid.append((state, ucfg, user_metadata))
+        else:
+            logging.warn(f"{ucfg.get('namespace')} authorization is not valid, skipping subject")
+
+    if not valid:
+        return
+
+    logging.info(f"authorizing {len(valid)} OpenWhisk namespaces")
+    try:
+        db = nuvolaris.couchdb_util.CouchDB()
+        check(db.wait_db_ready(60), "wait_db_ready", True)
+        docs = []
+        for _, ucfg, _ in valid:
+            [uuid, key] = ucfg.get("auth").split(":")
+            data = { "name": ucfg.get("namespace"), "key": key, "uuid": uuid}
+            docs.append(json.loads(ntp.expand_template("subject.json", data)))
+
+        for (state, ucfg, user_metadata), res in zip(valid, db.update_docs("subjects", docs)):
+            check(res, f"add {ucfg.get('namespace')}", True)
+            if res:
+                user_metadata.add_metadata("AUTH", ucfg.get("auth"))
+            state['couchdb'] = res
+    except Exception as e:
+        logging.error(f"failed to authorize {len(valid)} Openwhisk namespaces: {e}")
+
 def delete_ow_user(subject):
     logging.info(f"removing auhorization for OpenWhisk namespace {subject}")
 
@@ -107,6 +107,27 @@ class CouchDB:
       return r.status_code in [200,201]
     return False
 
+  # create or update many documents with one _bulk_docs request
+  # return a list with the outcome of each document
+  def update_docs(self, database, docs):
+    if not docs:
+      return []
+    r = self.db_session.post(f"{self.db_base}{database}/_all_docs", json={"keys": [doc['_id'] for doc in docs]})
+    revs = {}
+    if r.status_code == 200:
+      for row in r.json().get("rows", []):
+        value = row.get("value") or {}
+        if "rev" in value and not value.get("deleted"):
+          revs[row["key"]] = value["rev"]
+    for doc in docs:
+      if doc['_id'] in revs:
+        doc['_rev'] = revs[doc['_id']]
+    r = self.db_session.post(f"{self.db_base}{database}/_bulk_docs", json={"docs": docs})
+    if r.status_code not in [200, 201]:
+      logging.error(f"bulk update of {len(docs)} documents in {database} failed: {r.status_code}")
+      return [False] * len(docs)
+    return [bool(row.get("ok")) for row in r.json()]
+
   def delete_doc(self, database, id):
     cur = self.get_doc(database, id)
     if cur and '_rev' in cur:
@@ -167,4 +188,4 @@ class CouchDB:
       return json.loads(r.text)
     
     logging.warn(f"query to {url} failed with {r.status_code}. Body {r.text}")
-    return None    
\ No newline at end of file
+    return None
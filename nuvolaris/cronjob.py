@@ -15,12 +15,17 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, json
+import logging, json
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
 import nuvolaris.operator_util as operator_util
 
+# the spec subtrees the cron manifests are rendered from
+SPEC_INPUTS = ["spec.scheduler", "spec.controller", "spec.couchdb.controller"]
+
 def create(owner=None):
     logging.info("creating cron")
     
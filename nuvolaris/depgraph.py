@@ -0,0 +1,137 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# runs tasks following a dependency graph with a bounded pool of threads
+# a task starts as soon as all the tasks it depends on are completed,
+# so the total time is bounded by the critical path of the graph
+# each task runs in its own workspace and in a copy of the context
+# of the caller (so spawns are attributed to the calling handler)
+import os, time, logging, contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import nuvolaris.workspace as nws
+
+WORKERS = int(os.environ.get("NUVOLARIS_DEPLOY_WORKERS", "4"))
+
+class CycleError(Exception):
+    pass
+
+class DependencyFailed(Exception):
+    def __init__(self, name, dependency):
+        self.dependency = dependency
+        super().__init__(f"{name} not executed because {dependency} failed")
+
+# the dependencies restricted to the given tasks, inverted if reverse
+def _edges(names, deps, reverse):
+    edges = {name: set() for name in names}
+    for name in names:
+        for dep in deps.get(name, []):
+            if dep in edges and dep != name:
+                if reverse:
+                    edges[dep].add(name)
+                else:
+                    edges[name].add(dep)
+    return edges
+
+# the tasks grouped in levels, each level depends only on the previous ones
+def levels(names, deps, reverse=False):
+    """
+    >>> deps = {"kafka": ["zookeeper"], "invoker": ["couchdb", "kafka"]}
+    >>> levels(["couchdb", "zookeeper", "kafka", "invoker", "redis"], deps)
+    [['couchdb', 'redis', 'zookeeper'], ['kafka'], ['invoker']]
+    >>> levels(["couchdb", "zookeeper", "kafka", "invoker"], deps, reverse=True)
+    [['invoker'], ['couchdb', 'kafka'], ['zookeeper']]
+    >>> try: levels(["a", "b"], {"a": ["b"], "b": ["a"]})
+    ... except CycleError as e: print(e)
+    dependency cycle among a, b
+    """
+    edges = _edges(names, deps, reverse)
+    done, res = set(), []
+    while len(done) < len(edges):
+        level = sorted(n for n, d in edges.items() if n not in done and d <= done)
+        if not level:
+            raise CycleError("dependency cycle among " + ", ".join(sorted(set(edges) - done)))
+        res.append(level)
+        done.update(level)
+    return res
+
+def _execute(name, function):
+    start = time.monotonic()
+    with nws.isolated():
+        function()
+    logging.info(f"{name} completed in {time.monotonic() - start:.1f}s")
+
+# execute the tasks (a dict of name and function) following the dependencies
+# (a dict of name and the list of names it depends on, names not in tasks are ignored)
+# with reverse the dependencies are inverted, for example to tear down
+# returns a dict with the exception raised by each task, or None when it succeeded
+# the tasks depending on a failed one are not executed and fail with DependencyFailed
+def run(tasks, deps={}, workers=WORKERS, reverse=False):
+    """
+    >>> import threading
+    >>> order, lock = [], threading.Lock()
+    >>> def task(name, fail=False):
+    ...     def fn():
+    ...         with lock: order.append(name)
+    ...         if fail: raise Exception(f"{name} failed")
+    ...     return fn
+    >>> tasks = {n: task(n) for n in ["couchdb", "zookeeper", "kafka", "invoker"]}
+    >>> deps = {"kafka": ["zookeeper"], "invoker": ["couchdb", "kafka"]}
+    >>> res = run(tasks, deps)
+    >>> res == {n: None for n in tasks}, order.index("kafka") > order.index("zookeeper"), order[-1]
+    (True, True, 'invoker')
+    >>> tasks["kafka"] = task("kafka", fail=True)
+    >>> res = run(tasks, deps)
+    >>> res["couchdb"], str(res["kafka"]), str(res["invoker"])
+    (None, 'kafka failed', 'invoker not executed because kafka failed')
+    """
+    edges = _edges(list(tasks), deps, reverse)
+    # fail early on cycles
+    levels(list(tasks), deps, reverse)
+    res = {}
+    pending = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="depgraph") as pool:
+        while len(res) < len(tasks):
+            for name in tasks:
+                if name in res or name in pending.values():
+                    continue
+                if not edges[name] <= set(res):
+                    continue
+                failed = [dep for dep in sorted(edges[name]) if res[dep] is not None]
+                if failed:
+                    res[name] = DependencyFailed(name, failed[0])
+                    continue
+                ctx = contextvars.copy_context()
+                pending[pool.submit(ctx.run, _execute, name, tasks[name])] = name
+            if not pending:
+                continue
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                res[name] = future.exception()
+    return res
+
+# raise the first error of the results not caused by a failed dependency
+def check(res):
+    """
+    >>> check({"a": None})
+    >>> try: check({"b": DependencyFailed("b", "a"), "a": Exception("a failed")})
+    ... except Exception as e: print(e)
+    a failed
+    """
+    errors = [e for e in res.values() if e]
+    if errors:
+        raise next((e for e in errors if not isinstance(e, DependencyFailed)), errors[0])
@@ -15,7 +15,9 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, json, time
+import logging, json, time
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import os
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
@@ -55,7 +57,7 @@ def deploy_info_route(apihost,namespace):
 
     logging.info(f"*** configuring route for apihost-info")
     path_to_template_yaml =  info.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)        
     return res 
 
@@ -80,12 +82,12 @@ def deploy_api_routes(apihost,namespace,should_create_www=False):
 
     logging.info(f"*** configuring route for apihost")
     path_to_template_yaml =  api.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     logging.info(f"*** configuring route for apihost-my")
     path_to_template_yaml =  my.render_template(namespace)
-    res += kube.kubectl("apply", "-f",path_to_template_yaml)
+    res += kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml) 
 
     if should_create_www:
@@ -99,7 +101,7 @@ def deploy_api_routes(apihost,namespace,should_create_www=False):
 
             logging.info(f"*** configuring route for apihost-www-my")
             path_to_template_yaml =  www_my.render_template(namespace)
-            res += kube.kubectl("apply", "-f",path_to_template_yaml)
+            res += kube.apply_file(path_to_template_yaml)
             os.remove(path_to_template_yaml) 
         
     return res
@@ -119,18 +121,29 @@ def deploy_info_ingress(apihost, namespace):
     if info.requires_traefik_middleware():
         logging.info("*** configuring traefik middleware for apihost-info ingress")
         path_to_template_yaml = info.render_traefik_middleware_template(namespace)
-        res += kube.kubectl("apply", "-f",path_to_template_yaml)
+        res += kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)
 
     logging.info(f"*** configuring static ingress for apihost-info")
     path_to_template_yaml = info.render_template(namespace)
-    res += kube.kubectl("apply", "-f",path_to_template_yaml)
+    res += kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     return res     
     
 
 def deploy_api_ingresses(apihost, namespace,should_create_www=False):
+    """
+    >>> import glob
+    >>> cfg.clean(); cfg.put("nuvolaris.kube", "k3s")
+    True
+    >>> kube.mocker.config("apply", "applied\\n")
+    >>> deploy_api_ingresses("http://localhost", "nuvolaris", True).count("applied")
+    6
+    >>> [cmd for cmd, _ in kube.mocker.queue].count("apply -f -"), glob.glob("/tmp/__nuvolaris_*")
+    (6, [])
+    >>> kube.mocker.reset(); cfg.clean()
+    """
     logging.info(f"**** configuring ingresses based endpoint for apihost {apihost}")
     res = ""   
     api = IngressData(apihost)
@@ -156,23 +169,23 @@ def deploy_api_ingresses(apihost, namespace,should_create_www=False):
     if api.requires_traefik_middleware():
         logging.info("*** configuring traefik middleware for apihost ingress")
         path_to_template_yaml = api.render_traefik_middleware_template(namespace)
-        res += kube.kubectl("apply", "-f",path_to_template_yaml)
+        res += kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)
 
     if my.requires_traefik_middleware():
         logging.info("*** configuring traefik middleware for apihost-my ingress")
         path_to_template_yaml = my.render_traefik_middleware_template(namespace)
-        res += kube.kubectl("apply", "-f",path_to_template_yaml)
+        res += kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)        
 
     logging.info(f"*** configuring static ingress for apihost")
     path_to_template_yaml = api.render_template(namespace)
-    res += kube.kubectl("apply", "-f",path_to_template_yaml)
+    res += kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     logging.info(f"*** configuring static ingress for apihost-my")
     path_to_template_yaml = my.render_template(namespace)
-    res += kube.kubectl("apply", "-f",path_to_template_yaml)
+    res += kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     if should_create_www:
@@ -189,12 +202,12 @@ def deploy_api_ingresses(apihost, namespace,should_create_www=False):
         if www_my.requires_traefik_middleware():
             logging.info("*** configuring traefik middleware for apihost-www-my ingress")
             path_to_template_yaml = www_my.render_traefik_middleware_template(namespace)
-            res += kube.kubectl("apply", "-f",path_to_template_yaml)
+            res += kube.apply_file(path_to_template_yaml)
             os.remove(path_to_template_yaml)
 
         logging.info(f"*** configuring static ingress for apihost-www-my")
         path_to_template_yaml = www_my.render_template(namespace)
-        res += kube.kubectl("apply", "-f",path_to_template_yaml)
+        res += kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)                     
 
     return res 
@@ -18,16 +18,21 @@
 
 import nuvolaris.kustomize as kus
 import nuvolaris.kube as kube
+import nuvolaris.pod_exec as pod_exec
 import nuvolaris.config as cfg
 import nuvolaris.template as ntp
 import nuvolaris.util as util
 import os.path
 import logging
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 
 from nuvolaris.util import get_etcd_replica
 
 
+# the spec subtrees the etcd manifests are rendered from
+SPEC_INPUTS = ["spec.etcd", "spec.nuvolaris.affinity", "spec.nuvolaris.tolerations", "spec.nuvolaris.storageclass"]
+
 def create(owner=None):
     logging.info("create etcd")
     data = util.get_etcd_config_data()
@@ -65,17 +70,11 @@ def render_etcd_script(namespace,template,data):
     """
     uses the given template to render a sh script to execute via bash shell.
     """  
-    out = f"/tmp/__{namespace}_{template}"
-    file = ntp.spool_template(template, out, data)
-    return os.path.abspath(file)
-
-def exec_etcd_script(pod_name,path_to_etcd_script):
-    logging.info(f"passing script {path_to_etcd_script} to pod {pod_name}")
-    res = kube.kubectl("cp",path_to_etcd_script,f"{pod_name}:{path_to_etcd_script}")
-    res = kube.kubectl("exec","-i",pod_name,"--","/bin/bash","-c",f"chmod +x {path_to_etcd_script}")
-    res = kube.kubectl("exec","-i",pod_name,"--","/bin/bash","-c",path_to_etcd_script)
-    os.remove(path_to_etcd_script)    
-    return res
+    return ntp.expand_template(template, data)
+
+def exec_etcd_script(pod_name,etcd_script):
+    logging.info(f"streaming script to pod {pod_name}")
+    return pod_exec.check_output(pod_name, "/bin/bash -s", etcd_script)
     
 
 def create_etcd_user(username:str, password:str, prefix:str):
@@ -92,11 +91,11 @@ def create_etcd_user(username:str, password:str, prefix:str):
         data["prefix"]=prefix
         data["mode"]="create"       
 
-        path_to_etcd_script = render_etcd_script(username,"etcd_manage_user_tpl.sh",data)        
+        etcd_script = render_etcd_script(username,"etcd_manage_user_tpl.sh",data)        
         pod_name = util.get_pod_name_by_selector("name=nuvolaris-etcd","{.items[0].metadata.name}")
 
         if(pod_name):
-            res = exec_etcd_script(pod_name,path_to_etcd_script)  
+            res = exec_etcd_script(pod_name,etcd_script)  
             if res:
                 return True
             else:
@@ -118,11 +117,11 @@ def delete_db_user(username):
         data["username"]=username
         data["mode"]="delete"
 
-        path_to_etcd_script = render_etcd_script(username,"etcd_manager_user_tpl.sh",data)        
+        etcd_script = render_etcd_script(username,"etcd_manager_user_tpl.sh",data)        
         pod_name = util.get_pod_name_by_selector("name=nuvolaris-etcd","{.items[0].metadata.name}")
 
         if(pod_name):
-            res = exec_etcd_script(pod_name,path_to_etcd_script)  
+            res = exec_etcd_script(pod_name,etcd_script)  
             if res:
                 return res
             else:
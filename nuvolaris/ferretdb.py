@@ -19,7 +19,9 @@
 # Deploys a standalone ferretdb relying on postgres db
 #
 
-import kopf, json, time
+import json, time
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
@@ -178,12 +180,12 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
         data["password"]=ucfg.get('mongodb.password')
         data["mode"]="create"
         
-        path_to_pgpass = postgres.render_postgres_script(f"{namespace}_ferretdb","pgpass_tpl.properties",data)
-        path_to_mdb_script = postgres.render_postgres_script(f"{namespace}_ferretdb","postgres_manage_user_tpl.sql",data)
+        pgpass = postgres.render_postgres_script(f"{namespace}_ferretdb","pgpass_tpl.properties",data)
+        mdb_script = postgres.render_postgres_script(f"{namespace}_ferretdb","postgres_manage_user_tpl.sql",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.app == 'nuvolaris-postgres')].metadata.name}")      
 
         if(pod_name):
-            res = postgres.exec_psql_command(pod_name,path_to_mdb_script,path_to_pgpass)
+            res = postgres.exec_psql_command(pod_name,mdb_script,pgpass)
 
             if res:
                 _add_mdb_user_metadata(user_metadata, data)
@@ -205,12 +207,12 @@ def delete_db_user(namespace, database):
         data["username"]=f"{namespace}_ferretdb"
         data["mode"]="delete"
 
-        path_to_pgpass = postgres.render_postgres_script(f"{namespace}_ferretdb","pgpass_tpl.properties",data)
-        path_to_mdb_script = postgres.render_postgres_script(f"{namespace}_ferretdb","postgres_manage_user_tpl.sql",data)
+        pgpass = postgres.render_postgres_script(f"{namespace}_ferretdb","pgpass_tpl.properties",data)
+        mdb_script = postgres.render_postgres_script(f"{namespace}_ferretdb","postgres_manage_user_tpl.sql",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.app == 'nuvolaris-postgres')].metadata.name}")
 
         if(pod_name):
-            res = postgres.exec_psql_command(pod_name,path_to_mdb_script,path_to_pgpass)
+            res = postgres.exec_psql_command(pod_name,mdb_script,pgpass)
             return res 
 
         return None
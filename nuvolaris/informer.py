@@ -0,0 +1,295 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# in-memory cache of kubernetes objects kept current by watches
+# an informer lists the objects of a kind once, then applies the watch events
+# lookups are answered from a dictionary and a label index
+# when no informer is running for a kind (or it is not synced yet)
+# the lookup functions return None and callers go to the api server
+import json, logging, threading, time, re
+import nuvolaris.kube_api as kapi
+
+WATCH_TIMEOUT = 300
+
+_informers = {}
+_lock = threading.Lock()
+
+_selector_re = re.compile(r"^\s*(!?)([A-Za-z0-9_./-]+)\s*(?:(==|=|!=)\s*([A-Za-z0-9_.-]*)|\s+(in|notin)\s*\(([^)]*)\))?\s*$")
+
+# split a label selector in its requirements, commas inside sets are preserved
+def _split_selector(selector):
+    res, cur, depth = [], "", 0
+    for c in selector:
+        if c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        if c == "," and depth == 0:
+            res.append(cur)
+            cur = ""
+        else:
+            cur += c
+    if cur.strip():
+        res.append(cur)
+    return res
+
+# parse a label selector in a list of (key, op, values)
+def parse_selector(selector):
+    """
+    >>> parse_selector("app=redis,role!=replica")
+    [('app', '=', ['redis']), ('role', '!=', ['replica'])]
+    >>> parse_selector("tier in (a, b),!canary,name")
+    [('tier', 'in', ['a', 'b']), ('canary', '!', []), ('name', 'exists', [])]
+    """
+    res = []
+    for part in _split_selector(selector or ""):
+        m = _selector_re.match(part)
+        if not m:
+            raise Exception(f"invalid label selector {selector}")
+        neg, key, op, value, setop, values = m.groups()
+        if neg:
+            res.append((key, "!", []))
+        elif op:
+            res.append((key, op == "!=" and "!=" or "=", [value]))
+        elif setop:
+            res.append((key, setop, [v.strip() for v in values.split(",")]))
+        else:
+            res.append((key, "exists", []))
+    return res
+
+def matches(labels, requirements):
+    """
+    >>> matches({"app": "redis"}, parse_selector("app=redis"))
+    True
+    >>> matches({"app": "redis"}, parse_selector("app in (couchdb,kvrocks)"))
+    False
+    >>> matches({}, parse_selector("role!=primary,!canary"))
+    True
+    """
+    labels = labels or {}
+    for key, op, values in requirements:
+        if op == "=" and labels.get(key) != values[0]:
+            return False
+        if op == "!=" and labels.get(key) == values[0]:
+            return False
+        if op == "in" and labels.get(key) not in values:
+            return False
+        if op == "notin" and key in labels and labels[key] in values:
+            return False
+        if op == "exists" and key not in labels:
+            return False
+        if op == "!" and key in labels:
+            return False
+    return True
+
+class Informer:
+    """
+    keeps a local copy of all the objects of a resource in a namespace
+    """
+    def __init__(self, resource, namespace):
+        self.resource = resource
+        self.namespace = resource["namespaced"] and namespace or None
+        self.api_version = resource["group"] and f"{resource['group']}/{resource['version']}" or resource["version"]
+        self.objects = {}
+        self.index = {}
+        self.listeners = []
+        self.version = None
+        self.synced = threading.Event()
+        self.stopped = threading.Event()
+        self.lock = threading.RLock()
+        self.thread = None
+
+    def _key(self, obj):
+        return obj["metadata"]["name"]
+
+    def _unindex(self, name):
+        old = self.objects.pop(name, None)
+        if old:
+            for kv in (old["metadata"].get("labels") or {}).items():
+                self.index.get(kv, set()).discard(name)
+
+    def _store(self, obj):
+        obj = dict({"apiVersion": self.api_version, "kind": self.resource["kind"]}, **obj)
+        name = self._key(obj)
+        self._unindex(name)
+        self.objects[name] = obj
+        for kv in (obj["metadata"].get("labels") or {}).items():
+            self.index.setdefault(kv, set()).add(name)
+
+    def _notify(self, event, obj):
+        for listener in list(self.listeners):
+            try:
+                listener(event, obj)
+            except Exception as e:
+                logging.error(f"informer {self.resource['plural']} listener failed: {e}")
+
+    def add_listener(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def _list(self):
+        path = kapi.path_for(self.resource, self.namespace)
+        lst = kapi.request("GET", path).json()
+        with self.lock:
+            old = set(self.objects.keys())
+            self.objects = {}
+            self.index = {}
+            for item in lst.get("items", []):
+                self._store(item)
+            self.version = lst["metadata"].get("resourceVersion")
+            deleted = old - set(self.objects.keys())
+        for name in deleted:
+            self._notify("DELETED", {"metadata": {"name": name}})
+        for obj in list(self.objects.values()):
+            self._notify("SYNC", obj)
+        self.synced.set()
+
+    def _watch(self):
+        path = kapi.path_for(self.resource, self.namespace)
+        params = {"watch": "1", "allowWatchBookmarks": "true",
+                  "timeoutSeconds": str(WATCH_TIMEOUT), "resourceVersion": self.version}
+        with kapi.request("GET", path, params=params, timeout=WATCH_TIMEOUT + 30, stream=True) as stream:
+            for line in stream.iter_lines():
+                if self.stopped.is_set():
+                    return
+                if not line:
+                    continue
+                event = json.loads(line)
+                tpe, obj = event.get("type"), event.get("object", {})
+                if tpe == "ERROR":
+                    # usually 410 gone, the next round will list again
+                    self.version = None
+                    return
+                self.version = obj.get("metadata", {}).get("resourceVersion", self.version)
+                if tpe == "BOOKMARK":
+                    continue
+                with self.lock:
+                    if tpe == "DELETED":
+                        self._unindex(self._key(obj))
+                    else:
+                        self._store(obj)
+                    stored = tpe == "DELETED" and obj or self.objects[self._key(obj)]
+                self._notify(tpe, stored)
+
+    def run(self):
+        delay = 1
+        while not self.stopped.is_set():
+            try:
+                if not self.version:
+                    self._list()
+                self._watch()
+                delay = 1
+            except Exception as e:
+                logging.warning(f"informer {self.resource['plural']}: {e}")
+                self.version = None
+                self.stopped.wait(delay)
+                delay = min(delay * 2, 30)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"informer-{self.resource['plural']}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    # store an object returned by a write, unless the watch already delivered a newer one
+    def observe(self, obj):
+        with self.lock:
+            old = self.objects.get(self._key(obj))
+            try:
+                if old and int(old["metadata"]["resourceVersion"]) >= int(obj["metadata"]["resourceVersion"]):
+                    return
+            except (KeyError, ValueError):
+                pass
+            self._store(obj)
+
+    def get(self, name):
+        with self.lock:
+            return self.objects.get(name)
+
+    def list(self, selector=None):
+        requirements = parse_selector(selector)
+        with self.lock:
+            equals = [(k, v[0]) for k, op, v in requirements if op == "="]
+            if equals:
+                names = set.intersection(*[self.index.get(kv, set()) for kv in equals])
+                candidates = [self.objects[n] for n in sorted(names)]
+            else:
+                candidates = [self.objects[n] for n in sorted(self.objects.keys())]
+        return [obj for obj in candidates if matches(obj["metadata"].get("labels"), requirements)]
+
+# start the informers for the given resource names (as accepted by kubectl)
+def start(kinds, namespace="nuvolaris", wait=30):
+    started = []
+    for kind in kinds:
+        try:
+            res = kapi.resource_for(kind)
+        except Exception as e:
+            logging.warning(f"cannot start informer for {kind}: {e}")
+            continue
+        key = (res["group"], res["plural"], res["namespaced"] and namespace or None)
+        with _lock:
+            if key in _informers:
+                continue
+            inf = Informer(res, namespace)
+            _informers[key] = inf
+        inf.start()
+        started.append(inf)
+    deadline = time.time() + wait
+    for inf in started:
+        inf.synced.wait(max(0, deadline - time.time()))
+    return started
+
+def stop():
+    with _lock:
+        for inf in _informers.values():
+            inf.stop()
+        _informers.clear()
+
+def _observer(res, obj):
+    ns = obj.get("metadata", {}).get("namespace")
+    inf = _informers.get((res["group"], res["plural"], ns))
+    if inf and inf.synced.is_set():
+        inf.observe(obj)
+
+kapi.observers.append(_observer)
+
+# find the synced informer for a resource name (pod, svc, wsku...) and namespace
+def find(kind, namespace="nuvolaris"):
+    for (group, plural, ns), inf in list(_informers.items()):
+        if ns not in [None, namespace or kapi.default_namespace()]:
+            continue
+        if kapi.matches(inf.resource, kind.lower()) and inf.synced.is_set() and not inf.stopped.is_set():
+            return inf
+    return None
+
+# the cached object or None when not cached
+def get(kind, name, namespace="nuvolaris"):
+    inf = find(kind, namespace)
+    return inf and inf.get(name)
+
+# the cached objects as a kubectl List, or None when there is no informer for the kind
+def list_objects(kind, selector=None, namespace="nuvolaris"):
+    inf = find(kind, namespace)
+    if not inf:
+        return None
+    return {"apiVersion": "v1", "items": inf.list(selector), "kind": "List", "metadata": {"resourceVersion": ""}}
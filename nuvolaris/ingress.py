@@ -15,7 +15,9 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, json, time
+import logging, json, time
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
@@ -39,9 +41,7 @@ def wait_for_ingress_ready(runtime, namespace="ingress-nginx"):
 
     if pod_name:
         logging.info(f"checking for {pod_name}")
-        while not kube.wait(f"pod/{pod_name}", "condition=ready",namespace=namespace):
-            logging.info(f"waiting for {pod_name} to be ready...")
-            time.sleep(1)
+        util.wait_for_ready(f"pod/{pod_name}", namespace=namespace)
     else:
         logging.error("*** could not determine if ingress-nginx pod is up and running")
 
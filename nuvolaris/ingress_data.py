@@ -110,15 +110,11 @@ class IngressData:
         uses the given template to render a final ingress template and returns the path to the template
         """
         logging.info(f"*** Rendering ingress template using host {self._data['hostname']} endpoint for {self._data['ingress_name']} via template {tpl}")  
-        out = f"/tmp/__{namespace}_{tpl}"
-        file = ntp.spool_template(tpl, out, self._data)
-        return os.path.abspath(file)
+        return ntp.spool_temp(tpl, self._data, f"{namespace}_")
 
     def render_traefik_middleware_template(self, namespace,tpl="traefik-middleware-tpl.yaml"):
         """
         uses the given template policy to render a final ingress template. By default renders an addPrefix middleware.
         """  
         logging.info(f"*** Rendering traefik middleware template using host {self._data['hostname']} endpoint for {self._data['ingress_name']} via template {tpl}")
-        out = f"/tmp/__{namespace}_{tpl}"
-        file = ntp.spool_template(tpl, out, self._data)
-        return os.path.abspath(file)                     
\ No newline at end of file
+        return ntp.spool_temp(tpl, self._data, f"{namespace}_")
\ No newline at end of file
@@ -23,7 +23,14 @@ import nuvolaris.util as util
 import nuvolaris.util as util
 import os, os.path
 import logging
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
+
+# the spec subtrees the invoker manifests are rendered from
+SPEC_INPUTS = [
+    "spec.configs.invoker", "spec.configs.limits", "spec.invoker", "spec.couchdb",
+    "spec.nuvolaris.affinity", "spec.nuvolaris.tolerations", "spec.nuvolaris.kafka", "spec.nuvolaris.zookeeper"
+]
 
 def create(owner=None):
     logging.info(f"*** configuring openwhisk invoker")
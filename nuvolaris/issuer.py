@@ -15,13 +15,31 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, json
+import logging, json
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
 import nuvolaris.operator_util as operator_util
 
 def create(owner=None):
+    """
+    >>> kube.mocker.config("apply", "clusterissuer.cert-manager.io/letsencrypt-issuer created")
+    >>> cfg.put("tls.acme-registered-email", "me@example.com"), cfg.put("nuvolaris.kube", "k3s")
+    (True, True)
+    >>> create()
+    'clusterissuer.cert-manager.io/letsencrypt-issuer created'
+    >>> kube.mocker.peek()
+    'apply -f -'
+    >>> issuer = cfg.get("state.issuer.spec")["items"][0]
+    >>> issuer["kind"], issuer["spec"]["acme"]["email"], issuer["spec"]["acme"]["solvers"][0]["http01"]["ingress"]["class"]
+    ('ClusterIssuer', 'me@example.com', 'traefik')
+    >>> kube.mocker.config("delete", "clusterissuer.cert-manager.io/letsencrypt-issuer deleted")
+    >>> delete(), kube.mocker.peek()
+    ('clusterissuer.cert-manager.io/letsencrypt-issuer deleted', 'delete -f -')
+    >>> kube.mocker.reset(); cfg.clean()
+    """
     logging.info(f"*** Configuring cluster issuer")
     # We deploy a cluster-issuer
     runtime = cfg.get('nuvolaris.kube')
@@ -49,25 +67,29 @@ def create(owner=None):
         "runtime": runtime
     }
     
-    kust = kus.patchTemplate("issuer", "cluster-issuer.yaml", data)
-    spec = "deploy/issuer/__cluster-issuer.yaml"
+    kus.patchTemplate("issuer", "cluster-issuer.yaml", data)
+    spec = render()
 
     cfg.put("state.issuer.spec", spec)
-    res = kube.kubectl("apply", "-f", spec,namespace=None)
+    res = kube.apply(spec, namespace=None)
     return res
 
+# the cluster issuer rendered in the workspace by create
+def render():
+    return {"apiVersion": "v1", "kind": "List", "items": [i for i in kus.raw("issuer", "__cluster-issuer.yaml") if i]}
+
+# the rendered issuer is kept in the state also when owned
 def delete_by_owner():
-    spec = "deploy/issuer/__cluster-issuer.yaml"
-    res = kube.kubectl("delete", "-f", spec,namespace=None)
-    logging.info(f"delete minio: {res}")
+    res = delete_by_spec()
+    logging.info(f"delete issuer: {res}")
     return res
 
 def delete_by_spec():
     spec = cfg.get("state.issuer.spec")
     res = False
     if spec:
-        res = kube.kubectl("delete", "-f", spec,namespace=None)
-        return res
+        res = kube.delete(spec, namespace=None)
+    return res
 
 def delete(owner=None):
     if owner:        
@@ -0,0 +1,236 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# this module evaluates kubectl jsonpath expressions locally
+# it implements the subset used with "-o jsonpath-as-json" in the operator:
+# fields (with \. and \/ escapes), [*], [], [n], [a:b], ['key'],
+# filters like [?(@.a.b == 'x')] and existence filters like [?(@.a.b)]
+# missing keys are silently skipped, as kubectl does for jsonpath output
+import re
+
+_cache = {}
+
+# split a jsonpath template in the list of expressions between braces
+def _expressions(template):
+    """
+    >>> _expressions("{.items[*].metadata.name}")
+    ['.items[*].metadata.name']
+    >>> _expressions("{@}")
+    ['@']
+    """
+    res = []
+    depth = 0
+    cur = ""
+    quote = None
+    for c in template:
+        if quote:
+            cur += c
+            if c == quote:
+                quote = None
+            continue
+        if depth > 0 and c in "'\"":
+            quote = c
+            cur += c
+        elif c == "{":
+            if depth > 0:
+                cur += c
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                res.append(cur.strip())
+                cur = ""
+            else:
+                cur += c
+        elif depth > 0:
+            cur += c
+    if depth != 0:
+        raise Exception(f"unclosed action in jsonpath {template}")
+    return res
+
+# parse a literal used on the right side of a filter
+def _literal(text):
+    """
+    >>> _literal("'auto'"), _literal('10'), _literal('true'), _literal('1.5')
+    ('auto', 10, True, 1.5)
+    """
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1]
+    if text in ["true", "false"]:
+        return text == "true"
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        raise Exception(f"unrecognized literal {text} in jsonpath filter")
+
+_filter_re = re.compile(r"^\?\((.*?)\s*(==|!=|<=|>=|<|>)\s*(.*)\)$")
+
+# parse a single expression in a list of steps
+def parse(expr):
+    r"""
+    >>> parse(".items[?(@.metadata.labels.name == 'redis')].metadata.name")
+    [('field', 'items'), ('filter', [('field', 'metadata'), ('field', 'labels'), ('field', 'name')], '==', 'redis'), ('field', 'metadata'), ('field', 'name')]
+    >>> parse(r".metadata.annotations.whisks\.nuvolaris\.org\/annotate-version")
+    [('field', 'metadata'), ('field', 'annotations'), ('field', 'whisks.nuvolaris.org/annotate-version')]
+    >>> parse(".items[].spec.ports[0]")
+    [('field', 'items'), ('all',), ('field', 'spec'), ('field', 'ports'), ('index', 0)]
+    """
+    if expr in _cache:
+        return _cache[expr]
+    steps = []
+    i = 0
+    if expr.startswith("$") or expr.startswith("@"):
+        i = 1
+    while i < len(expr):
+        c = expr[i]
+        if c == ".":
+            if expr[i+1:i+2] == ".":
+                raise Exception(f"recursive descent is not supported in jsonpath {expr}")
+            i += 1
+            name = ""
+            while i < len(expr) and expr[i] not in ".[":
+                if expr[i] == "\\" and i+1 < len(expr):
+                    i += 1
+                name += expr[i]
+                i += 1
+            if name:
+                steps.append(("field", name))
+        elif c == "[":
+            depth = 1
+            j = i + 1
+            quote = None
+            while j < len(expr) and depth > 0:
+                if quote:
+                    if expr[j] == quote:
+                        quote = None
+                elif expr[j] in "'\"":
+                    quote = expr[j]
+                elif expr[j] == "[":
+                    depth += 1
+                elif expr[j] == "]":
+                    depth -= 1
+                j += 1
+            if depth > 0:
+                raise Exception(f"unterminated array in jsonpath {expr}")
+            steps.append(_parse_bracket(expr[i+1:j-1].strip(), expr))
+            i = j
+        else:
+            raise Exception(f"unrecognized character '{c}' in jsonpath {expr}")
+    _cache[expr] = steps
+    return steps
+
+def _parse_bracket(inner, expr):
+    if inner in ["", "*", ":"]:
+        return ("all",)
+    if inner.startswith("?"):
+        m = _filter_re.match(inner)
+        if m:
+            return ("filter", parse(m.group(1).strip()), m.group(2), _literal(m.group(3)))
+        if inner.startswith("?(") and inner.endswith(")"):
+            return ("exists", parse(inner[2:-1].strip()))
+        raise Exception(f"unrecognized filter {inner} in jsonpath {expr}")
+    if inner[0] in "'\"":
+        return ("field", _literal(inner))
+    if ":" in inner:
+        parts = [p.strip() for p in inner.split(":")]
+        bounds = [int(p) if p else None for p in parts]
+        return ("slice", slice(*bounds))
+    try:
+        return ("index", int(inner))
+    except ValueError:
+        raise Exception(f"unrecognized array index {inner} in jsonpath {expr}")
+
+def _compare(left, op, right):
+    try:
+        if op == "==": return left == right
+        if op == "!=": return left != right
+        if op == "<": return left < right
+        if op == ">": return left > right
+        if op == "<=": return left <= right
+        if op == ">=": return left >= right
+    except TypeError:
+        return False
+    return False
+
+def _step(nodes, step):
+    res = []
+    kind = step[0]
+    for node in nodes:
+        if kind == "field":
+            if isinstance(node, dict) and step[1] in node:
+                res.append(node[step[1]])
+        elif kind == "all":
+            if isinstance(node, list):
+                res.extend(node)
+            elif isinstance(node, dict):
+                res.extend(node.values())
+        elif kind == "index":
+            if isinstance(node, list) and -len(node) <= step[1] < len(node):
+                res.append(node[step[1]])
+        elif kind == "slice":
+            if isinstance(node, list):
+                res.extend(node[step[1]])
+        elif kind == "exists":
+            if isinstance(node, list):
+                res.extend([x for x in node if len(_eval([x], step[1])) > 0])
+        elif kind == "filter":
+            if isinstance(node, list):
+                for x in node:
+                    lefts = _eval([x], step[1])
+                    if len(lefts) == 1 and _compare(lefts[0], step[2], step[3]):
+                        res.append(x)
+    return res
+
+def _eval(nodes, steps):
+    for step in steps:
+        nodes = _step(nodes, step)
+        if not nodes:
+            break
+    return nodes
+
+# evaluate a jsonpath template against an object
+# returns the list of matches, the same list kubectl prints with jsonpath-as-json
+def evaluate(obj, template):
+    r"""
+    >>> pods = {"items": [
+    ...   {"metadata": {"name": "redis-0", "labels": {"name": "redis"}}},
+    ...   {"metadata": {"name": "couchdb-0", "labels": {"name": "couchdb"},
+    ...                 "annotations": {"whisks.nuvolaris.org/annotate-version": "true"}}}]}
+    >>> evaluate(pods, "{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
+    ['redis-0']
+    >>> evaluate(pods, "{.items[*].metadata.name}")
+    ['redis-0', 'couchdb-0']
+    >>> evaluate(pods, r"{.items[?(@.metadata.annotations.whisks\.nuvolaris\.org\/annotate-version)].metadata.name}")
+    ['couchdb-0']
+    >>> evaluate(pods, "{.items[?(@.metadata.labels.name != 'redis')].metadata.name}")
+    ['couchdb-0']
+    >>> evaluate(pods, "{.items[0].metadata.missing}")
+    []
+    >>> evaluate({"spec": {"replicas": 1}}, "{.spec.replicas}")
+    [1]
+    >>> evaluate({"a": 1}, "{@}")
+    [{'a': 1}]
+    """
+    res = []
+    for expr in _expressions(template):
+        res.extend(_eval([obj], parse(expr)))
+    return res
@@ -15,7 +15,9 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, json
+import logging, json
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
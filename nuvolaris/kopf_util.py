@@ -47,13 +47,43 @@ def endpoint(response: dict, item: dict):
         if cfg.get('components.static'):
             response["static"]="update"            
 
-def openwhisk(response: dict, item: dict):
-    """
-    Forces an update of Openwhisk if a change in the global spec.config has been detected.
-    This will force the redeploy of the Openwhisk controller/invoker where supported
-    """
-    if item['path'].find('spec.configs') >= 0:
-        response["openwhisk"]="update" 
+def check_inputs(response: dict, item: dict, cmp_key, inputs):
+    """
+    Marks for update the component identified by cmp_key if the changed path is one of the spec subtrees
+    its manifests are rendered from (or contains one), unless it is already created or deleted.
+    Returns True if the path is one of the inputs
+    >>> response = {}
+    >>> check_inputs(response, normalize(('change', ('spec','configs','limits','time','limit-max'), 1, 2)), "openwhisk", ["spec.configs.limits"])
+    True
+    >>> check_inputs(response, normalize(('add', ('spec','configs'), None, {})), "invoker", ["spec.configs.invoker"])
+    True
+    >>> check_inputs(response, normalize(('change', ('spec','redis','volume-size'), 1, 2)), "etcd", ["spec.etcd"])
+    False
+    >>> response
+    {'openwhisk': 'update', 'invoker': 'update'}
+    """
+    path = item['path']
+    for spec in inputs:
+        if path == spec or path.startswith(f"{spec}.") or spec.startswith(f"{path}."):
+            if cmp_key not in response:
+                response[cmp_key]="update"
+            return True
+    return False
+
+def check_unmatched_configs(response: dict, item: dict):
+    """
+    Forces an update of the invoker and Openwhisk (the full whisk redeploy) if a change in the global
+    spec.configs is not an input of any updatable component, as its readers are not known
+    >>> response = {}
+    >>> check_unmatched_configs(response, normalize(('change', ('spec','configs','couchdb','resources','cpu-req'), 1, 2)))
+    >>> response
+    {'invoker': 'update', 'openwhisk': 'update'}
+    """
+    if item['path'].startswith('spec.configs'):
+        logging.warning(f"*** {item['path']} changed, but it is not an input of any updatable component: redeploying whisk")
+        for cmp_key in ["invoker", "openwhisk"]:
+            if cmp_key not in response:
+                response[cmp_key]="update"
 
 def check_component(response: dict, item: dict, cmp_spec, cmp_key):
     """
@@ -89,10 +119,10 @@ def check_registry_ingresses(response: dict, item: dict):
         if(item['new']):
             response["registry-ingresses"]="update"
 
-def evaluate_differences(response: dict, differences: list):
+def evaluate_differences(response: dict, differences: list, inputs: dict = {}):
     """
     Iterate over the difference list to find which components the
-    nuvolaris operator need to deploy/undeploy
+    nuvolaris operator need to deploy/undeploy/update
     """
     for d in differences:
         check_component(response, d,"spec.components.couchdb","couchdb")
@@ -109,24 +139,35 @@ def evaluate_differences(response: dict, differences: list):
         check_component(response, d,"spec.components.milvus","milvus")
         check_component(response, d,"spec.components.registry","registry")
         check_component(response, d,"spec.components.seaweedfs","seaweedfs")
-        openwhisk(response, d)           
         endpoint(response, d)
         check_minio_ingresses(response, d)
         check_seaweedfs_ingresses(response, d)
+
+    # updates are evaluated after all the components switched on or off
+    for d in differences:
+        matched = [cmp_key for cmp_key, cmp_inputs in inputs.items() if check_inputs(response, d, cmp_key, cmp_inputs)]
+        if not matched:
+            check_unmatched_configs(response, d)
         
-def detect_component_changes(kopf_diff):
+def detect_component_changes(kopf_diff, inputs: dict = {}):
     """
     Analyze a kopf diff object and attempt to establish which component must be added/removed/updated by the operator.
     Typically a kopf diff object has a structure like ((action, n-tuple of object or field path, old, new),)
     Will return a list of items reporting the specific action to be done on any nuvolaris operator managed component
+    A component is updated when one of its inputs (the spec subtrees its manifests are rendered from) changed
     >>> data = (('change',('spec','components','mongodb'), True, False),('change',('spec','components','tls'), True, False),('change', ('spec','configs','limits','actions','sequence-maxLength'), 10, 20))
-    >>> what_to_do = detect_component_changes(data)
+    >>> inputs = {"openwhisk": ["spec.configs.limits"], "invoker": ["spec.configs.invoker"]}
+    >>> what_to_do = detect_component_changes(data, inputs)
     >>> print(what_to_do['endpoint'])
     update
     >>> print(what_to_do['openwhisk'])    
     update
     >>> print(what_to_do['mongodb'])        
     delete
+    >>> "invoker" in what_to_do
+    False
+    >>> detect_component_changes((('change', ('spec','configs','couchdb','resources','cpu-req'), 1, 2),), inputs)
+    {'invoker': 'update', 'openwhisk': 'update'}
     """
     differences = list()
     for t in kopf_diff:
@@ -134,7 +175,7 @@ def detect_component_changes(kopf_diff):
         differences.append(normalize(t))
 
     response = {}
-    evaluate_differences(response, differences)
+    evaluate_differences(response, differences, inputs)
 
     return response
 
@@ -163,14 +204,12 @@ def detect_wsku_changes(kopf_diff):
     Analyze a kopf diff object and attempt to establish which component must be added/removed/updated by the operator.
     Typically a kopf diff object has a structure like ((action, n-tuple of object or field path, old, new),)
     Will return a list of items reporting the specific action to be done on any nuvolaris operator managed component
-    >>> data = (('change',('spec','components','mongodb'), True, False),('change',('spec','components','tls'), True, False),('change', ('spec','configs','limits','actions','sequence-maxLength'), 10, 20))
-    >>> what_to_do = detect_component_changes(data)
-    >>> print(what_to_do['endpoint'])
+    >>> data = (('change',('spec','password'), 'a', 'b'),('change',('spec','redis','quota'), 10, 20))
+    >>> what_to_do = detect_wsku_changes(data)
+    >>> print(what_to_do['password'])
     update
-    >>> print(what_to_do['openwhisk'])    
+    >>> print(what_to_do['quota'])
     update
-    >>> print(what_to_do['mongodb'])        
-    delete
     """
     differences = list()
     for t in kopf_diff:
@@ -17,8 +17,21 @@
 #
 # this module wraps kubectl
 import nuvolaris.testutil as tu
-import nuvolaris.template as tpl
-import subprocess
+import nuvolaris.lazy as lazy
+tpl = lazy.module("nuvolaris.template")
+import nuvolaris.kube_api as kapi
+import nuvolaris.jsonpath as jp
+import nuvolaris.informer as informer
+import nuvolaris.readiness as readiness
+import copy
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import base64
+import nuvolaris.spawn as spawn
+import nuvolaris.aio as aio
+import os
 import json
 import logging
 import yaml
@@ -31,19 +44,78 @@ returncode = -1
 dry_run = False
 
 mocker = tu.MockKube()
+_snapshot = threading.local()
+_deferred = threading.local()
+_tracked = threading.local()
+
+# how long to wait for deleted objects to be gone
+DELETE_TIMEOUT = os.environ.get("NUVOLARIS_DELETE_TIMEOUT", "300s")
+
+# annotation storing the fingerprint of the applied manifest
+HASH_ANNOTATION = "whisks.nuvolaris.org/applied-hash"
+# annotation storing the fingerprint of the pod template of a workload
+TEMPLATE_ANNOTATION = "whisks.nuvolaris.org/template-hash"
+
+# "api" runs the commands against the api server in process when possible
+# "kubectl" always spawns the kubectl binary
+backend = os.environ.get("NUVOLARIS_KUBE_BACKEND", "api")
+
+def use_backend(name):
+    global backend
+    if name not in ["api", "kubectl"]:
+        raise Exception(f"unknown kube backend {name}")
+    backend = name
+
+# the error of a kubectl command, with its exit code and output
+# (the module globals output, error and returncode are shared by all the threads)
+class KubectlError(Exception):
+    def __init__(self, error, returncode=1, output=""):
+        super().__init__(error)
+        self.error = error
+        self.returncode = returncode
+        self.output = output
+
+# execute a command with the api backend, raises kapi.Unsupported if it cannot
+def _kubectl_api(args, namespace, input, jsonpath, debugresult, timeout, live=None):
+    global returncode, output, error
+    try:
+        res = kapi.kubectl(list(args), namespace=namespace, input=input, raw=jsonpath is not None, timeout=timeout, live=live)
+    except kapi.ApiError as e:
+        returncode = 1
+        output = ""
+        error = str(e)
+        logging.info(f"Error: kube api {list(args)} input='{input}' error='{error}'")
+        raise KubectlError(error)
+    returncode = 0
+    error = ""
+    if jsonpath:
+        parsed = jp.evaluate(res, jsonpath)
+        output = json.dumps(parsed)
+        if debugresult:
+            logging.debug("result: %s", json.dumps(parsed, indent=2))
+        return parsed
+    output = res
+    return output
 
 # execute kubectl commands
 # default namespace is nuvolaris, you can change with keyword arg namespace
 # default output is text
 # if you specify jsonpath it will filter and parse the json output
 # returns exceptions if errors
-def kubectl(*args, namespace="nuvolaris", input=None, jsonpath=None, debugresult=True, timeout=None):
+# the live objects of the applied documents, when known, save a read to the api backend
+def kubectl(*args, namespace="nuvolaris", input=None, jsonpath=None, debugresult=True, timeout=None, live=None):
     # support for mocked requests
     mres = mocker.invoke(*args)
     if mres:
         mocker.save(input)
         return mres
 
+    if backend == "api":
+        try:
+            return _kubectl_api(args, namespace, input, jsonpath, debugresult, timeout, live)
+        except kapi.Unsupported as e:
+            logging.debug(f"kube api: {e}, using kubectl")
+
     cmd = namespace and ["kubectl", "-n", namespace] or ["kubectl"]
     cmd += list(args)
     if jsonpath:
@@ -55,7 +127,7 @@ def kubectl(*args, namespace="nuvolaris", input=None, jsonpath=None, debugresult
         
     # executing
     logging.debug(cmd)
-    res = subprocess.run(cmd, capture_output=True, input=input, timeout=timeout)
+    res = spawn.run(cmd, capture_output=True, input=input, timeout=timeout)
 
     global returncode, output, error
     returncode = res.returncode
@@ -76,7 +148,7 @@ def kubectl(*args, namespace="nuvolaris", input=None, jsonpath=None, debugresult
         else:
             return output
     logging.info(f"Error: kubectl f{cmd} input='{input}' output='{output}' error='{error}'")
-    raise Exception(error)
+    raise KubectlError(error, res.returncode, output)
 
 # create a configmap from keyword arguments
 def configMap(name, **kwargs):
@@ -101,11 +173,56 @@ data: {}
     return yaml.dump(out)
     
 # delete an object
+# in a deleting() block the deletion is not awaited, the objects
+# are collected and the block waits for all of them at the end
 def delete(obj, namespace="nuvolaris"):
     # tested with apply
     if not isinstance(obj, str):
         obj = json.dumps(obj)
-    return kubectl("delete", "-f", "-", namespace=namespace, input=obj)
+    deleted = getattr(_deferred, "objects", None)
+    if deleted is None:
+        return kubectl("delete", "-f", "-", namespace=namespace, input=obj)
+    res = kubectl("delete", "-f", "-", "--wait=false", namespace=namespace, input=obj)
+    deleted.extend((doc, namespace) for doc in _documents(obj))
+    return res
+
+# wait until the objects are gone (their finalizers completed)
+# all the objects are watched at the same time, with the informers when
+# available or with a watching wait; returns the objects still present
+def wait_deleted(objects, timeout=DELETE_TIMEOUT):
+    """
+    >>> wait_deleted([])
+    []
+    """
+    if mocker.enabled or not objects:
+        return []
+    waits = []
+    with ThreadPoolExecutor(max_workers=8, thread_name_prefix="wait-deleted") as pool:
+        for doc, namespace in objects:
+            target = _display(doc)
+            ns = doc.get("metadata", {}).get("namespace") or namespace
+            fut = readiness.when_condition(target, "delete", timeout, ns)
+            if fut is None:
+                fut = pool.submit(wait, target, "delete", timeout, ns)
+            waits.append((target, fut))
+        remaining = [target for target, fut in waits if not fut.result()]
+    if remaining:
+        logging.warning(f"still present after {timeout}: {', '.join(remaining)}")
+    return remaining
+
+# delete without waiting in the block, then wait for all the deleted objects
+@contextmanager
+def deleting(timeout=DELETE_TIMEOUT):
+    if getattr(_deferred, "objects", None) is not None:
+        yield
+        return
+    _deferred.objects = []
+    try:
+        yield
+        objects = _deferred.objects
+    finally:
+        _deferred.objects = None
+    wait_deleted(objects, timeout)
 
 # shortcut
 def ctl(arg, jsonpath='{@}', flatten=False):
@@ -115,11 +232,148 @@ def ctl(arg, jsonpath='{@}', flatten=False):
         return dict(flatdict.FlatterDict(data, delimiter="."))
     return data
 
+# fingerprint of a rendered object, ignoring the fingerprint annotation itself
+def fingerprint(obj):
+    """
+    >>> obj = {"kind": "ConfigMap", "metadata": {"name": "a"}, "data": {"x": "1"}}
+    >>> h = fingerprint(obj); len(h)
+    16
+    >>> obj["metadata"]["annotations"] = {HASH_ANNOTATION: h}
+    >>> fingerprint(obj) == h
+    True
+    >>> obj["data"]["x"] = "2"
+    >>> fingerprint(obj) == h
+    False
+    """
+    clean = copy.deepcopy(obj)
+    meta = clean.get("metadata") or {}
+    annotations = meta.get("annotations") or {}
+    annotations.pop(HASH_ANNOTATION, None)
+    if "annotations" in meta and not annotations:
+        del meta["annotations"]
+    data = json.dumps(clean, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+def _documents(obj):
+    if isinstance(obj, str):
+        return kapi.flatten(list(yaml.safe_load_all(obj)))
+    return kapi.flatten([copy.deepcopy(obj)])
+
+def _display(doc):
+    group = "/" in doc["apiVersion"] and "." + doc["apiVersion"].split("/")[0] or ""
+    return f"{doc['kind'].lower()}{group}/{doc['metadata']['name']}"
+
+# the live objects matching the documents, from the informer cache or with a single get
+def _live_objects(docs, namespace):
+    res = {}
+    missing = []
+    for doc in docs:
+        ns = doc["metadata"].get("namespace") or namespace
+        inf = informer.find(doc["kind"], ns)
+        if inf:
+            res[_display(doc)] = inf.get(doc["metadata"]["name"])
+        else:
+            missing.append(doc)
+    if not missing:
+        return res
+    data = json.dumps({"apiVersion": "v1", "kind": "List", "items": missing})
+    for item in kapi.flatten([json.loads(kubectl("get", "-f", "-", "-o", "json", "--ignore-not-found",
+                                                 namespace=namespace, input=data) or "{}")]):
+        res[_display(item)] = item
+    return res
+
+# true if the live object was applied from the manifest and not changed since
+def up_to_date(doc, current):
+    """
+    >>> doc = {"kind": "ConfigMap", "metadata": {"name": "a", "annotations": {HASH_ANNOTATION: "h1"}}, "data": {"x": "1"}}
+    >>> live = {"kind": "ConfigMap", "metadata": {"name": "a", "uid": "u", "annotations": {HASH_ANNOTATION: "h1"}}, "data": {"x": "1"}}
+    >>> up_to_date(doc, live)
+    True
+    >>> live["data"]["x"] = "edited"
+    >>> up_to_date(doc, live), up_to_date(doc, {}), up_to_date(doc, None)
+    (False, False, False)
+    >>> secret = {"kind": "Secret", "metadata": {"annotations": {HASH_ANNOTATION: "h1"}}, "stringData": {"p": "pwd"}}
+    >>> up_to_date(secret, {"kind": "Secret", "metadata": {"annotations": {HASH_ANNOTATION: "h1"}}, "data": {"p": "cHdk"}})
+    True
+    """
+    annotations = (current or {}).get("metadata", {}).get("annotations") or {}
+    if annotations.get(HASH_ANNOTATION) != doc["metadata"]["annotations"][HASH_ANNOTATION]:
+        return False
+    # the fingerprint tells the manifest did not change, the live object
+    # must still hold all its fields or it drifted and is applied again
+    if doc.get("kind") == "Secret" and doc.get("stringData"):
+        # the api server stores the string data encoded in data
+        doc = copy.deepcopy(doc)
+        encoded = {k: base64.b64encode(str(v).encode("utf-8")).decode("ascii") for k, v in doc.pop("stringData").items()}
+        doc["data"] = dict(doc.get("data") or {}, **encoded)
+    return kapi.contains(current, doc)
+
 # apply an object
-def apply(obj, namespace="nuvolaris"):
-    if not isinstance(obj, str):
-        obj = json.dumps(obj)
-    return kubectl("apply", "-f", "-", namespace=namespace, input=obj)
+# each object is stamped with the fingerprint of its manifest
+# objects whose live fingerprint matches, and still holding all the fields
+# of the manifest, are not sent again, unless force is true
+def apply(obj, namespace="nuvolaris", force=False):
+    if mocker.enabled:
+        if not isinstance(obj, str):
+            obj = json.dumps(obj)
+        return kubectl("apply", "-f", "-", namespace=namespace, input=obj)
+    docs = _documents(obj)
+    for doc in docs:
+        annotations = doc.setdefault("metadata", {}).setdefault("annotations", {})
+        template = (doc.get("spec") or {}).get("template")
+        if isinstance(template, dict):
+            annotations[TEMPLATE_ANNOTATION] = fingerprint(template)
+        annotations[HASH_ANNOTATION] = fingerprint(doc)
+    live = None
+    if not force:
+        try:
+            live = _live_objects(docs, namespace)
+        except Exception as e:
+            logging.debug(f"cannot read the live objects, applying all: {e}")
+    changed, currents, out = [], [], []
+    tracked = getattr(_tracked, "applied", None)
+    for doc in docs:
+        # None when the live object is unknown
+        current = live.get(_display(doc)) or {} if live is not None else None
+        if up_to_date(doc, current):
+            out.append(f"{_display(doc)} unchanged")
+            unchanged = True
+        else:
+            changed.append(doc)
+            currents.append(current)
+            out.append(None)
+            unchanged = False
+        if tracked is not None:
+            tracked.append((doc, not unchanged, current))
+    if not changed:
+        return "\n".join(out) + "\n"
+    data = json.dumps({"apiVersion": "v1", "kind": "List", "items": changed})
+    res = kubectl("apply", "-f", "-", namespace=namespace, input=data, live=currents)
+    lines = res.strip().split("\n")
+    if len(lines) != len(changed):
+        return res + "".join([f"{line}\n" for line in out if line])
+    lines.reverse()
+    return "\n".join([line or lines.pop() for line in out]) + "\n"
+
+# collect the objects applied in the block as (object, changed, previous live object)
+# the previous object is empty when created and None when it could not be read
+@contextmanager
+def tracking():
+    outer = getattr(_tracked, "applied", None)
+    if outer is not None:
+        yield outer
+        return
+    _tracked.applied = []
+    try:
+        yield _tracked.applied
+    finally:
+        _tracked.applied = None
+
+# apply a manifest file with the same fingerprint check of apply
+# the file is left in place, the caller removes it
+def apply_file(path, namespace="nuvolaris", force=False):
+    with open(path) as f:
+        return apply(f.read(), namespace, force)
 
 # apply an expanded template
 def applyTemplate(name, data, namespace="nuvolaris"):
@@ -132,11 +386,71 @@ def deleteTemplate(name, data, namespace="nuvolaris"):
     return kubectl("delete", "-f", "-", namespace=namespace, input=obj)
 
 def get(name, namespace="nuvolaris"):
+    if "/" in name:
+        obj = informer.get(*name.split("/", 1), namespace=namespace)
+        if obj:
+            return copy.deepcopy(obj)
     try:
         return json.loads(kubectl("get", name, "-ojson", namespace=namespace))
     except:
         return None
 
+# select objects with a jsonpath, answering from the informer cache when possible
+# kind can be a resource type (pods) or a single object (cm/config)
+# falls back to kubectl when the kind is not cached or nothing matches in the cache
+def query(kind, jsonpath, selector=None, namespace="nuvolaris"):
+    if "/" in kind:
+        obj = informer.get(*kind.split("/", 1), namespace=namespace)
+        res = obj and jp.evaluate(obj, jsonpath)
+    else:
+        lst = informer.list_objects(kind, selector, namespace)
+        res = lst and jp.evaluate(lst, jsonpath)
+    if res:
+        return res
+    if selector:
+        return kubectl("get", kind, "-l", selector, namespace=namespace, jsonpath=jsonpath)
+    return kubectl("get", kind, namespace=namespace, jsonpath=jsonpath)
+
+# fetch all the objects of a kind as a List, from the informer when cached
+# inside a snapshot block each kind is fetched only once
+def get_list(kind, namespace="nuvolaris"):
+    """
+    >>> mocker.config("get", '{"kind": "List", "items": [{"metadata": {"name": "standard"}}]}')
+    >>> with snapshot():
+    ...     [get_list("storageclass")["items"][0]["metadata"]["name"] for i in range(2)]
+    ['standard', 'standard']
+    >>> [cmd for cmd, _ in mocker.queue]
+    ['get storageclass -o json']
+    >>> mocker.reset()
+    """
+    cache = getattr(_snapshot, "lists", None)
+    key = (kind, namespace)
+    if cache is not None and key in cache:
+        return cache[key]
+    lst = informer.list_objects(kind, None, namespace)
+    if lst is None:
+        lst = json.loads(kubectl("get", kind, "-o", "json", namespace=namespace))
+    if cache is not None:
+        cache[key] = lst
+    return lst
+
+# evaluate many jsonpath expressions against a single fetch of a kind
+def select(kind, jsonpaths, namespace="nuvolaris"):
+    lst = get_list(kind, namespace)
+    return [jp.evaluate(lst, jsonpath) for jsonpath in jsonpaths]
+
+# reuse the fetched lists in the block, for example in a detection pass
+@contextmanager
+def snapshot():
+    if getattr(_snapshot, "lists", None) is not None:
+        yield
+        return
+    _snapshot.lists = {}
+    try:
+        yield
+    finally:
+        _snapshot.lists = None
+
 def get_pods(selector, namespace="nuvolaris"):
     """
     filter the existing pods using the given selector expression. (ex name=mongodb-kubernetes-operator)
@@ -146,7 +460,12 @@ def get_pods(selector, namespace="nuvolaris"):
     except:
         return None            
 
+# wait for a condition, resolved by the informer events when the kind is watched
 def wait(name, condition, timeout="600s", namespace="nuvolaris"):
+    if not mocker.enabled:
+        res = readiness.wait(name, condition, timeout, namespace)
+        if res is not None:
+            return res and f"{name} condition met" or None
     try:
         return kubectl("wait", name, f"--for={condition}", f"--timeout={timeout}",namespace=namespace)
     except:
@@ -179,4 +498,26 @@ def detect_kind():
                           jsonpath='{.metadata.labels.nuvolaris\\.io/kube}')
         return is_kind and "kind" in is_kind
     except:
-        return False
\ No newline at end of file
+        return False
+
+# asyncio versions for the async handlers
+# the calls run in the operator threads limited by the "kube" backend
+async def kubectl_async(*args, **kwargs):
+    """
+    >>> import asyncio
+    >>> mocker.config("get", "pod/redis-0")
+    >>> asyncio.run(kubectl_async("get", "pods", "-o", "name"))
+    'pod/redis-0'
+    >>> mocker.reset()
+    """
+    return await aio.offload(kubectl, *args, backend="kube", **kwargs)
+
+async def apply_async(obj, namespace="nuvolaris", force=False):
+    """
+    >>> import asyncio
+    >>> mocker.config("apply", "configmap/test created")
+    >>> asyncio.run(apply_async({"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "test"}})), mocker.peek()
+    ('configmap/test created', 'apply -f -')
+    >>> mocker.reset()
+    """
+    return await aio.offload(apply, obj, namespace, force, backend="kube")
@@ -0,0 +1,795 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# this module implements the kubectl commands used by nuvolaris.kube
+# talking directly to the api server over a single pooled keep-alive session
+# commands (or flags) it does not understand raise Unsupported
+# so the caller can fall back to the kubectl binary
+import os, os.path, json, logging, threading, time
+from datetime import datetime, timezone
+from urllib.parse import quote
+import yaml
+import nuvolaris.spawn as spawn
+
+FIELD_MANAGER = "nuvolaris-operator"
+# the annotation kubectl apply keeps the last applied configuration in
+LAST_APPLIED = "kubectl.kubernetes.io/last-applied-configuration"
+SERVICE_ACCOUNT = "/var/run/secrets/kubernetes.io/serviceaccount"
+
+_client = None
+_lock = threading.Lock()
+
+# callbacks receiving the objects returned by the api server after a write
+observers = []
+
+# group, version, plural, kind, namespaced, short names
+_builtin = [
+    ("", "v1", "pods", "Pod", True, ["po"]),
+    ("", "v1", "services", "Service", True, ["svc"]),
+    ("", "v1", "configmaps", "ConfigMap", True, ["cm"]),
+    ("", "v1", "secrets", "Secret", True, []),
+    ("", "v1", "serviceaccounts", "ServiceAccount", True, ["sa"]),
+    ("", "v1", "endpoints", "Endpoints", True, ["ep"]),
+    ("", "v1", "persistentvolumeclaims", "PersistentVolumeClaim", True, ["pvc"]),
+    ("", "v1", "persistentvolumes", "PersistentVolume", False, ["pv"]),
+    ("", "v1", "namespaces", "Namespace", False, ["ns"]),
+    ("", "v1", "nodes", "Node", False, ["no"]),
+    ("apps", "v1", "statefulsets", "StatefulSet", True, ["sts"]),
+    ("apps", "v1", "deployments", "Deployment", True, ["deploy"]),
+    ("apps", "v1", "daemonsets", "DaemonSet", True, ["ds"]),
+    ("batch", "v1", "jobs", "Job", True, []),
+    ("batch", "v1", "cronjobs", "CronJob", True, ["cj"]),
+    ("networking.k8s.io", "v1", "ingresses", "Ingress", True, ["ing"]),
+    ("storage.k8s.io", "v1", "storageclasses", "StorageClass", False, ["sc"]),
+    ("policy", "v1", "poddisruptionbudgets", "PodDisruptionBudget", True, ["pdb"]),
+    ("rbac.authorization.k8s.io", "v1", "roles", "Role", True, []),
+    ("rbac.authorization.k8s.io", "v1", "rolebindings", "RoleBinding", True, []),
+    ("rbac.authorization.k8s.io", "v1", "clusterroles", "ClusterRole", False, []),
+    ("rbac.authorization.k8s.io", "v1", "clusterrolebindings", "ClusterRoleBinding", False, []),
+    ("apiextensions.k8s.io", "v1", "customresourcedefinitions", "CustomResourceDefinition", False, ["crd", "crds"]),
+]
+
+def _resource(group, version, plural, kind, namespaced, short=[]):
+    return {"group": group, "version": version, "plural": plural, "kind": kind,
+            "singular": kind.lower(), "namespaced": namespaced, "short": list(short)}
+
+_resources = [_resource(*r) for r in _builtin]
+_discovered = set()
+
+def _observe(res, obj):
+    for observer in observers:
+        try:
+            observer(res, obj)
+        except Exception as e:
+            logging.debug(f"observer failed: {e}")
+
+class Unsupported(Exception):
+    """
+    the command cannot be executed by this backend, use kubectl instead
+    """
+    pass
+
+class ApiError(Exception):
+    """
+    an error returned by the api server, formatted like the kubectl error
+    """
+    def __init__(self, code, reason, message):
+        self.code = code
+        self.reason = reason
+        super().__init__(f"Error from server ({reason}): {message}")
+
+def _load_config():
+    import pykube
+    if os.path.isfile(f"{SERVICE_ACCOUNT}/token"):
+        return pykube.KubeConfig.from_service_account(SERVICE_ACCOUNT)
+    kubeconfig = os.environ.get("KUBECONFIG", "~/.kube/config").split(os.pathsep)[0]
+    return pykube.KubeConfig.from_file(kubeconfig)
+
+# the shared client, created on first use
+# the underlying requests session keeps the tls connections alive
+def client():
+    global _client
+    if _client:
+        return _client
+    with _lock:
+        if not _client:
+            try:
+                import pykube
+                import requests.adapters
+                api = pykube.HTTPClient(_load_config())
+                for prefix, adapter in list(api.session.adapters.items()):
+                    if type(adapter) == requests.adapters.HTTPAdapter:
+                        api.session.mount(prefix, requests.adapters.HTTPAdapter(
+                            pool_connections=4, pool_maxsize=32, max_retries=adapter.max_retries))
+                _client = api
+            except Exception as e:
+                raise Unsupported(f"cannot configure the api client: {e}")
+    return _client
+
+def reset():
+    global _client
+    _client = None
+
+def default_namespace():
+    try:
+        with open(f"{SERVICE_ACCOUNT}/namespace") as f:
+            return f.read().strip()
+    except:
+        pass
+    try:
+        return client().config.namespace or "default"
+    except:
+        return "default"
+
+# the accounting class of a request: the method and the resource (with its subresource)
+def call_class(method, path):
+    """
+    >>> call_class("GET", "/api/v1/namespaces/nuvolaris/pods/redis-0")
+    'api GET pods'
+    >>> call_class("PATCH", "/apis/apps/v1/namespaces/nuvolaris/statefulsets/redis/status")
+    'api PATCH statefulsets/status'
+    >>> call_class("GET", "/api/v1/namespaces"), call_class("GET", "/apis/apps/v1")
+    ('api GET namespaces', 'api GET discovery')
+    """
+    parts = path.split("?")[0].strip("/").split("/")
+    rest = parts[0] == "api" and parts[2:] or parts[3:]
+    if rest[:1] == ["namespaces"] and len(rest) > 2:
+        rest = rest[2:]
+    if not rest:
+        return f"{spawn.API}{method} discovery"
+    return f"{spawn.API}{method} {rest[0]}" + (len(rest) > 2 and f"/{rest[2]}" or "")
+
+# send a request, accounted as a call of the current handler (see nuvolaris.spawn)
+def request(method, path, params=None, body=None, content_type="application/json", timeout=60, stream=False):
+    """
+    >>> import sys; mod = sys.modules[__name__]
+    >>> class Response: status_code, reason, text, content = 404, "NotFound", "", b"{}"
+    >>> class Session:
+    ...     def request(self, *args, **kwargs): return Response()
+    >>> class Client: url, session = "https://kube", Session()
+    >>> saved, mod._client = mod._client, Client()
+    >>> spawn.reset()
+    >>> try: request("GET", "/api/v1/namespaces/nuvolaris/pods/redis-0")
+    ... except ApiError as e: print(e.code)
+    404
+    >>> spawn.report()[spawn.UNATTRIBUTED]["api GET pods"]["error"]
+    1
+    >>> mod._client = saved
+    """
+    import requests
+    api = client()
+    headers = {"Accept": "application/json"}
+    data = None
+    if body is not None:
+        headers["Content-Type"] = content_type
+        data = body if isinstance(body, (str, bytes)) else json.dumps(body)
+    start, res, outcome = time.monotonic(), None, spawn.ERROR
+    try:
+        res = api.session.request(method, api.url.rstrip("/") + path, params=params, data=data,
+                                  headers=headers, timeout=timeout, stream=stream)
+        outcome = res.status_code < 400 and spawn.OK or spawn.ERROR
+    except requests.Timeout:
+        outcome = spawn.TIMEOUT
+        raise
+    finally:
+        output = res is not None and not stream and len(res.content) or 0
+        spawn.record(call_class(method, path), time.monotonic() - start, 0.0, output, outcome)
+    if res.status_code >= 400:
+        reason, message = res.reason, res.text
+        try:
+            status = res.json()
+            reason = status.get("reason") or reason
+            message = status.get("message") or message
+        except:
+            pass
+        raise ApiError(res.status_code, reason, message)
+    return res
+
+# discovery of the api resources, executed once on first lookup miss
+def _discover_group_version(gv, force=False):
+    if gv in _discovered and not force:
+        return
+    path = gv == "v1" and "/api/v1" or f"/apis/{gv}"
+    try:
+        res = request("GET", path).json()
+    except ApiError:
+        return
+    group, version = "/" in gv and gv.split("/", 1) or ("", gv)
+    for r in res.get("resources", []):
+        if "/" in r["name"]:
+            continue
+        known = [x for x in _resources if x["group"] == group and x["plural"] == r["name"]]
+        if known:
+            continue
+        _resources.append(_resource(group, version, r["name"], r["kind"], r["namespaced"], r.get("shortNames", [])))
+    _discovered.add(gv)
+
+def _discover():
+    with _lock:
+        _discover_group_version("v1", True)
+        groups = request("GET", "/apis").json()
+        for g in groups.get("groups", []):
+            _discover_group_version(g["preferredVersion"]["groupVersion"], True)
+
+def matches(name, what):
+    """
+    >>> matches(_resources[2], "cm"), matches(_resources[10], "statefulset.apps"), matches(_resources[0], "svc")
+    (True, True, False)
+    """
+    names = [name["plural"], name["singular"]] + name["short"]
+    if what in names:
+        return True
+    if name["group"]:
+        return what in [f"{n}.{name['group']}" for n in names]
+    return False
+
+# find a resource by one of the names accepted by kubectl (cm, configmap, configmaps.v1...)
+def resource_for(what):
+    what = what.lower()
+    for refresh in [False, True]:
+        if refresh:
+            _discover()
+        for r in _resources:
+            if matches(r, what):
+                return r
+    raise ApiError(404, "NotFound", f"the server doesn't have a resource type \"{what}\"")
+
+# find a resource by apiVersion and kind, as found in the manifests
+def resource_for_kind(api_version, kind):
+    group, version = "/" in api_version and api_version.split("/", 1) or ("", api_version)
+    for refresh in [False, True]:
+        if refresh:
+            with _lock:
+                _discover_group_version(api_version, True)
+        for r in _resources:
+            if r["group"] == group and r["kind"] == kind and (r["version"] == version or refresh):
+                return dict(r, version=version)
+    raise ApiError(404, "NotFound", f"no matches for kind \"{kind}\" in version \"{api_version}\"")
+
+def path_for(res, namespace=None, name=None, subresource=None):
+    """
+    >>> path_for(resource_for("sts"), "nuvolaris", "redis", "scale")
+    '/apis/apps/v1/namespaces/nuvolaris/statefulsets/redis/scale'
+    >>> path_for(resource_for("nodes"), "nuvolaris")
+    '/api/v1/nodes'
+    """
+    path = res["group"] and f"/apis/{res['group']}/{res['version']}" or f"/api/{res['version']}"
+    if res["namespaced"] and namespace:
+        path += f"/namespaces/{namespace}"
+    path += f"/{res['plural']}"
+    if name:
+        path += f"/{quote(name)}"
+    if subresource:
+        path += f"/{subresource}"
+    return path
+
+def display_name(res):
+    """
+    >>> display_name(resource_for("sts")), display_name(resource_for("cm"))
+    ('statefulset.apps', 'configmap')
+    """
+    return res["group"] and f"{res['singular']}.{res['group']}" or res["singular"]
+
+_with_value = ["-l", "--selector", "-o", "--output", "-p", "--patch", "--type", "-f", "--filename",
+               "--for", "--timeout", "--replicas", "--field-selector", "-n", "--namespace", "--subresource"]
+_boolean = ["--overwrite", "--ignore-not-found", "--wait"]
+
+# split a kubectl command line in positional arguments and flags
+def parse_args(args):
+    """
+    >>> parse_args(["get", "pods", "-l", "app=redis", "-ojson"])
+    (['get', 'pods'], {'-l': 'app=redis', '-o': 'json'})
+    >>> parse_args(["wait", "pod/redis-0", "--for=condition=ready", "--timeout=600s"])
+    (['wait', 'pod/redis-0'], {'--for': 'condition=ready', '--timeout': '600s'})
+    """
+    pos, flags = [], {}
+    i = 0
+    while i < len(args):
+        a = str(args[i])
+        if a == "--":
+            raise Unsupported("command passthrough")
+        if a.startswith("--") and "=" in a:
+            k, v = a.split("=", 1)
+            if k not in _with_value and k not in _boolean:
+                raise Unsupported(f"flag {k}")
+            flags[k] = v
+        elif a in _with_value:
+            if i + 1 >= len(args):
+                raise Unsupported(f"flag {a} without value")
+            flags[a] = str(args[i+1])
+            i += 1
+        elif a in _boolean:
+            flags[a] = "true"
+        elif a.startswith("-") and len(a) > 2 and a[:2] in _with_value:
+            flags[a[:2]] = a[2:]
+        elif a.startswith("-"):
+            raise Unsupported(f"flag {a}")
+        else:
+            pos.append(a)
+        i += 1
+    aliases = {"--selector": "-l", "--output": "-o", "--patch": "-p", "--filename": "-f", "--namespace": "-n"}
+    for k, v in aliases.items():
+        if k in flags:
+            flags[v] = flags.pop(k)
+    return pos, flags
+
+# resolve "type/name" or "type name" into a list of (resource, name)
+def _targets(pos):
+    if len(pos) == 0:
+        raise Unsupported("missing resource")
+    if "/" in pos[0]:
+        res = []
+        for p in pos:
+            if not "/" in p:
+                raise Unsupported("mixed resource arguments")
+            t, n = p.split("/", 1)
+            res.append((resource_for(t), n))
+        return res
+    if "," in pos[0] or pos[0] == "all":
+        raise Unsupported("multiple resource types")
+    r = resource_for(pos[0])
+    if len(pos) == 1:
+        return [(r, None)]
+    return [(r, n) for n in pos[1:]]
+
+def parse_timeout(value, default=30):
+    """
+    >>> parse_timeout("600s"), parse_timeout("5m"), parse_timeout("1h"), parse_timeout("10")
+    (600, 300, 3600, 10)
+    """
+    if not value:
+        return default
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+def _load_documents(input, filename):
+    docs = []
+    if filename and filename != "-":
+        files = [filename]
+        if os.path.isdir(filename):
+            files = [os.path.join(filename, f) for f in sorted(os.listdir(filename))
+                     if f.endswith((".yaml", ".yml", ".json"))]
+        for file in files:
+            with open(file) as f:
+                docs += list(yaml.safe_load_all(f))
+    else:
+        if isinstance(input, bytes):
+            input = input.decode("utf-8")
+        docs = list(yaml.safe_load_all(input or ""))
+    return flatten(docs)
+
+# expand List objects in their items, removing empty documents
+def flatten(docs):
+    """
+    >>> [x["kind"] for x in flatten([{"kind": "List", "items": [{"kind": "Pod"}, None]}, {"kind": "Service"}])]
+    ['Pod', 'Service']
+    """
+    res = []
+    for doc in docs:
+        if not doc:
+            continue
+        if doc.get("kind", "").endswith("List") and "items" in doc:
+            res += flatten(doc["items"])
+        else:
+            res.append(doc)
+    return res
+
+def _namespace_of(res, obj, namespace):
+    if not res["namespaced"]:
+        return None
+    return obj.get("metadata", {}).get("namespace") or namespace or default_namespace()
+
+def get_object(res, name, namespace, selector=None, field_selector=None, timeout=60):
+    ns = res["namespaced"] and (namespace or default_namespace()) or None
+    if name:
+        obj = request("GET", path_for(res, ns, name), timeout=timeout).json()
+        return obj
+    params = {}
+    if selector:
+        params["labelSelector"] = selector
+    if field_selector:
+        params["fieldSelector"] = field_selector
+    lst = request("GET", path_for(res, ns), params=params, timeout=timeout).json()
+    api_version = res["group"] and f"{res['group']}/{res['version']}" or res["version"]
+    items = []
+    for item in lst.get("items", []):
+        items.append(dict({"apiVersion": api_version, "kind": res["kind"]}, **item))
+    return {"apiVersion": "v1", "items": items, "kind": "List", "metadata": {"resourceVersion": ""}}
+
+def _get_documents(flags, namespace, input, timeout):
+    items = []
+    for doc in _load_documents(input, flags["-f"]):
+        res = resource_for_kind(doc["apiVersion"], doc["kind"])
+        try:
+            items.append(get_object(res, doc["metadata"]["name"], _namespace_of(res, doc, namespace), timeout=timeout))
+        except ApiError as e:
+            if e.code != 404 or flags.get("--ignore-not-found") != "true":
+                raise
+    return {"apiVersion": "v1", "items": items, "kind": "List", "metadata": {"resourceVersion": ""}}
+
+def _get(pos, flags, namespace, input, raw, timeout):
+    output = flags.get("-o")
+    if "-f" in flags and len(pos) == 1 and (raw or output == "json"):
+        obj = _get_documents(flags, namespace, input, timeout)
+        return raw and obj or json.dumps(obj, indent=4)
+    targets = _targets(pos[1:])
+    if len(targets) > 1:
+        raise Unsupported("multiple objects")
+    res, name = targets[0]
+    output = flags.get("-o")
+    if not raw and output not in ["json", "yaml"]:
+        raise Unsupported(f"output format {output}")
+    obj = get_object(res, name, namespace, flags.get("-l"), flags.get("--field-selector"), timeout)
+    if raw:
+        return obj
+    if output == "yaml":
+        return yaml.safe_dump(obj, default_flow_style=False)
+    return json.dumps(obj, indent=4)
+
+# true if all the fields of the manifest have the same value in the live object
+# the fields added by the server (defaults, status...) are ignored
+def contains(live, manifest):
+    """
+    >>> contains({"spec": {"replicas": 1, "paused": False}, "status": {}}, {"spec": {"replicas": 1}})
+    True
+    >>> contains({"spec": {"ports": [{"port": 80, "protocol": "TCP"}]}}, {"spec": {"ports": [{"port": 80}]}})
+    True
+    >>> contains({"spec": {"replicas": 3}}, {"spec": {"replicas": 1}}), contains({"a": [1, 2]}, {"a": [1]})
+    (False, False)
+    """
+    if isinstance(manifest, dict):
+        return isinstance(live, dict) and all(key in live and contains(live[key], value) for key, value in manifest.items())
+    if isinstance(manifest, list):
+        return isinstance(live, list) and len(live) == len(manifest) and all(contains(l, m) for l, m in zip(live, manifest))
+    return live == manifest
+
+# the three way json merge patch of kubectl apply: the fields of the modified
+# manifest not already in the current object, and a null for the fields of the
+# original (last applied) manifest removed from the modified one
+def merge_patch(original, modified, current):
+    """
+    >>> original = {"data": {"a": "1", "b": "2"}, "spec": {"x": 1}}
+    >>> modified = {"data": {"a": "1", "c": "3"}, "spec": {"x": 1}}
+    >>> current = {"data": {"a": "1", "b": "2", "other": "kept"}, "spec": {"x": 1, "y": 2}}
+    >>> merge_patch(original, modified, current)
+    {'data': {'c': '3', 'b': None}}
+    >>> merge_patch({}, {"spec": {"ports": [{"port": 80}]}}, {"spec": {"ports": [{"port": 80, "protocol": "TCP"}]}})
+    {}
+    """
+    patch = {}
+    original = isinstance(original, dict) and original or {}
+    current = isinstance(current, dict) and current or {}
+    for key, value in modified.items():
+        cur = current.get(key)
+        if isinstance(value, dict) and isinstance(cur, dict):
+            sub = merge_patch(original.get(key), value, cur)
+            if sub:
+                patch[key] = sub
+        elif key not in current or not contains(cur, value):
+            patch[key] = value
+    for key in original:
+        if key not in modified and key in current:
+            patch[key] = None
+    return patch
+
+# the manifest with the annotation of the last applied configuration, as kubectl apply does
+def _with_last_applied(obj):
+    clean = json.loads(json.dumps(obj))
+    annotations = clean.get("metadata", {}).get("annotations") or {}
+    annotations.pop(LAST_APPLIED, None)
+    if "annotations" in clean.get("metadata", {}) and not annotations:
+        del clean["metadata"]["annotations"]
+    modified = json.loads(json.dumps(clean))
+    modified.setdefault("metadata", {}).setdefault("annotations", {})[LAST_APPLIED] = json.dumps(clean, sort_keys=True, separators=(",", ":"))
+    return modified, clean
+
+# apply an object with the semantic of kubectl (client side) apply:
+# created if missing, otherwise patched with the three way merge of the last applied
+# configuration, the given manifest and the live object, so the fields removed from
+# the manifest are removed and the fields set by others are left alone
+# the live object can be given when already known ({} when missing)
+def apply_object(obj, namespace, timeout=60, current=None):
+    """
+    >>> import sys; mod = sys.modules[__name__]; real = mod.request; calls = []
+    >>> class Res:
+    ...     def __init__(self, obj): self.obj = obj
+    ...     def json(self): return self.obj
+    >>> def fake(method, path, params=None, body=None, **kwargs):
+    ...     calls.append((method, body))
+    ...     return Res({"metadata": {"resourceVersion": "2"}})
+    >>> mod.request = fake
+    >>> cm = {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "cm"}, "data": {"a": "1"}}
+    >>> apply_object(cm, "nuvolaris", current={})
+    'configmap/cm created'
+    >>> live = dict(calls[0][1], metadata=dict(calls[0][1]["metadata"], resourceVersion="1"), data={"a": "1", "b": "2"})
+    >>> apply_object(cm, "nuvolaris", current=live), len(calls)
+    ('configmap/cm unchanged', 1)
+    >>> live["metadata"]["annotations"][LAST_APPLIED] = '{"data":{"a":"1","b":"2"}}'
+    >>> apply_object(cm, "nuvolaris", current=live), [method for method, _ in calls]
+    ('configmap/cm configured', ['POST', 'PATCH'])
+    >>> calls[-1][1]["data"]
+    {'b': None}
+    >>> mod.request = real
+    """
+    res = resource_for_kind(obj["apiVersion"], obj["kind"])
+    ns = _namespace_of(res, obj, namespace)
+    name = obj["metadata"]["name"]
+    path = path_for(res, ns, name)
+    params = {"fieldManager": FIELD_MANAGER}
+    modified, clean = _with_last_applied(obj)
+    if current is None:
+        try:
+            current = request("GET", path, timeout=timeout).json()
+        except ApiError as e:
+            if e.code != 404:
+                raise
+            current = {}
+    if not current:
+        try:
+            after = request("POST", path_for(res, ns), params=params, body=modified, timeout=timeout).json()
+            _observe(res, after)
+            return f"{display_name(res)}/{name} created"
+        except ApiError as e:
+            # the given live object was stale
+            if e.code != 409:
+                raise
+            current = request("GET", path, timeout=timeout).json()
+    annotations = current.get("metadata", {}).get("annotations") or {}
+    try:
+        original = json.loads(annotations.get(LAST_APPLIED) or "{}")
+    except ValueError:
+        original = {}
+    patch = merge_patch(original, modified, current)
+    if not patch:
+        return f"{display_name(res)}/{name} unchanged"
+    after = request("PATCH", path, params=params, body=patch, content_type="application/merge-patch+json", timeout=timeout).json()
+    _observe(res, after)
+    if current["metadata"].get("resourceVersion") == after["metadata"].get("resourceVersion"):
+        return f"{display_name(res)}/{name} unchanged"
+    return f"{display_name(res)}/{name} configured"
+
+# the live objects, when given, are in the same order of the documents
+def _apply(pos, flags, namespace, input, timeout, live=None):
+    if len(pos) > 1 or not "-f" in flags:
+        raise Unsupported("apply without -f")
+    docs = _load_documents(input, flags["-f"])
+    if live is None or len(live) != len(docs):
+        live = [None] * len(docs)
+    out = []
+    for obj, current in zip(docs, live):
+        out.append(apply_object(obj, namespace, timeout, current))
+    return "\n".join(out) + "\n"
+
+def delete_object(res, name, namespace, ignore_not_found=False, timeout=60):
+    ns = res["namespaced"] and (namespace or default_namespace()) or None
+    try:
+        request("DELETE", path_for(res, ns, name), body={"propagationPolicy": "Background"}, timeout=timeout)
+    except ApiError as e:
+        if e.code == 404 and ignore_not_found:
+            return None
+        raise
+    return f"{display_name(res)} \"{name}\" deleted"
+
+def _delete(pos, flags, namespace, input, timeout):
+    ignore = flags.get("--ignore-not-found") == "true"
+    out, errors = [], []
+    if "-f" in flags:
+        for obj in _load_documents(input, flags["-f"]):
+            res = resource_for_kind(obj["apiVersion"], obj["kind"])
+            try:
+                msg = delete_object(res, obj["metadata"]["name"], _namespace_of(res, obj, namespace), ignore, timeout)
+                if msg:
+                    out.append(msg)
+            except ApiError as e:
+                errors.append(str(e))
+    elif "-l" in flags:
+        targets = _targets(pos[1:])
+        res, name = targets[0]
+        if name or len(targets) > 1:
+            raise Unsupported("selector with names")
+        lst = get_object(res, None, namespace, flags["-l"], timeout=timeout)
+        for item in lst["items"]:
+            msg = delete_object(res, item["metadata"]["name"], item["metadata"].get("namespace"), True, timeout)
+            if msg:
+                out.append(msg)
+        if not out:
+            return "No resources found\n"
+    else:
+        for res, name in _targets(pos[1:]):
+            if not name:
+                raise Unsupported("delete without names")
+            try:
+                msg = delete_object(res, name, namespace, ignore, timeout)
+                if msg:
+                    out.append(msg)
+            except ApiError as e:
+                errors.append(str(e))
+    if errors:
+        raise ApiError(0, "Errors", "\n".join(out + errors))
+    return "\n".join(out) + "\n"
+
+_patch_types = {
+    "merge": "application/merge-patch+json",
+    "json": "application/json-patch+json",
+    "strategic": "application/strategic-merge-patch+json"
+}
+
+def patch_object(res, name, namespace, body, tpe="merge", subresource=None, timeout=60):
+    ns = res["namespaced"] and (namespace or default_namespace()) or None
+    obj = request("PATCH", path_for(res, ns, name, subresource), body=body,
+                  content_type=_patch_types[tpe], timeout=timeout).json()
+    if not subresource:
+        _observe(res, obj)
+    return obj
+
+def _patch(pos, flags, namespace, timeout):
+    tpe = flags.get("--type", "strategic")
+    if tpe not in _patch_types or not "-p" in flags:
+        raise Unsupported(f"patch type {tpe}")
+    out = []
+    for res, name in _targets(pos[1:]):
+        patch_object(res, name, namespace, flags["-p"], tpe, flags.get("--subresource"), timeout=timeout)
+        out.append(f"{display_name(res)}/{name} patched")
+    return "\n".join(out) + "\n"
+
+def _annotate(pos, flags, namespace, timeout):
+    names = [p for p in pos[1:] if not "=" in p and not p.endswith("-")]
+    values = {}
+    for p in pos[1:]:
+        if "=" in p:
+            k, v = p.split("=", 1)
+            values[k] = v
+        elif p.endswith("-"):
+            values[p[:-1]] = None
+    out = []
+    for res, name in _targets(names):
+        if not name:
+            raise Unsupported("annotate without names")
+        if flags.get("--overwrite") != "true":
+            current = get_object(res, name, namespace, timeout=timeout)["metadata"].get("annotations") or {}
+            for k, v in values.items():
+                if v is not None and k in current and current[k] != v:
+                    raise ApiError(0, "Conflict", f"'{k}' already has a value ({current[k]}), and --overwrite is false")
+        patch_object(res, name, namespace, {"metadata": {"annotations": values}}, timeout=timeout)
+        out.append(f"{display_name(res)}/{name} annotated")
+    return "\n".join(out) + "\n"
+
+def _scale(pos, flags, namespace, timeout):
+    if not "--replicas" in flags:
+        raise Unsupported("scale without replicas")
+    out = []
+    for res, name in _targets(pos[1:]):
+        patch_object(res, name, namespace, {"spec": {"replicas": int(flags["--replicas"])}}, subresource="scale", timeout=timeout)
+        out.append(f"{display_name(res)}/{name} scaled")
+    return "\n".join(out) + "\n"
+
+def _rollout(pos, flags, namespace, timeout):
+    if len(pos) < 3 or pos[1] != "restart":
+        raise Unsupported("rollout subcommand")
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    body = {"spec": {"template": {"metadata": {"annotations": {"kubectl.kubernetes.io/restartedAt": now}}}}}
+    out = []
+    for res, name in _targets(pos[2:]):
+        patch_object(res, name, namespace, body, timeout=timeout)
+        out.append(f"{display_name(res)}/{name} restarted")
+    return "\n".join(out) + "\n"
+
+# check a kubectl wait condition (condition=ready, delete) against an object
+def condition_met(obj, condition):
+    """
+    >>> pod = {"status": {"conditions": [{"type": "Ready", "status": "True"}]}}
+    >>> condition_met(pod, "condition=ready"), condition_met(pod, "condition=Initialized")
+    (True, False)
+    """
+    if condition.startswith("condition="):
+        expected = condition[len("condition="):]
+        value = "True"
+        if "=" in expected:
+            expected, value = expected.split("=", 1)
+        for c in (obj.get("status") or {}).get("conditions") or []:
+            if c.get("type", "").lower() == expected.lower():
+                return c.get("status", "").lower() == value.lower()
+        return False
+    raise Unsupported(f"wait condition {condition}")
+
+def wait_object(res, name, condition, timeout, namespace=None):
+    ns = res["namespaced"] and (namespace or default_namespace()) or None
+    deadline = time.time() + timeout
+    deleting = condition == "delete"
+    try:
+        obj = request("GET", path_for(res, ns, name)).json()
+    except ApiError as e:
+        if e.code == 404 and deleting:
+            return True
+        raise
+    if not deleting and condition_met(obj, condition):
+        return True
+    version = obj["metadata"].get("resourceVersion")
+    while time.time() < deadline:
+        remaining = max(1, int(deadline - time.time()))
+        params = {"watch": "1", "fieldSelector": f"metadata.name={name}",
+                  "timeoutSeconds": str(remaining), "resourceVersion": version}
+        try:
+            stream = request("GET", path_for(res, ns), params=params, timeout=remaining + 10, stream=True)
+        except ApiError as e:
+            if e.code != 410:
+                raise
+            # expired resource version, restart from the current state
+            version = None
+            params.pop("resourceVersion")
+            continue
+        with stream:
+            for line in stream.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "ERROR":
+                    version = None
+                    break
+                obj = event.get("object", {})
+                version = obj.get("metadata", {}).get("resourceVersion", version)
+                if deleting and event.get("type") == "DELETED":
+                    return True
+                if not deleting and condition_met(obj, condition):
+                    return True
+    return False
+
+def _wait(pos, flags, namespace, timeout):
+    condition = flags.get("--for", "")
+    if not (condition.startswith("condition=") or condition == "delete"):
+        raise Unsupported(f"wait condition {condition}")
+    seconds = parse_timeout(flags.get("--timeout"))
+    out = []
+    for res, name in _targets(pos[1:]):
+        if not name:
+            raise Unsupported("wait without names")
+        if not wait_object(res, name, condition, seconds, namespace):
+            raise ApiError(0, "Timeout", f"timed out waiting for the condition on {res['plural']}/{name}")
+        out.append(condition == "delete" and f"{display_name(res)}/{name} deleted" or f"{display_name(res)}/{name} condition met")
+    return "\n".join(out) + "\n"
+
+# execute a kubectl command line
+# returns the same text output of kubectl, or the parsed object when raw is true (get only)
+# the live objects of the applied documents can be given, when already known
+def kubectl(args, namespace="nuvolaris", input=None, raw=False, timeout=None, live=None):
+    pos, flags = parse_args(args)
+    if not pos:
+        raise Unsupported("missing command")
+    namespace = flags.pop("-n", namespace)
+    timeout = timeout or 60
+    cmd = pos[0]
+    if raw and cmd != "get":
+        raise Unsupported(f"jsonpath output for {cmd}")
+    if cmd == "get":
+        return _get(pos, flags, namespace, input, raw, timeout)
+    if cmd == "apply":
+        return _apply(pos, flags, namespace, input, timeout, live)
+    if cmd == "delete":
+        return _delete(pos, flags, namespace, input, timeout)
+    if cmd == "patch":
+        return _patch(pos, flags, namespace, timeout)
+    if cmd == "annotate":
+        return _annotate(pos, flags, namespace, timeout)
+    if cmd == "scale":
+        return _scale(pos, flags, namespace, timeout)
+    if cmd == "rollout":
+        return _rollout(pos, flags, namespace, timeout)
+    if cmd == "wait":
+        return _wait(pos, flags, namespace, timeout)
+    raise Unsupported(f"command {cmd}")
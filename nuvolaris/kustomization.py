@@ -0,0 +1,489 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# in process renderer of kustomizations, compatible with `kustomize build`
+# for the subset generated by nuvolaris.kustomize:
+# resources, images, patches (strategic merge and json 6902),
+# configMapGenerator and secretGenerator with the name hash suffix
+# files are read with a function, so the kustomization can be rendered
+# from a folder or from an in memory workspace
+import base64, copy, hashlib, json, logging, os
+import yaml
+import nuvolaris.informer as informer
+
+# kinds of the kubernetes api groups, their lists are merged by key
+_BUILTIN_GROUPS = ["", "apps", "batch", "policy", "autoscaling", "networking.k8s.io",
+                   "rbac.authorization.k8s.io", "storage.k8s.io", "scheduling.k8s.io"]
+
+_MERGE_KEYS = {
+    "containers": "name", "initContainers": "name", "ephemeralContainers": "name",
+    "volumes": "name", "env": "name", "volumeMounts": "mountPath", "volumeDevices": "devicePath",
+    "imagePullSecrets": "name", "hostAliases": "ip", "topologySpreadConstraints": "topologyKey",
+    "ownerReferences": "uid", "conditions": "type"
+}
+
+# kustomize legacy output order
+_ORDER_FIRST = ["Namespace", "ResourceQuota", "StorageClass", "CustomResourceDefinition",
+                "ServiceAccount", "PodSecurityPolicy", "Role", "ClusterRole", "RoleBinding",
+                "ClusterRoleBinding", "ConfigMap", "Secret", "Endpoints", "Service", "LimitRange",
+                "PriorityClass", "PersistentVolume", "PersistentVolumeClaim", "Deployment",
+                "StatefulSet", "CronJob", "PodDisruptionBudget"]
+_ORDER_LAST = ["MutatingWebhookConfiguration", "ValidatingWebhookConfiguration"]
+
+class KustomizeError(Exception):
+    pass
+
+def _group(obj):
+    api = obj.get("apiVersion", "")
+    return "/" in api and api.split("/")[0] or ""
+
+def _version(obj):
+    return obj.get("apiVersion", "").split("/")[-1]
+
+def _id(obj):
+    meta = obj.get("metadata") or {}
+    return f"{obj.get('kind')}/{meta.get('name')}"
+
+# split a yaml stream in documents, expanding lists
+def load(text):
+    """
+    >>> [o["kind"] for o in load("kind: Pod\\n---\\n# only a comment\\n---\\nkind: List\\nitems:\\n- kind: Service\\n")]
+    ['Pod', 'Service']
+    """
+    res = []
+    for doc in yaml.safe_load_all(text):
+        if not doc:
+            continue
+        if doc.get("kind") == "List" and "items" in doc:
+            res += [item for item in doc["items"] if item]
+        else:
+            res.append(doc)
+    return res
+
+# kustomize suffix of a generated object: a sha256 of its json encoding
+# (as produced by go) mapped to avoid vowels and digits that look like letters
+def hash_suffix(obj):
+    """
+    >>> hash_suffix({"kind": "ConfigMap", "metadata": {"name": "my-java-server-env-vars"},
+    ...              "data": {"JAVA_HOME": "/opt/java/jdk", "JAVA_TOOL_OPTIONS": "-agentlib:hprof"}})
+    '44k658k8gk'
+    """
+    enc = {"kind": obj["kind"], "name": obj["metadata"]["name"], "data": obj.get("data") or {}}
+    if obj["kind"] == "Secret":
+        enc["type"] = obj.get("type", "Opaque")
+    elif obj.get("binaryData"):
+        enc["binaryData"] = obj["binaryData"]
+    data = json.dumps(enc, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    for c, esc in [("<", "\\u003c"), (">", "\\u003e"), ("&", "\\u0026"), ("\u2028", "\\u2028"), ("\u2029", "\\u2029")]:
+        data = data.replace(c, esc)
+    digest = hashlib.sha256(data.encode("utf-8")).hexdigest()[:10]
+    return digest.translate(str.maketrans("013ae", "ghkmt"))
+
+def _literal(literal):
+    """
+    >>> _literal('user="mike"'), _literal("pass=a=b")
+    (('user', 'mike'), ('pass', 'a=b'))
+    """
+    key, value = literal.split("=", 1)
+    if len(value) > 1 and value[0] == value[-1] and value[0] in "'\"":
+        value = value[1:-1]
+    return key.strip(), value
+
+def _file_source(source):
+    if "=" in source:
+        return source.split("=", 1)
+    return os.path.basename(source), source
+
+def _generate(kind, spec, read, options):
+    meta = {"name": spec["name"]}
+    if spec.get("namespace"):
+        meta["namespace"] = spec["namespace"]
+    data = {}
+    for literal in spec.get("literals") or []:
+        key, value = _literal(literal)
+        data[key] = value
+    for source in spec.get("files") or []:
+        key, path = _file_source(source)
+        data[key] = read(path)
+    for env in spec.get("envs") or []:
+        for line in read(env).splitlines():
+            if line.strip() and not line.lstrip().startswith("#"):
+                data.update([_literal(line)])
+    obj = {"apiVersion": "v1", "kind": kind, "metadata": meta}
+    if kind == "Secret":
+        obj["type"] = spec.get("type", "Opaque")
+        obj["data"] = {k: base64.b64encode(v.encode("utf-8")).decode("ascii") for k, v in data.items()}
+    else:
+        obj["data"] = data
+    opts = dict(options or {}, **(spec.get("options") or {}))
+    for key in ["labels", "annotations"]:
+        if opts.get(key):
+            meta[key] = dict(opts[key])
+    if not opts.get("disableNameSuffixHash"):
+        meta["name"] = f"{spec['name']}-{hash_suffix(obj)}"
+    return obj
+
+# update the references to generated configmaps and secrets
+def _rename_refs(node, names):
+    if isinstance(node, list):
+        for item in node:
+            _rename_refs(item, names)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if isinstance(value, dict):
+            if key in ["configMap", "configMapRef", "configMapKeyRef"]:
+                _rename(value, "name", names.get("ConfigMap", {}))
+            elif key in ["secretRef", "secretKeyRef"] or (key == "secret" and "name" in value):
+                _rename(value, "name", names.get("Secret", {}))
+            elif key == "secret":
+                _rename(value, "secretName", names.get("Secret", {}))
+        elif key == "imagePullSecrets" and isinstance(value, list):
+            for ref in value:
+                if isinstance(ref, dict):
+                    _rename(ref, "name", names.get("Secret", {}))
+        _rename_refs(value, names)
+
+def _rename(ref, field, names):
+    if ref.get(field) in names:
+        ref[field] = names[ref[field]]
+
+# split an image reference in name, tag and digest
+def _split_image(image):
+    """
+    >>> _split_image("registry:5000/openwhisk/controller:0.1.0")
+    ('registry:5000/openwhisk/controller', '0.1.0', None)
+    >>> _split_image("busybox@sha256:abc")
+    ('busybox', None, 'sha256:abc')
+    """
+    digest = None
+    if "@" in image:
+        image, digest = image.split("@", 1)
+    tag = None
+    slash = image.rfind("/")
+    colon = image.rfind(":")
+    if colon > slash:
+        image, tag = image[:colon], image[colon + 1:]
+    return image, tag, digest
+
+def _set_image(image, spec):
+    """
+    >>> _set_image("nginx:1.2", {"name": "nginx", "newName": "busybox"})
+    'busybox:1.2'
+    >>> _set_image("ghcr.io/nuvolaris/openwhisk:old", {"name": "ghcr.io/nuvolaris/openwhisk", "newTag": "new"})
+    'ghcr.io/nuvolaris/openwhisk:new'
+    >>> _set_image("redis", {"name": "nginx", "newTag": "new"})
+    'redis'
+    """
+    name, tag, digest = _split_image(image)
+    if name != spec["name"]:
+        return image
+    name = spec.get("newName") or name
+    if spec.get("digest"):
+        return f"{name}@{spec['digest']}"
+    if spec.get("newTag"):
+        tag, digest = spec["newTag"], None
+    res = name
+    if tag:
+        res += f":{tag}"
+    if digest:
+        res += f"@{digest}"
+    return res
+
+def _images(node, images):
+    if isinstance(node, list):
+        for item in node:
+            _images(item, images)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key in ["containers", "initContainers"] and isinstance(value, list):
+            for container in value:
+                if isinstance(container, dict) and isinstance(container.get("image"), str):
+                    for spec in images:
+                        container["image"] = _set_image(container["image"], spec)
+        _images(value, images)
+
+# strategic merge of a patch into an object
+# lists of the builtin kinds are merged by their merge key, other lists are replaced
+def merge(orig, patch, keyed=True, parent=None):
+    """
+    >>> pod = {"spec": {"containers": [{"name": "a", "image": "x", "ports": [{"containerPort": 80}]}], "affinity": {}}}
+    >>> merge(pod, {"spec": {"containers": [{"name": "a", "ports": [{"containerPort": 81}]}, {"name": "b"}], "affinity": None}})
+    {'spec': {'containers': [{'name': 'a', 'image': 'x', 'ports': [{'containerPort': 80}, {'containerPort': 81}]}, {'name': 'b'}]}}
+    >>> merge({"spec": {"members": [1, 2]}}, {"spec": {"members": [3]}}, keyed=False)
+    {'spec': {'members': [3]}}
+    """
+    if not isinstance(orig, dict) or not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    directive = patch.get("$patch")
+    if directive == "replace":
+        return {k: copy.deepcopy(v) for k, v in patch.items() if k != "$patch"}
+    if directive == "delete":
+        return None
+    res = dict(orig)
+    for key, value in patch.items():
+        if key.startswith("$"):
+            continue
+        if value is None:
+            res.pop(key, None)
+        elif isinstance(value, dict) and isinstance(res.get(key), dict):
+            merged = merge(res[key], value, keyed, key)
+            if merged is None:
+                res.pop(key, None)
+            else:
+                res[key] = merged
+        elif isinstance(value, list) and isinstance(res.get(key), list) and keyed and _merge_key(parent, key):
+            res[key] = _merge_list(res[key], value, _merge_key(parent, key), key)
+        else:
+            res[key] = copy.deepcopy(value)
+    return res
+
+def _merge_key(parent, key):
+    if key == "ports":
+        return parent in ["containers", "initContainers"] and "containerPort" or "port"
+    return _MERGE_KEYS.get(key)
+
+def _merge_list(orig, patch, mkey, key):
+    res = list(orig)
+    for item in patch:
+        if not isinstance(item, dict) or mkey not in item:
+            res.append(copy.deepcopy(item))
+            continue
+        pos = [i for i, old in enumerate(res) if isinstance(old, dict) and old.get(mkey) == item[mkey]]
+        if item.get("$patch") == "delete":
+            res = [old for i, old in enumerate(res) if i not in pos]
+        elif pos:
+            res[pos[0]] = merge(res[pos[0]], item, True, key)
+        else:
+            res.append({k: copy.deepcopy(v) for k, v in item.items() if k != "$patch"})
+    return res
+
+def _pointer(path):
+    if path == "":
+        return []
+    if not path.startswith("/"):
+        raise KustomizeError(f"invalid json pointer {path}")
+    return [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+
+def _container(doc, parts, path):
+    node = doc
+    for part in parts:
+        if isinstance(node, list):
+            node = node[int(part)]
+        elif isinstance(node, dict) and part in node:
+            node = node[part]
+        else:
+            raise KustomizeError(f"json patch path {path} not found")
+    return node
+
+def _index(node, part, path, add=False):
+    if part == "-" and add:
+        return len(node)
+    i = int(part)
+    if i < 0 or i > len(node) or (i == len(node) and not add):
+        raise KustomizeError(f"json patch index out of range in {path}")
+    return i
+
+def _remove(doc, path):
+    parts = _pointer(path)
+    parent = _container(doc, parts[:-1], path)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, parts[-1], path))
+    if parts[-1] not in parent:
+        raise KustomizeError(f"json patch path {path} not found")
+    return parent.pop(parts[-1])
+
+def _add(doc, path, value, replace=False):
+    parts = _pointer(path)
+    if not parts:
+        return value
+    parent = _container(doc, parts[:-1], path)
+    if isinstance(parent, list):
+        i = _index(parent, parts[-1], path, add=not replace)
+        if replace:
+            parent[i] = value
+        else:
+            parent.insert(i, value)
+    else:
+        if replace and parts[-1] not in parent:
+            raise KustomizeError(f"json patch replace of missing path {path}")
+        parent[parts[-1]] = value
+    return doc
+
+# apply a json 6902 patch (a list of operations) to an object
+def json_patch(doc, ops):
+    """
+    >>> doc = {"spec": {"resources": {"requests": {"storage": "1Gi"}}, "list": [1, 3]}}
+    >>> json_patch(doc, [{"op": "replace", "path": "/spec/resources/requests/storage", "value": "10Gi"},
+    ...                  {"op": "add", "path": "/spec/list/1", "value": 2}, {"op": "remove", "path": "/spec/list/0"}])
+    {'spec': {'resources': {'requests': {'storage': '10Gi'}}, 'list': [2, 3]}}
+    """
+    doc = copy.deepcopy(doc)
+    for op in ops:
+        kind, path = op.get("op"), op.get("path")
+        if kind == "add":
+            doc = _add(doc, path, copy.deepcopy(op.get("value")))
+        elif kind == "replace":
+            doc = _add(doc, path, copy.deepcopy(op.get("value")), replace=True)
+        elif kind == "remove":
+            _remove(doc, path)
+        elif kind == "move":
+            doc = _add(doc, path, _remove(doc, op["from"]))
+        elif kind == "copy":
+            doc = _add(doc, path, copy.deepcopy(_container(doc, _pointer(op["from"]), op["from"])))
+        elif kind == "test":
+            if _container(doc, _pointer(path), path) != op.get("value"):
+                raise KustomizeError(f"json patch test failed for {path}")
+        else:
+            raise KustomizeError(f"unknown json patch operation {kind}")
+    return doc
+
+def _selects(target, obj):
+    meta = obj.get("metadata") or {}
+    for field, actual in [("kind", obj.get("kind")), ("name", meta.get("name")),
+                          ("group", _group(obj)), ("version", _version(obj))]:
+        if target.get(field) and target[field] != actual:
+            return False
+    if target.get("namespace") and meta.get("namespace") and target["namespace"] != meta["namespace"]:
+        return False
+    for field, values in [("labelSelector", meta.get("labels")), ("annotationSelector", meta.get("annotations"))]:
+        if target.get(field) and not informer.matches(values, informer.parse_selector(target[field])):
+            return False
+    return True
+
+def _target_of(patch):
+    meta = patch.get("metadata") or {}
+    return {"kind": patch.get("kind"), "name": meta.get("name"), "namespace": meta.get("namespace"),
+            "group": _group(patch), "version": _version(patch)}
+
+def _patch(objects, patch, target, what):
+    if isinstance(patch, list):
+        apply = lambda obj: json_patch(obj, patch)
+    else:
+        target = target or _target_of(patch)
+        apply = lambda obj: merge(obj, patch, _group(obj) in _BUILTIN_GROUPS)
+    found = False
+    for i, obj in enumerate(objects):
+        if _selects(target, obj):
+            objects[i] = apply(obj)
+            found = True
+    if not found:
+        raise KustomizeError(f"no resource matches the patch {what}")
+
+def _patches(kust, read):
+    for entry in kust.get("patches") or []:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        text = entry.get("patch") or read(entry["path"])
+        what = entry.get("path", "inline")
+        if entry.get("target"):
+            # a list of json 6902 operations or a strategic merge patch
+            yield yaml.safe_load(text), entry["target"], what
+        else:
+            for doc in yaml.safe_load_all(text):
+                if doc:
+                    yield doc, None, what
+    for entry in kust.get("patchesStrategicMerge") or []:
+        text = "\n" in entry and entry or read(entry)
+        for doc in yaml.safe_load_all(text):
+            if doc:
+                yield doc, None, "patchesStrategicMerge"
+    for entry in kust.get("patchesJson6902") or []:
+        yield yaml.safe_load(entry.get("patch") or read(entry["path"])), entry["target"], "patchesJson6902"
+
+def _order(obj):
+    kind = obj.get("kind")
+    if kind in _ORDER_FIRST:
+        rank = _ORDER_FIRST.index(kind)
+    elif kind in _ORDER_LAST:
+        rank = len(_ORDER_FIRST) + 1 + _ORDER_LAST.index(kind)
+    else:
+        rank = len(_ORDER_FIRST)
+    meta = obj.get("metadata") or {}
+    return (rank, _group(obj), _version(obj), kind or "", meta.get("namespace") or "", meta.get("name") or "")
+
+# render a kustomization (as a dict), read(path) returns the content of a file
+# returns the list of the rendered objects
+def render(kust, read):
+    objects = []
+    for resource in kust.get("resources") or []:
+        if not resource.endswith((".yaml", ".yml", ".json")):
+            logging.debug(f"skipping resource {resource}")
+            continue
+        objects += load(read(resource))
+
+    names = {}
+    options = kust.get("generatorOptions")
+    for field, kind in [("configMapGenerator", "ConfigMap"), ("secretGenerator", "Secret")]:
+        for spec in kust.get(field) or []:
+            obj = _generate(kind, spec, read, options)
+            names.setdefault(kind, {})[spec["name"]] = obj["metadata"]["name"]
+            objects.append(obj)
+
+    seen = set()
+    for obj in objects:
+        key = (_group(obj), _id(obj), (obj.get("metadata") or {}).get("namespace"))
+        if key in seen:
+            raise KustomizeError(f"duplicate resource {_id(obj)}")
+        seen.add(key)
+
+    for patch, target, what in _patches(kust, read):
+        _patch(objects, patch, target, what)
+
+    if kust.get("images"):
+        _images(objects, kust["images"])
+    if names:
+        _rename_refs(objects, names)
+    return sorted(objects, key=_order)
+
+# a reader of the files of a folder
+def folder_reader(dir):
+    def read(path):
+        with open(os.path.join(dir, path)) as f:
+            return f.read()
+    return read
+
+# render the kustomization.yaml of a folder
+def render_dir(dir):
+    read = folder_reader(dir)
+    return render(yaml.safe_load(read("kustomization.yaml")) or {}, read)
+
+class _Dumper(yaml.SafeDumper):
+    pass
+
+# multiline strings are printed as literal blocks, like kustomize does
+def _str(dumper, value):
+    style = "\n" in value and "|" or None
+    return dumper.represent_scalar("tag:yaml.org,2002:str", value, style=style)
+
+_Dumper.add_representer(str, _str)
+
+# the rendered objects as a yaml stream, as printed by kustomize build
+def dump(objects):
+    r"""
+    >>> print(dump([{"kind": "ConfigMap", "data": {"a.json": "{\n  \"a\": 1\n}\n"}}]), end="")
+    data:
+      a.json: |
+        {
+          "a": 1
+        }
+    kind: ConfigMap
+    """
+    return yaml.dump_all(objects, Dumper=_Dumper, default_flow_style=False, sort_keys=True)
@@ -17,10 +17,55 @@
 #
 # this module wraps generation of kustomizations
 
-import os, io, yaml, subprocess
+# the kustomizations and the generated files are written in the workspace
+# of the current thread (see nuvolaris.workspace), the deploy folder is never modified
+# renders are cached by content (see nuvolaris.render_cache)
+import os, io, yaml, threading, logging
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as nku
+import nuvolaris.kustomization as kz
 import nuvolaris.template as ntp
+import nuvolaris.workspace as nws
+import nuvolaris.render_cache as rcache
+
+# the files of the last kustomization rendered for each workspace name and folder, used by build
+_built = {}
+_built_lock = threading.Lock()
+
+# write the kustomization.yaml of a folder under "deploy" in the workspace
+# including the files of the folder (limited to templates_filter if given)
+# and the extra templatized resources
+def _prepare(where, what, templates, data, templates_filter=None):
+    ws = nws.current()
+    kust = "apiVersion: kustomize.config.k8s.io/v1beta1\nkind: Kustomization\n"
+    for s in list(what):
+        kust += s
+    kust += "resources:\n"
+    for file in ws.listdir(where):
+        if file == "kustomization.yaml":
+          continue
+        if file.startswith("_"):
+          continue
+        if templates_filter is None or file in templates_filter:
+          kust += f"- {file}\n"
+    # adding extra templatized resources
+    for template in templates:
+        ws.write(f"{where}/__{template}", ntp.expand_template(template, data))
+        kust += f"- __{template}\n"
+    ws.write(f"{where}/kustomization.yaml", kust)
+    return where
+
+# render the kustomization of a folder of the workspace
+def _render(where, ws=None):
+    ws = ws or nws.current()
+    def render():
+        kust = yaml.safe_load(ws.read(f"{where}/kustomization.yaml")) or {}
+        return kz.render(kust, ws.reader(where))
+    res = rcache.render(ws, where, render)
+    if ws is nws.current():
+        with _built_lock:
+            _built[(ws.name, where)] = ws.snapshot(where)
+    return res
 
 # execute the kustomization of a folder under "deploy"
 # specified with `where`
@@ -45,29 +90,7 @@ def kustomize(where, *what, templates=[], data={}):
     name: test-pod
     name: test-svc
     """
-    # prepare the kustomization
-    dir = f"deploy/{where}"
-    tgt = f"{dir}/kustomization.yaml"
-    with open(tgt, "w") as f:
-        f.write("apiVersion: kustomize.config.k8s.io/v1beta1\nkind: Kustomization\n")
-        for s in list(what):
-            f.write(s)
-        f.write("resources:\n")
-        dirs = os.listdir(f"deploy/{where}")
-        dirs.sort()
-        for file in dirs:
-            if file == "kustomization.yaml":
-              continue
-            if file.startswith("_"):
-              continue
-            f.write(f"- {file}\n")
-        # adding extra temmplatized resources
-        for template in templates:
-            out = f"deploy/{where}/__{template}"
-            file = ntp.spool_template(template, out, data)
-            f.write(f"- __{template}\n")
-    res = subprocess.run(["kustomize", "build", dir], capture_output=True)
-    return res.stdout.decode("utf-8")
+    return kz.dump(_render(_prepare(where, what, templates, data)))
 
 # execute the kustomization of a folder under "deploy"
 # specified with `where` returning the expanded kustomization
@@ -75,9 +98,18 @@ def kustomize(where, *what, templates=[], data={}):
 # this methid will be used to extract the existing kustomization in case
 # the nuvolaris operator needs to delete a component
 def build(where):
-    dir = f"deploy/{where}"
-    res = subprocess.run(["kustomize", "build", dir], capture_output=True)
-    return res.stdout.decode("utf-8")   
+    ws = nws.current()
+    if not ws.exists(f"{where}/kustomization.yaml"):
+        with _built_lock:
+            files = _built.get((ws.name, where))
+        if files is None:
+            res = rcache.last(where, ws.name)
+            if res is None:
+                logging.warning(f"no kustomization rendered for {where}")
+                return ""
+            return kz.dump(res)
+        ws = nws.Workspace(files=files, name=ws.name)
+    return kz.dump(_render(where, ws))
 
 # execute the kustomization of a folder under "deploy"
 # specified with `where`
@@ -103,30 +135,7 @@ def restricted_kustomize(where, *what, templates=[], templates_filter=[],data={}
     name: test-pod
     name: test-svc
     """
-    # prepare the kustomization
-    dir = f"deploy/{where}"
-    tgt = f"{dir}/kustomization.yaml"
-    with open(tgt, "w") as f:
-        f.write("apiVersion: kustomize.config.k8s.io/v1beta1\nkind: Kustomization\n")
-        for s in list(what):
-            f.write(s)
-        f.write("resources:\n")
-        dirs = os.listdir(f"deploy/{where}")
-        dirs.sort()
-        for file in dirs:
-            if file == "kustomization.yaml":
-              continue
-            if file.startswith("_"):
-              continue
-            if file in templates_filter:  
-              f.write(f"- {file}\n")
-        # adding extra templatized resources
-        for template in templates:
-            out = f"deploy/{where}/__{template}"
-            file = ntp.spool_template(template, out, data)
-            f.write(f"- __{template}\n")
-    res = subprocess.run(["kustomize", "build", dir], capture_output=True)
-    return res.stdout.decode("utf-8")    
+    return kz.dump(_render(_prepare(where, what, templates, data, templates_filter)))
 
 # generate image kustomization
 def image(name, newName=None, newTag=None):
@@ -165,8 +174,7 @@ def configMapTemplate(name, where, template, data):
       files:
       - test.json=__test.json
     """
-    out = f"deploy/{where}/__{template}"
-    file = ntp.spool_template(template, out, data)
+    nws.current().write(f"{where}/__{template}", ntp.expand_template(template, data))
     return f"""configMapGenerator:
 - name: {name}
   namespace: nuvolaris
@@ -183,11 +191,11 @@ def patchTemplate(where, template, data):
     >>> print(patchTemplate("test",  "set-attach.yaml", data), end='')
     patches:
     - path: __set-attach.yaml
-    >>> os.path.exists("deploy/test/__set-attach.yaml")
-    True
+    >>> import nuvolaris.workspace as nws
+    >>> nws.current().exists("test/__set-attach.yaml"), os.path.exists("deploy/test/__set-attach.yaml")
+    (True, False)
     """
-    out = f"deploy/{where}/__{template}"
-    file = ntp.spool_template(template, out, data)
+    nws.current().write(f"{where}/__{template}", ntp.expand_template(template, data))
     return f"""patches:
 - path: __{template}
 """
@@ -202,13 +210,13 @@ def patchTemplates(where, templates=[], data={}):
     patches:
     - path: __set-attach.yaml
     - path: __cron-init.yaml
-    >>> os.path.exists("deploy/test/__set-attach.yaml")
-    True
+    >>> import nuvolaris.workspace as nws
+    >>> nws.current().exists("test/__set-attach.yaml"), os.path.exists("deploy/test/__set-attach.yaml")
+    (True, False)
     """
     paths = []
     for template in templates:
-      out = f"deploy/{where}/__{template}"
-      file = ntp.spool_template(template, out, data)
+      nws.current().write(f"{where}/__{template}", ntp.expand_template(template, data))
       paths.append(f"- path: __{template}\n")
 
     patches = ""
@@ -247,9 +255,7 @@ def kustom_list(where, *what, templates=[], data={}):
   >>> print(out)
   ['Pod', 'Service']
   """
-  yml = nku.kustomize(where, *what, templates=templates, data=data)
-  stream = io.StringIO(yml)
-  res = list(yaml.load_all(stream, yaml.Loader))
+  res = _render(_prepare(where, what, templates, data))
   return {"apiVersion": "v1", "kind": "List", "items": res }
 
 
@@ -265,37 +271,42 @@ def restricted_kustom_list(where, *what, templates=[], templates_filter=[], data
   >>> print(out)
   ['Pod', 'Service']
   """
-  yml = nku.restricted_kustomize(where, *what, templates=templates, templates_filter=templates_filter,data=data)
-  stream = io.StringIO(yml)
-  res = list(yaml.load_all(stream, yaml.Loader))
+  res = _render(_prepare(where, what, templates, data, templates_filter))
   return {"apiVersion": "v1", "kind": "List", "items": res }
 
 # load the given yaml file under deploy/{where} folder
 def raw(where, yamlfile):
-  with open(f"deploy/{where}/{yamlfile}", 'r') as f:
-    return list(yaml.load_all(f, yaml.Loader))
+  return list(yaml.load_all(nws.current().read(f"{where}/{yamlfile}"), yaml.Loader))
 
 def processTemplate(where,template,data,out_template=None):
     """
-    merges the given template and write it under the deploy/{where} folder returning a kind list items
+    merges the given template and write it under the deploy/{where} folder of the workspace returning a kind list items
+    >>> import nuvolaris.workspace as nws
+    >>> res = processTemplate("test", "testcm.yaml", {"name": "test-config"})
+    >>> [i["metadata"]["name"] for i in res["items"]], nws.current().exists("test/_testcm.yaml")
+    (['test-config'], True)
     """  
-    out = f"deploy/{where}/_{template}"
+    out = f"{where}/_{template}"
 
     if(out_template):
-      out = f"deploy/{where}/{out_template}"
+      out = f"{where}/{out_template}"
 
-    ntp.spool_template(template, out, data)
-    with open(out, 'r') as f:
-      res = list(yaml.load_all(f, yaml.Loader))
-      return {"apiVersion": "v1", "kind": "List", "items": res }
+    text = ntp.expand_template(template, data)
+    nws.current().write(out, text)
+    res = list(yaml.load_all(text, yaml.Loader))
+    return {"apiVersion": "v1", "kind": "List", "items": res }
 
 def renderTemplate(where,template,data,out_template):
     """
-    merges the given template and write it under the deploy/{where} folder returning the relative generated file path
+    merges the given template and write it under the deploy/{where} folder of the workspace returning the generated file path
+    in the workspace (it is only in memory, read it with nuvolaris.workspace.current().read)
+    >>> import nuvolaris.workspace as nws
+    >>> path = renderTemplate("test", "testcm.yaml", {"name": "test-config"}, "_testcm_generated.yaml")
+    >>> path, "name: test-config" in nws.current().read(path), os.path.exists(f"deploy/{path}")
+    ('test/_testcm_generated.yaml', True, False)
     """  
-    out = f"deploy/{where}/{out_template}"
-    ntp.spool_template(template, out, data)
-    return out
+    nws.current().write(f"{where}/{out_template}", ntp.expand_template(template, data))
+    return f"{where}/{out_template}"
 
 # generate a kustomization for a persistence volume claim using inline patchesJson6902 format
 def patchPersistentVolumeClaim(name, path, value):
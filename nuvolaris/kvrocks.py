@@ -17,7 +17,9 @@
 #
 
 import nuvolaris.kustomize as kus
+import nuvolaris.annotator as annotator
 import nuvolaris.kube as kube
+import nuvolaris.pod_exec as pod_exec
 import nuvolaris.config as cfg
 import nuvolaris.template as ntp
 import nuvolaris.util as util
@@ -25,7 +27,8 @@ import nuvolaris.openwhisk as openwhisk
 import urllib.parse
 import os, os.path
 import logging, json
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 
 from nuvolaris.user_config import UserConfig
 from nuvolaris.user_metadata import UserMetadata
@@ -89,15 +92,16 @@ def restore_nuvolaris_db_user():
     data = util.get_redis_config_data()
     create_nuvolaris_db_user(data)
 
+@annotator.batched
 def create_nuvolaris_db_user(data):
     logging.info(f"authorizing kvrocks for namespace nuvolaris")
     try:        
         data['mode']="create"
-        path_to_script = render_kvrocks_script(data['namespace'],"kvrocks_manage_user_tpl.txt",data)
+        script = render_kvrocks_script(data['namespace'],"kvrocks_manage_user_tpl.txt",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
         if(pod_name):
-            res = exec_kvrocks_command(pod_name,path_to_script)
+            res = exec_kvrocks_command(pod_name,script)
 
             if(res):
                 redis_service =  util.get_service("{.items[?(@.spec.selector.name == 'redis')]}")
@@ -147,16 +151,11 @@ def render_kvrocks_script(namespace,template,data):
     """
     uses the given template to render a redis-cli script to be executed.
     """  
-    out = f"/tmp/__{namespace}_{template}"
-    file = ntp.spool_template(template, out, data)
-    return os.path.abspath(file)
-
-def exec_kvrocks_command(pod_name,path_to_script):
-    logging.info(f"passing script {path_to_script} to pod {pod_name}")
-    res = kube.kubectl("cp",path_to_script,f"{pod_name}:{path_to_script}")
-    res = kube.kubectl("exec","-it",pod_name,"--","/bin/sh","-c",f"cat {path_to_script} | /bin/redis-cli")
-    os.remove(path_to_script)
-    return res
+    return ntp.expand_template(template, data)
+
+def exec_kvrocks_command(pod_name,script):
+    logging.info(f"streaming redis-cli script to pod {pod_name}")
+    return pod_exec.check_output(pod_name, "/bin/redis-cli", script)
 
 def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
     logging.info(f"authorizing new redis namespace {ucfg.get('namespace')}")    
@@ -173,11 +172,11 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
         data['password']=ucfg.get('redis.password')        
         data['mode']="create"
 
-        path_to_script = render_kvrocks_script(ucfg.get('namespace'),"kvrocks_manage_user_tpl.txt",data)
+        script = render_kvrocks_script(ucfg.get('namespace'),"kvrocks_manage_user_tpl.txt",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
         if(pod_name):
-            res = exec_kvrocks_command(pod_name,path_to_script)
+            res = exec_kvrocks_command(pod_name,script)
 
             if res:                
                 _add_kvrocks_user_metadata(ucfg, user_metadata)
@@ -198,11 +197,11 @@ def delete_db_user(namespace):
         data["namespace"]=namespace
         data["mode"]="delete"
 
-        path_to_script = render_kvrocks_script(namespace,"redis_manage_user_tpl.txt",data)
+        script = render_kvrocks_script(namespace,"redis_manage_user_tpl.txt",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
         if(pod_name):
-            res = exec_kvrocks_command(pod_name,path_to_script)
+            res = exec_kvrocks_command(pod_name,script)
             return res
 
         return None
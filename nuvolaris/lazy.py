@@ -0,0 +1,125 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# lazy loading of modules and the import time budget of the entrypoints
+# the same image runs the operator and short lived jobs (the couchdb init,
+# the cron action executor, the quota checker), so each entrypoint should
+# import only what it uses: heavy libraries and component modules
+# not needed by every entrypoint are loaded at their first use
+import os, sys, json, importlib, subprocess, threading
+
+# the entrypoints of the image, with the modules they must not import
+ENTRYPOINTS = {
+    "nuvolaris.couchdb": ["kopf", "pykube", "kubernetes", "minio", "psycopg", "bcrypt"],
+    "nuvolaris.actionexecutor": ["kopf", "pykube", "kubernetes", "minio", "psycopg", "bcrypt", "jinja2"],
+    "nuvolaris.quota_checker": ["kopf", "pykube", "kubernetes", "minio", "bcrypt"],
+    "nuvolaris.main": ["minio", "psycopg", "bcrypt"],
+}
+
+# import time budget of the jobs in milliseconds, the operator has its own
+BUDGET_MS = int(os.environ.get("NUVOLARIS_IMPORT_BUDGET_MS", "600"))
+BUDGETS = {"nuvolaris.main": int(os.environ.get("NUVOLARIS_OPERATOR_IMPORT_BUDGET_MS", "2500"))}
+
+# the lazy loads are serialized, so threads loading modules importing
+# each other cannot see a partially initialized module
+_lock = threading.RLock()
+
+class LazyModule:
+    """
+    a module imported at the first access to one of its attributes
+
+    >>> mod = module("colorsys")
+    >>> mod
+    <lazy module 'colorsys'>
+    >>> mod.rgb_to_hsv(1, 0, 0)
+    (0.0, 1.0, 1)
+    >>> mod
+    <lazy module 'colorsys' (loaded)>
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self._module is None:
+            with _lock:
+                if self._module is None:
+                    self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        loaded = self._module is not None and " (loaded)" or ""
+        return f"<lazy module '{self._name}'{loaded}>"
+
+# a module loaded at its first use, or the module itself if already imported
+def module(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
+
+# the time in milliseconds and the modules imported by a fresh interpreter importing a module
+def import_profile(name):
+    """
+    >>> ms, modules = import_profile("colorsys")
+    >>> "colorsys" in modules, ms > 0
+    (True, True)
+    """
+    code = ("import sys, time, json; start = time.perf_counter(); "
+            f"import {name}; "
+            "print(json.dumps([(time.perf_counter() - start) * 1000, sorted(sys.modules)]))")
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    ms, modules = json.loads(res.stdout.strip().splitlines()[-1])
+    return ms, modules
+
+# the violations of the import budget of the entrypoints
+# the import times are checked only when timed, as they depend on the load of the machine
+def check_budget(entrypoints=ENTRYPOINTS, timed=True, profile=import_profile):
+    """
+    >>> check_budget(timed=False)
+    []
+    >>> check_budget({"nuvolaris.cron": ["kopf"]}, profile=lambda name: (700, ["kopf", "json"]))
+    ['nuvolaris.cron imports kopf', 'nuvolaris.cron imported in 700ms, over the budget of 600ms']
+    >>> check_budget({"nuvolaris.main": ["bcrypt"]}, profile=lambda name: (700, ["kopf"]))
+    []
+    """
+    errors = []
+    for name, forbidden in entrypoints.items():
+        ms, modules = profile(name)
+        loaded = [mod for mod in forbidden if mod in modules]
+        if loaded:
+            errors.append(f"{name} imports {', '.join(loaded)}")
+        budget = BUDGETS.get(name, BUDGET_MS)
+        if timed and ms > budget:
+            errors.append(f"{name} imported in {ms:.0f}ms, over the budget of {budget}ms")
+    return errors
+
+# report the import time of the entrypoints
+def main():
+    for name in ENTRYPOINTS:
+        ms, modules = import_profile(name)
+        print(f"{name}: {ms:.0f}ms, {len(modules)} modules")
+    errors = check_budget()
+    for error in errors:
+        print(f"ERROR: {error}")
+    sys.exit(errors and 1 or 0)
@@ -17,36 +17,55 @@
 #
 import kopf
 import logging
-import json, os, os.path
+import json, os, os.path, functools
 import nuvolaris.config as cfg
 import nuvolaris.kube as kube
-import nuvolaris.redis as redis
-import nuvolaris.couchdb as couchdb
-import nuvolaris.bucket as bucket
-import nuvolaris.openwhisk as openwhisk
-import nuvolaris.cronjob as cron
-import nuvolaris.ferretdb as mongodb
-import nuvolaris.issuer as issuer
-import nuvolaris.endpoint as endpoint
-import nuvolaris.minio_deploy as minio
-import nuvolaris.zookeeper as zookeeper
-import nuvolaris.kafka as kafka
-import nuvolaris.invoker as invoker
-import nuvolaris.patcher as patcher
-import nuvolaris.storage_static as static
-import nuvolaris.operator_util as operator_util
-import nuvolaris.postgres_operator as postgres
-import nuvolaris.runtimes_preloader as preloader
-import nuvolaris.monitoring as monitoring
-import nuvolaris.quota_checker_job as quota
-import nuvolaris.etcd as etcd
-import nuvolaris.milvus_standalone as milvus
-import nuvolaris.registry_deploy as registry
-import nuvolaris.seaweedfs_deploy as seaweedfs
+import nuvolaris.informer as informer
+import nuvolaris.spawn as spawn
+import nuvolaris.aio as aio
+import nuvolaris.depgraph as depgraph
+import nuvolaris.checkpoint as checkpoint
+import nuvolaris.lazy as lazy
+import nuvolaris.bcrypt_util as bu
+
+# the components are loaded by the first handler using them
+redis = lazy.module("nuvolaris.redis")
+couchdb = lazy.module("nuvolaris.couchdb")
+bucket = lazy.module("nuvolaris.bucket")
+openwhisk = lazy.module("nuvolaris.openwhisk")
+cron = lazy.module("nuvolaris.cronjob")
+mongodb = lazy.module("nuvolaris.ferretdb")
+issuer = lazy.module("nuvolaris.issuer")
+endpoint = lazy.module("nuvolaris.endpoint")
+minio = lazy.module("nuvolaris.minio_deploy")
+zookeeper = lazy.module("nuvolaris.zookeeper")
+kafka = lazy.module("nuvolaris.kafka")
+invoker = lazy.module("nuvolaris.invoker")
+patcher = lazy.module("nuvolaris.patcher")
+static = lazy.module("nuvolaris.storage_static")
+operator_util = lazy.module("nuvolaris.operator_util")
+postgres = lazy.module("nuvolaris.postgres_operator")
+preloader = lazy.module("nuvolaris.runtimes_preloader")
+monitoring = lazy.module("nuvolaris.monitoring")
+quota = lazy.module("nuvolaris.quota_checker_job")
+etcd = lazy.module("nuvolaris.etcd")
+milvus = lazy.module("nuvolaris.milvus_standalone")
+registry = lazy.module("nuvolaris.registry_deploy")
+seaweedfs = lazy.module("nuvolaris.seaweedfs_deploy")
 
 @kopf.on.startup()
 def configure(settings: kopf.OperatorSettings, **_):
   settings.watching.server_timeout = 210
+  # local cache answering the lookups and resolving the readiness waits
+  informer.start(["pods", "services", "configmaps", "wsku", "statefulsets", "deployments", "nodes", "storageclasses"])
+  operator_util.watch_detection()
+
+@kopf.on.cleanup()
+def cleanup(**_):
+  informer.stop()
+  bu.shutdown()
+  logging.info(f"spawn totals by handler: {spawn.report_json()}")
+  spawn.dump()
 
 # tested by an integration test
 @kopf.on.login()
@@ -58,8 +77,82 @@ def login(**kwargs):
     logging.debug("login via client")
     return kopf.login_via_client(**kwargs)
 
+# the components deployed by whisk_create and the ones they depend on
+# the components not depending on each other are deployed concurrently
+# a component depends on the ones it reads the config of (the zookeeper and kafka urls),
+# the services it connects to, the issuer of its tls ingresses and the registry pull secret of its pods
+DEPENDENCIES = {
+    "registry": ["issuer"],
+    "cron": ["couchdb", "openwhisk"],
+    "minio": ["issuer"],
+    "seaweedfs": ["issuer"],
+    "static": ["minio", "seaweedfs", "issuer"],
+    "mongodb": ["postgres"],
+    "kafka": ["zookeeper"],
+    "invoker": ["couchdb", "kafka", "zookeeper", "registry"],
+    "openwhisk": ["couchdb", "redis", "kafka", "zookeeper", "invoker", "issuer", "minio", "seaweedfs", "registry"],
+    "quota": ["couchdb", "redis"],
+    "milvus": ["etcd", "minio", "seaweedfs"],
+}
+
+# the components deployed by whisk_create grouped in the order they are deployed
+def deploy_levels(components):
+    """
+    >>> full = ["preloader", "couchdb", "redis", "registry", "issuer", "cron", "minio", "static", "postgres",
+    ...   "mongodb", "zookeeper", "kafka", "invoker", "openwhisk", "monitoring", "quota", "etcd", "milvus"]
+    >>> for level in deploy_levels(full): print(level)
+    ['couchdb', 'etcd', 'issuer', 'monitoring', 'postgres', 'preloader', 'redis', 'zookeeper']
+    ['kafka', 'minio', 'mongodb', 'quota', 'registry']
+    ['invoker', 'milvus', 'static']
+    ['openwhisk']
+    ['cron']
+    >>> deploy_levels(["couchdb", "redis", "quota", "seaweedfs", "static"])
+    [['couchdb', 'redis', 'seaweedfs'], ['quota', 'static']]
+    """
+    return depgraph.levels(components, DEPENDENCIES)
+
+# the keys of the state dict set by the components, when not only their name
+STATE_KEYS = {
+    "issuer": ["issuer", "tls"],
+    "openwhisk": ["openwhisk", "endpoint"],
+}
+
+# create a component recording its state under the given keys
+# when an error message is given the errors are logged and recorded
+# in the state, otherwise they are raised
+def _create(state, keys, create, owner, error=None):
+    try:
+        msg = create(owner)
+        for key in keys:
+            state[key] = "on"
+        logging.info(msg)
+    except:
+        if not error:
+            raise
+        logging.exception(error)
+        for key in keys:
+            state[key] = "error"
+
+# delete a component, waiting for all its objects to be gone
+def _delete(*deletes):
+    with kube.deleting():
+        for delete in deletes:
+            msg = delete()
+            logging.info(msg)
+
+# the fingerprint of the configuration the components are checkpointed with
+def _fingerprint(spec):
+    return checkpoint.fingerprint(dict(spec), cfg.get("operator.image"), cfg.get("operator.tag"))
+
+def _create_openwhisk(owner):
+    msg = openwhisk.create(owner)
+    logging.info(msg)
+    return endpoint.create(owner)
+
 # tested by an integration test
 @kopf.on.create('nuvolaris.org', 'v1', 'whisks')
+@aio.handler("whisk")
+@spawn.accounted("whisk_create")
 def whisk_create(spec, name, **kwargs):
     logging.info(f"*** whisk_create {name}")
 
@@ -93,60 +186,29 @@ def whisk_create(spec, name, **kwargs):
     runtime = cfg.get('nuvolaris.kube')
     logging.info(f"kubernetes engine in use={runtime}")
 
+    tasks = {}
     if cfg.get('components.openwhisk'):
-        try:
-            msg = preloader.create(owner)
-            state['preloader']= "on"
-            logging.info(msg)
-        except:
-            logging.exception("could not create runtime preloader batch")
-            state['preloader']= "error"
+        tasks['preloader'] = lambda: _create(state, ["preloader"], preloader.create, owner, "could not create runtime preloader batch")
     else:
         state['preloader']= "off"   
 
     if cfg.get('components.couchdb'):
-        try:
-            msg = couchdb.create(owner)
-            state['couchdb']= "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create couchdb")
-            state['couchdb']= "error"
+        tasks['couchdb'] = lambda: _create(state, ["couchdb"], couchdb.create, owner, "cannot create couchdb")
     else:
         state['couchdb'] = "off"
 
     if cfg.get('components.redis'):
-        try:
-            msg = redis.create(owner)
-            state['redis'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create redis")
-            state['redis']= "error"
+        tasks['redis'] = lambda: _create(state, ["redis"], redis.create, owner, "cannot create redis")
     else:
         state['redis'] = "off"
 
     if cfg.get('components.registry'):
-        try:
-            msg = registry.create(owner)
-            state['registry'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create registry")
-            state['registry']= "error"
+        tasks['registry'] = lambda: _create(state, ["registry"], registry.create, owner, "cannot create registry")
     else:
         state['registry'] = "off"         
 
     if cfg.get('components.tls') and not runtime in ["kind","openshift"]:
-        try:
-            msg = issuer.create(owner)
-            state['issuer'] = "on"
-            state['tls'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot configure issuer")
-            state['issuer']= "error"
-            state['tls'] = "error"
+        tasks['issuer'] = lambda: _create(state, ["issuer", "tls"], issuer.create, owner, "cannot configure issuer")
     else:
         state['issuer'] = "off"
         state['tls'] = "off"
@@ -154,141 +216,77 @@ def whisk_create(spec, name, **kwargs):
             logging.info("*** cluster issuer will not be deployed with kind runtime")
 
     if cfg.get('components.cron'):
-        try:
-            msg = cron.create(owner)
-            state['cron'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create cron")
-            state['cron']= "error"
+        tasks['cron'] = lambda: _create(state, ["cron"], cron.create, owner, "cannot create cron")
     else:
         state['cron'] = "off" 
 
+    # errors creating storage and databases are not recovered, the handler is retried
     if cfg.get('components.minio'):
-        msg = minio.create(owner)
-        logging.info(msg)
-        state['minio'] = "on"
+        tasks['minio'] = lambda: _create(state, ["minio"], minio.create, owner)
     else:
         state['minio'] = "off"
 
     if cfg.get('components.seaweedfs'):
-        msg = seaweedfs.create(owner)
-        logging.info(msg)
-        state['seaweedfs'] = "on"
+        tasks['seaweedfs'] = lambda: _create(state, ["seaweedfs"], seaweedfs.create, owner)
     else:
         state['seaweedfs'] = "off"         
 
     if cfg.get('components.static'):
-        msg = static.create(owner)
-        logging.info(msg)
-        state['static'] = "on"
+        tasks['static'] = lambda: _create(state, ["static"], static.create, owner)
     else:
         state['static'] = "off"
 
     if cfg.get('components.postgres') or cfg.get('components.mongodb'):
-        msg = postgres.create(owner)
-        logging.info(msg)
-        state['postgres'] = "on"
+        tasks['postgres'] = lambda: _create(state, ["postgres"], postgres.create, owner)
     else:
         state['postgres'] = "off"
 
     if cfg.get('components.mongodb'):
-        msg = mongodb.create(owner)
-        logging.info(msg)
-        state['mongodb'] = "on"
+        tasks['mongodb'] = lambda: _create(state, ["mongodb"], mongodb.create, owner)
     else:
         state['mongodb'] = "off"
     
     if(cfg.get('components.zookeeper')):
-        try:
-            msg = zookeeper.create(owner)
-            state['zookeeper'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create zookeeper")
-            state['zookeeper'] = "error"
+        tasks['zookeeper'] = lambda: _create(state, ["zookeeper"], zookeeper.create, owner, "cannot create zookeeper")
 
     if(cfg.get('components.kafka')):
-        try:
-            msg = kafka.create(owner)
-            state['kafka'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create kafka")
-            state['kafka'] = "error"            
+        tasks['kafka'] = lambda: _create(state, ["kafka"], kafka.create, owner, "cannot create kafka")
 
     if (cfg.get('components.invoker')):
-        try:
-            msg = invoker.create(owner)
-            state['invoker'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create openwhisk invoker")
-            state['invoker']= "error"
+        tasks['invoker'] = lambda: _create(state, ["invoker"], invoker.create, owner, "cannot create openwhisk invoker")
 
     if cfg.get('components.openwhisk'):
-        try:
-            msg = openwhisk.create(owner)
-            state['openwhisk'] = "on"
-            logging.info(msg)
-
-            msg = endpoint.create(owner)
-            state['endpoint'] = "on"
-            logging.info(msg)
-
-        except:
-            logging.exception("cannot create openwhisk")
-            state['openwhisk']= "error"
-            state['endpoint'] = "error"
+        tasks['openwhisk'] = lambda: _create(state, ["openwhisk", "endpoint"], _create_openwhisk, owner, "cannot create openwhisk")
     else:
         state['openwhisk'] = "off"
         state['endpoint'] = "off"
 
     if (cfg.get('components.monitoring')):
-        try:
-            msg = monitoring.create(owner)
-            state['monitoring'] = "on"
-            logging.info(msg)
-
-        except:
-            logging.exception("cannot create monitoring")
-            state['monitoring']= "error"
+        tasks['monitoring'] = lambda: _create(state, ["monitoring"], monitoring.create, owner, "cannot create monitoring")
     else:
         state['monitoring'] = "off"
 
     if cfg.get('components.quota'):
-        try:
-            msg = quota.create(owner)
-            state['quota'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create quotaa checker")
-            state['quota']= "error"
+        tasks['quota'] = lambda: _create(state, ["quota"], quota.create, owner, "cannot create quotaa checker")
     else:
         state['quota'] = "off"
 
     if cfg.get('components.etcd'):
-        try:
-            msg = etcd.create(owner)
-            state['etcd'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create etcd")
-            state['etcd']= "error"
+        tasks['etcd'] = lambda: _create(state, ["etcd"], etcd.create, owner, "cannot create etcd")
     else:
         state['etcd'] = "off" 
 
     if cfg.get('components.milvus'):
-        try:
-            msg = milvus.create(owner)
-            state['milvus'] = "on"
-            logging.info(msg)
-        except:
-            logging.exception("cannot create milvus")
-            state['milvus']= "error"
+        tasks['milvus'] = lambda: _create(state, ["milvus"], milvus.create, owner, "cannot create milvus")
     else:
         state['milvus'] = "off"  
 
+    # the components completed with the same configuration by a previous interrupted pass are skipped
+    checkpoints = checkpoint.Checkpoints(f"wsk/{name}", (owner or {}).get("status"))
+    fp = _fingerprint(spec)
+    tasks = {c: functools.partial(checkpoints.run, c, fp, STATE_KEYS.get(c, [c]), state, task) for c, task in tasks.items()}
+    depgraph.check(depgraph.run(tasks, DEPENDENCIES))
+
     whisk_post_create(name,state)
     state['controller']= "Ready"
     return state
@@ -302,85 +300,70 @@ def whisk_post_create(name, state):
 
 # tested by an integration test
 @kopf.on.delete('nuvolaris.org', 'v1', 'whisks')
+@aio.handler("whisk")
+@spawn.accounted("whisk_delete")
 def whisk_delete(spec, **kwargs):
     runtime = cfg.get('nuvolaris.kube')
     logging.info("whisk_delete")
-   
+
+    tasks = {}
     if cfg.get("components.openwhisk"):
-        msg = preloader.delete()
-        msg = openwhisk.delete()
-        logging.info(msg)
-        msg = endpoint.delete()
-        logging.info(msg)
+        tasks['preloader'] = lambda: _delete(preloader.delete)
+        tasks['openwhisk'] = lambda: _delete(openwhisk.delete, endpoint.delete)
 
     if cfg.get("components.invoker"):       
-        msg = invoker.delete()
-        logging.info(msg)            
+        tasks['invoker'] = lambda: _delete(invoker.delete)
 
     if cfg.get('components.tls') and not runtime == "kind":
-        msg = issuer.delete()
-        logging.info(msg)
+        tasks['issuer'] = lambda: _delete(issuer.delete)
 
     if cfg.get("components.redis"):
-        msg = redis.delete()
-        logging.info(msg)
+        tasks['redis'] = lambda: _delete(redis.delete)
 
     if cfg.get('components.couchdb'):
-        msg = couchdb.delete()
-        logging.info(msg)
+        tasks['couchdb'] = lambda: _delete(couchdb.delete)
         
     if cfg.get("components.mongodb"):
-        msg = mongodb.delete()
-        logging.info(msg)         
+        tasks['mongodb'] = lambda: _delete(mongodb.delete)
 
     if cfg.get("components.cron"):
-        msg = cron.delete()
-        logging.info(msg)
+        tasks['cron'] = lambda: _delete(cron.delete)
 
     if cfg.get('components.static'):
-        msg = static.delete()
-        logging.info(msg) 
+        tasks['static'] = lambda: _delete(static.delete)
 
     if cfg.get("components.minio"):
-        msg = minio.delete()
-        logging.info(msg)
+        tasks['minio'] = lambda: _delete(minio.delete)
 
     if cfg.get("components.seaweedfs"):
-        msg = seaweedfs.delete()
-        logging.info(msg)        
+        tasks['seaweedfs'] = lambda: _delete(seaweedfs.delete)
 
     if cfg.get('components.postgres'):
-        msg = postgres.delete()
-        logging.info(msg)
+        tasks['postgres'] = lambda: _delete(postgres.delete)
                  
     if cfg.get("components.kafka"):
-        msg = kafka.delete()
-        logging.info(msg)  
+        tasks['kafka'] = lambda: _delete(kafka.delete)
 
     if cfg.get("components.zookeeper"):
-        msg = zookeeper.delete()
-        logging.info(msg)
+        tasks['zookeeper'] = lambda: _delete(zookeeper.delete)
     
     if cfg.get("components.monitoring"):
-        msg = monitoring.delete()
-        logging.info(msg)
+        tasks['monitoring'] = lambda: _delete(monitoring.delete)
 
     if cfg.get("components.quota"):
-        msg = quota.delete()
-        logging.info(msg) 
+        tasks['quota'] = lambda: _delete(quota.delete)
 
     if cfg.get("components.etcd"):
-        msg = etcd.delete()
-        logging.info(msg) 
+        tasks['etcd'] = lambda: _delete(etcd.delete)
 
     if cfg.get("components.milvus"):
-        msg = milvus.delete()
-        logging.info(msg) 
+        tasks['milvus'] = lambda: _delete(milvus.delete)
 
     if cfg.get("components.registry"):
-        msg = registry.delete()
-        logging.info(msg)                                                           
-    
+        tasks['registry'] = lambda: _delete(registry.delete)
+
+    # a component is deleted only when the ones depending on it are gone
+    depgraph.check(depgraph.run(tasks, DEPENDENCIES, reverse=True))
                          
 # tested by integration test
 #@kopf.on.field("service", field='status.loadBalancer')
@@ -398,6 +381,8 @@ def service_update(old, new, name, **kwargs):
     cfg.put("config.apihost", apihost)
 
 @kopf.on.update('nuvolaris.org', 'v1', 'whisks')
+@aio.handler("whisk")
+@spawn.accounted("whisk_update")
 def whisk_update(spec, status, namespace, diff, name, **kwargs):
     logging.info(f"*** detected an update of wsk/{name} under namespace {namespace}")
     
@@ -407,14 +392,20 @@ def whisk_update(spec, status, namespace, diff, name, **kwargs):
     patcher.patch(diff, status, owner, name)
 
 @kopf.on.resume('nuvolaris.org', 'v1', 'whisks')
+@aio.handler("whisk")
+@spawn.accounted("whisk_resume")
 def whisk_resume(spec, status, name, **kwargs):   
     operator_util.config_from_spec(spec, handler_type="on_resume")
+    # the config values put by the components deployed before the restart
+    checkpoint.Checkpoints(f"wsk/{name}", status).restore(_fingerprint(spec))
     operator_util.whisk_post_resume(name)
 
 def runtimes_filter(name, type, **kwargs):
     return name == 'openwhisk-runtimes' and type == 'MODIFIED'  
 
 @kopf.on.event("configmap", when=runtimes_filter)
+@aio.handler("runtimes")
+@spawn.accounted("runtimes_cm_event_watcher")
 def runtimes_cm_event_watcher(event, **kwargs):    
     logging.info("*** detected a change in cm/openwhisk-runtimes config map, restarting openwhisk related PODs")
     owner = kube.get(f"wsk/controller") 
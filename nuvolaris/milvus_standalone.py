@@ -17,8 +17,11 @@
 #
 import time
 
-import kopf, logging
+import logging
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
+import nuvolaris.annotator as annotator
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
 import nuvolaris.util as util
@@ -219,6 +222,7 @@ def create_default_milvus_database(data):
     return False
 
 
+@annotator.batched
 def _annotate_nuv_milvus_metadata(data):
     """
     annotate nuvolaris configmap with entries for MILVUS connectivity MILVUS_HOST, MILVUS_PORT, MILVUS_TOKEN, MILVUS_DB_NAME
@@ -15,8 +15,11 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, time, os
+import logging, time, os
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
+import nuvolaris.annotator as annotator
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
 import nuvolaris.util as util
@@ -92,6 +95,7 @@ def create(owner=None):
     logging.info("*** configured minio standalone")
     return res
 
+@annotator.batched
 def _annotate_nuv_metadata(data):
     """
     annotate nuvolaris configmap with entries for minio connectivity S3_ENDPOINT, S3_PORT, S3_ACCESS_KEY, S3_SECRET_KEY
@@ -169,8 +173,38 @@ def assign_bucket_quota(bucket_name, quota, minioClient:MinioClient):
         logging.warn(f"*** skipping quota set on bucket {bucket_name}. Requested quota values is {quota}")
 
 
-def create_ow_storage(state, ucfg: UserConfig, user_metadata: UserMetadata, owner=None):
-    minioClient = mutil.MinioClient()    
+# the buckets of a user, as (bucket name, public)
+def _user_buckets(ucfg: UserConfig):
+    buckets = []
+    if(ucfg.get('object-storage.data.enabled')):
+        buckets.append((ucfg.get('object-storage.data.bucket'), False))
+    if(ucfg.get('object-storage.route.enabled')):
+        buckets.append((ucfg.get("object-storage.route.bucket"), True))
+    return buckets
+
+def create_ow_storages(entries):
+    """
+    Bulk version of create_ow_storage, entries are (state, ucfg, user_metadata) of many users.
+    The minio alias is configured once and all the buckets are made with one mc call,
+    then the users and their policies are configured as in create_ow_storage
+    """
+    if not entries:
+        return
+    minioClient = mutil.MinioClient()
+    buckets = [name for _, ucfg, _ in entries for name, _ in _user_buckets(ucfg)]
+    logging.info(f"*** adding {len(buckets)} buckets for {len(entries)} namespaces")
+    made = dict.fromkeys(buckets, minioClient.make_buckets(buckets))
+
+    for state, ucfg, user_metadata in entries:
+        try:
+            create_ow_storage(state, ucfg, user_metadata, None, minioClient, made)
+        except Exception as e:
+            logging.error(f"failed to configure storage for namespace {ucfg.get('namespace')}: {e}")
+
+# create the storage of a user, the buckets already made (as in create_ow_storages)
+# are not made again unless their creation failed
+def create_ow_storage(state, ucfg: UserConfig, user_metadata: UserMetadata, owner=None, minioClient=None, made={}):
+    minioClient = minioClient or mutil.MinioClient()
     namespace = ucfg.get("namespace")
     secretkey = ucfg.get("object-storage.password")
 
@@ -187,7 +221,7 @@ def create_ow_storage(state, ucfg: UserConfig, user_metadata: UserMetadata, owne
     if(ucfg.get('object-storage.data.enabled')):
         bucket_name = ucfg.get('object-storage.data.bucket')
         logging.info(f"*** adding private bucket {bucket_name} for {namespace}")
-        res = minioClient.make_bucket(bucket_name)               
+        res = made.get(bucket_name) or minioClient.make_bucket(bucket_name)
         bucket_policy_names.append(f"{bucket_name}/*")
         state['storage_data']=res
 
@@ -201,7 +235,7 @@ def create_ow_storage(state, ucfg: UserConfig, user_metadata: UserMetadata, owne
     if(ucfg.get('object-storage.route.enabled')):
         bucket_name = ucfg.get("object-storage.route.bucket")
         logging.info(f"*** adding public bucket {bucket_name} for {namespace}")
-        res = minioClient.make_public_bucket(bucket_name) 
+        res = made.get(bucket_name) and minioClient.make_bucket_public(bucket_name) or minioClient.make_public_bucket(bucket_name)
         bucket_policy_names.append(f"{bucket_name}/*")
 
         if(res):
@@ -15,7 +15,9 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, time, os
+import logging, time, os
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
@@ -46,7 +48,7 @@ def deploy_minio_route(apihost,namespace,type,service_name,port,context_path):
 
     logging.info(f"*** configuring minio route for service {service_name}:{port}")
     path_to_template_yaml = route.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)        
     return res
 
@@ -70,12 +72,12 @@ def deploy_minio_ingress(apihost, namespace, type, service_name,port,context_pat
     if ingress.requires_traefik_middleware():
         logging.info(f"*** configuring traefik middleware for {type} ingress")
         path_to_template_yaml = ingress.render_traefik_middleware_template(namespace)
-        res = kube.kubectl("apply", "-f",path_to_template_yaml)
+        res = kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)
 
     logging.info(f"*** configuring static ingress for {type}")
     path_to_template_yaml = ingress.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     return res 
@@ -91,7 +93,7 @@ def deploy_minio_upload_route(apihost,namespace, type):
 
     logging.info("*** configuring route for upload")
     path_to_template_yaml = upload.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)        
     return res
 
@@ -109,12 +111,12 @@ def deploy_minio_upload_ingress(apihost, namespace, type):
     if upload.requires_traefik_middleware():
         logging.info(f"*** configuring traefik middleware for {type} ingress")
         path_to_template_yaml = upload.render_traefik_middleware_template(namespace)
-        res = kube.kubectl("apply", "-f",path_to_template_yaml)
+        res = kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)
 
     logging.info(f"*** configuring static ingress for {type} ingress")
     path_to_template_yaml = upload.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     return res
@@ -20,7 +20,7 @@
 
 import logging
 import json
-import subprocess
+import nuvolaris.spawn as spawn
 import nuvolaris.config as cfg
 import nuvolaris.template as ntp
 import nuvolaris.util as util
@@ -47,7 +47,7 @@ class MinioClient:
         # executing
         logging.debug(cmd)
         try:
-            res = subprocess.run(cmd, capture_output=True)
+            res = spawn.run(cmd, capture_output=True)
 
             returncode = res.returncode
             output = res.stdout.decode()
@@ -92,6 +92,15 @@ class MinioClient:
         """
         return util.check(self.mc("mb",f"{self.alias}/{bucket_name}"),"make_bucket",True)
 
+    def make_buckets(self, bucket_names):
+        """
+        adds many buckets with one call, the existing ones are ignored
+        """
+        if not bucket_names:
+            return True
+        targets = [f"{self.alias}/{bucket_name}" for bucket_name in bucket_names]
+        return util.check(self.mc("mb","--ignore-existing",*targets),"make_buckets",True)
+
     def force_bucket_remove(self, bucket_name):
         """
         removes unconditionally a bucket
@@ -103,7 +112,13 @@ class MinioClient:
         adds a new public bucket to the configured minio instance 
         """
         res = util.check(self.make_bucket(bucket_name),"make_bucket",True)
-        return util.check(self.mc("anonymous","-r","set","download",f"{self.alias}/{bucket_name}"),"make_public_bucket",res)
+        return util.check(self.make_bucket_public(bucket_name),"make_public_bucket",res)
+
+    def make_bucket_public(self, bucket_name):
+        """
+        allows the anonymous download from an existing bucket
+        """
+        return self.mc("anonymous","-r","set","download",f"{self.alias}/{bucket_name}")
     
     def assign_quota_to_bucket(self, bucket_name, quota):
         """
@@ -134,9 +149,7 @@ class MinioClient:
         """
         uses the given template policy to render a final policy and returns the absolute path to rendered policy file.
         """  
-        out = f"/tmp/__{username}_{template}"
-        file = ntp.spool_template(template, out, data)
-        return os.path.abspath(file)
+        return ntp.spool_temp(template, data, f"{username}_")
     
     def assign_rw_bucket_policy_to_user(self,username,bucket_names):
         """
@@ -146,7 +159,7 @@ class MinioClient:
         path_to_policy_json = self.render_policy(username,"minio_rw_policy_tpl.json",{"bucket_arns":bucket_names})
         res=util.check(self.add_policy(policy_name,path_to_policy_json),"add_policy",True)
         res=util.check(self.assign_policy_to_user(username,policy_name),"assign_rw_bucket_policy_to_user",res)
-        os.remove(path_to_policy_json)
+        ntp.discard(path_to_policy_json)
         return res
 
     def delete_user(self,username):
@@ -115,15 +115,13 @@ def render_mongodb_script(namespace,template,data):
     """
     uses the given template to render a js script to execute as a json.
     """  
-    out = f"/tmp/__{namespace}_{template}"
-    file = ntp.spool_template(template, out, data)
-    return os.path.abspath(file)
+    return ntp.spool_temp(template, data, f"{namespace}_")
 
 def exec_mongosh_command(pod_name,path_to_mdb_script):
     logging.info(f"passing script {path_to_mdb_script} to pod {pod_name}")
     res = kube.kubectl("cp",path_to_mdb_script,f"{pod_name}:{path_to_mdb_script}")
     res = kube.kubectl("exec","-it",pod_name,"--","/bin/bash","-c",f"mongosh --file {path_to_mdb_script}")
-    os.remove(path_to_mdb_script)
+    ntp.discard(path_to_mdb_script)
     return res
 
 def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
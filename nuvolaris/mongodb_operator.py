@@ -34,7 +34,9 @@
 # kubectl -n nuvolaris port-forward service/nuvolaris-mongodb-svc 27017:27017
 #
 
-import kopf, json, time
+import json, time
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
@@ -19,7 +19,9 @@
 # Deploys a standalone mongodb
 #
 
-import kopf, json, time
+import json, time
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
@@ -19,7 +19,8 @@
 # Deploys a standalone mongodb
 #
 
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import json, time
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
@@ -19,6 +19,7 @@ import json
 import logging
 import nuvolaris.util as util
 import nuvolaris.template as ntp
+import nuvolaris.workspace as nws
 
 class OpaqueSecret:
     _data = {}
@@ -43,8 +44,16 @@ class OpaqueSecret:
 
     def deploy_template(self,where,tpl= "opaque-secret-tpl.yaml"):
         """
-        uses the given template to render a final opaque secret template and returns the path to the template
+        uses the given template to render a final opaque secret template in the workspace folder and returns it
+        (the rendered file is only in memory, the kustomizations of the folder read it from the workspace)
+
+        >>> secret = OpaqueSecret("test-secret")
+        >>> secret.add_secret_entry("password", "pwd")
+        >>> text = secret.deploy_template("test")
+        >>> "password: cHdk" in text, nws.current().read("test/_test-secret.yaml") == text
+        (True, True)
         """
-        dir = f"deploy/{where}"
-        out = tgt = f"{dir}/_{self._data['name']}.yaml"
-        ntp.spool_template(tpl, out, self._data)              
\ No newline at end of file
+        out = f"{where}/_{self._data['name']}.yaml"
+        text = ntp.expand_template(tpl, self._data)
+        nws.current().write(out, text)
+        return text
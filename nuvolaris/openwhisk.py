@@ -20,11 +20,19 @@ import nuvolaris.config as cfg
 import nuvolaris.openwhisk_standalone as standalone
 import nuvolaris.openwhisk_enterprise as enterprise
 import nuvolaris.kube as kube
-from nuvolaris.util import nuv_retry
+import nuvolaris.annotator as annotator
 
-@nuv_retry()
+# the spec subtrees the controller manifests are rendered from,
+# the standalone controller embeds also the invoker configuration
+SPEC_INPUTS = [
+    "spec.configs.controller", "spec.configs.invoker", "spec.configs.limits",
+    "spec.controller", "spec.invoker", "spec.couchdb",
+    "spec.nuvolaris.affinity", "spec.nuvolaris.tolerations", "spec.nuvolaris.kafka", "spec.nuvolaris.zookeeper"
+]
+
+# annotate the config map, within an annotator.batch the annotations are coalesced
 def annotate(keyval):
-    kube.kubectl("annotate", "cm/config",  keyval, "--overwrite")
+    return annotator.annotate("cm/config", keyval)
 
 def create(owner=None):
     useInvoker = cfg.get('components.invoker') or False
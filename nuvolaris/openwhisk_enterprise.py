@@ -22,7 +22,8 @@ import nuvolaris.enterprise_util as cfg_util
 import nuvolaris.util as util
 import os, os.path
 import logging
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 
 def create(owner=None):
     logging.info("*** setup openwhisk in enterprise mode activated")
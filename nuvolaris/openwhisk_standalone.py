@@ -21,7 +21,8 @@ import nuvolaris.config as cfg
 import nuvolaris.util as util
 import os, os.path
 import logging
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 
 CONTROLLER_SPEC = "state.controller.spec"
 
@@ -15,8 +15,10 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import logging
+import json, logging
+import nuvolaris.informer as informer
 import nuvolaris.openwhisk as openwhisk
+import nuvolaris.annotator as annotator
 import nuvolaris.kube as kube
 import nuvolaris.userdb_util as userdb
 import nuvolaris.config as cfg
@@ -26,6 +28,7 @@ import nuvolaris.redis as redis
 
 from nuvolaris.nuvolaris_metadata import NuvolarisMetadata
 
+@annotator.batched
 def annotate_operator_components_version():
     """
     This functions scans for pod matching the annotations whisks.nuvolaris.org/annotate-version: "true"
@@ -100,6 +103,39 @@ def whisk_post_resume(name):
         openwhisk.annotate(f"system_action_status=failed")    
         logging.warn("system action deploy issues after operator restart. Checl logs for further details")        
 
+# the part of nodes and storage classes the detection depends on
+def _detection_signature(obj):
+    """
+    >>> _detection_signature({"kind": "Node", "metadata": {"labels": {"a": "b"}, "resourceVersion": "2"}, "status": {}})
+    '{"a": "b"}'
+    """
+    meta = obj.get("metadata", {})
+    if obj.get("kind") == "Node":
+        return json.dumps(meta.get("labels") or {}, sort_keys=True)
+    return json.dumps([meta.get("annotations") or {}, obj.get("provisioner"), obj.get("parameters")], sort_keys=True)
+
+# invalidate the memoized detection when node labels or storage classes change
+# node status updates are frequent and ignored
+def watch_detection():
+    for kind in ["nodes", "storageclasses"]:
+        inf = informer.find(kind)
+        if not inf:
+            logging.warning(f"no informer for {kind}, detection will be refreshed after {cfg.DETECT_TTL}s")
+            continue
+        seen = {obj["metadata"]["name"]: _detection_signature(obj) for obj in inf.list()}
+
+        def on_event(event, obj, kind=kind, seen=seen):
+            name = obj.get("metadata", {}).get("name")
+            signature = event != "DELETED" and _detection_signature(obj) or None
+            if seen.get(name) != signature:
+                logging.info(f"*** {kind} {name} changed, invalidating the detected configuration")
+                cfg.invalidate_detection()
+            if signature is None:
+                seen.pop(name, None)
+            else:
+                seen[name] = signature
+        inf.add_listener(on_event)
+
 def config_from_spec(spec, handler_type = "on_create"):
     """
     Initialize the global configuration from the given spec.
@@ -108,7 +144,8 @@ def config_from_spec(spec, handler_type = "on_create"):
     """
     cfg.clean()
     cfg.configure(spec)
-    cfg.detect()
+    # update and resume reuse the detection unless nodes or storage classes changed
+    cfg.detect(cached="on_create" not in handler_type)
 
     if "on_create" in handler_type:       
         cfg.put("config.apihost", "https://pending")
@@ -24,6 +24,7 @@ import nuvolaris.minio_deploy as minio
 import nuvolaris.storage_static as static
 import nuvolaris.config as cfg
 import nuvolaris.kube as kube
+import nuvolaris.readiness as readiness
 import nuvolaris.util as util
 import nuvolaris.kopf_util as kopf_util
 import nuvolaris.postgres_operator as postgres
@@ -46,17 +47,113 @@ def patch_preloader(owner: None):
         logging.info("*** handled request to patch openwhisk runtime preloader")
     except Exception as e:
         logging.error("*** failed to patch openwhisk runtime preloader",e)
-import nuvolaris.invoker as invoker
 
-def redeploy_invoker(owner=None):
+# the components updated in place when one of their inputs changes
+UPDATABLE = {
+    "redis": redis,
+    "etcd": etcd,
+    "cron": cron,
+    "quota": quota,
+    "invoker": invoker,
+    "openwhisk": openwhisk
+}
+
+WORKLOADS = ["StatefulSet", "Deployment", "DaemonSet"]
+
+# the spec subtrees each updatable component is rendered from
+def spec_inputs():
+    """
+    >>> spec_inputs()["redis"][0]
+    'spec.redis'
+    """
+    return {name: module.SPEC_INPUTS for name, module in UPDATABLE.items()}
+
+# the configmaps and secrets used by a pod template, as (kind, name)
+def _references(template):
+    """
+    >>> template = {"spec": {"volumes": [{"configMap": {"name": "conf"}}, {"secret": {"secretName": "tls"}}],
+    ...   "containers": [{"envFrom": [{"secretRef": {"name": "env"}}],
+    ...     "env": [{"valueFrom": {"configMapKeyRef": {"name": "cm", "key": "k"}}}]}]}}
+    >>> sorted(_references(template))
+    [('ConfigMap', 'cm'), ('ConfigMap', 'conf'), ('Secret', 'env'), ('Secret', 'tls')]
+    """
+    res = set()
+    if isinstance(template, list):
+        for item in template:
+            res |= _references(item)
+    elif isinstance(template, dict):
+        for key, value in template.items():
+            if not isinstance(value, dict):
+                res |= _references(value)
+                continue
+            if key in ["configMap", "configMapRef", "configMapKeyRef"] and value.get("name"):
+                res.add(("ConfigMap", value["name"]))
+            elif key in ["secretRef", "secretKeyRef"] and value.get("name"):
+                res.add(("Secret", value["name"]))
+            elif key == "secret" and value.get("secretName"):
+                res.add(("Secret", value["secretName"]))
+            else:
+                res |= _references(value)
+    return res
+
+# the workloads to restart after an apply tracked by kube.tracking
+# a workload whose pod template changed is rolled by kubernetes itself,
+# one with the same template is restarted only if a configmap or secret it uses changed
+def workloads_to_roll(applied):
+    """
+    >>> T = kube.TEMPLATE_ANNOTATION
+    >>> def sts(name, tpl, volume): return {"kind": "StatefulSet", "metadata": {"name": name, "annotations": {T: tpl}},
+    ...   "spec": {"template": {"spec": {"volumes": [{"configMap": {"name": volume}}]}}}}
+    >>> cm = {"kind": "ConfigMap", "metadata": {"name": "conf"}}
+    >>> applied = [(cm, True, cm), (sts("a", "t1", "conf"), True, sts("a", "t0", "conf")),
+    ...   (sts("b", "t1", "conf"), True, sts("b", "t1", "conf")), (sts("c", "t1", "other"), False, sts("c", "t1", "other")),
+    ...   (sts("d", "t1", "conf"), True, {})]
+    >>> workloads_to_roll(applied)
+    ['statefulset/b']
+    >>> workloads_to_roll([(cm, False, cm), (sts("b", "t1", "conf"), False, sts("b", "t1", "conf"))])
+    []
+    >>> workloads_to_roll([(cm, True, None), (sts("b", "t1", "conf"), True, None)])
+    ['statefulset/b']
+    """
+    changed = set()
+    for doc, was_changed, _ in applied:
+        if was_changed and doc.get("kind") in ["ConfigMap", "Secret"]:
+            changed.add((doc["kind"], doc["metadata"]["name"]))
+
+    res = []
+    for doc, _, previous in applied:
+        if doc.get("kind") not in WORKLOADS or previous == {}:
+            continue
+        if previous is None:
+            # the live workload was not read, restart it to be safe
+            res.append(f"{doc['kind'].lower()}/{doc['metadata']['name']}")
+            continue
+        template = doc["metadata"].get("annotations", {}).get(kube.TEMPLATE_ANNOTATION)
+        before = (previous.get("metadata", {}).get("annotations") or {}).get(kube.TEMPLATE_ANNOTATION)
+        if template != before:
+            logging.info(f"{doc['kind']} {doc['metadata']['name']} rolled by its template change")
+            continue
+        if _references(doc["spec"].get("template")) & changed:
+            res.append(f"{doc['kind'].lower()}/{doc['metadata']['name']}")
+    return res
+
+# apply again an updatable component, restarting only the workloads that need it
+def reapply(name, owner=None):
     try:
-        logging.info('*** handling request to redeploy whisk invoker')
-        msg = invoker.create(owner)
+        logging.info(f"*** handling request to update {name}")
+        with kube.tracking() as applied:
+            msg = UPDATABLE[name].create(owner)
         logging.info(msg)
-        rollout("sts/invoker")
-        logging.info('*** handled request to redeploy whisk invoker')
+        for workload in workloads_to_roll(applied):
+            rollout(workload)
+        logging.info(f"*** handled request to update {name}")
+        return True
     except Exception as e:
-        logging.error('*** failed to redeploy whisk invoker: %s' % e) 
+        logging.error(f"*** failed to update {name}: {e}")
+        return False
+
+def redeploy_invoker(owner=None):
+    reapply("invoker", owner)
 
 def rollout(kube_name):
     try:
@@ -64,7 +161,7 @@ def rollout(kube_name):
         kube.rollout(kube_name)
         logging.info(f"*** handled request to rollout {kube_name}")
     except Exception as e:
-        logging.error('*** failed to rollout %s: %s' % kube_name,e)
+        logging.error('*** failed to rollout %s: %s' % (kube_name, e))
 
 def restart_sts(sts_name):
     try:
@@ -75,7 +172,9 @@ def restart_sts(sts_name):
             replicas = current_rep[0]
         
         kube.scale_sts(sts_name,0)
-        time.sleep(5)
+        scaled_down = readiness.when(*sts_name.split("/", 1), lambda sts: sts is not None and not (sts.get("status") or {}).get("replicas"), 60)
+        if scaled_down is None or not scaled_down.result():
+            time.sleep(5)
         logging.info(f"scaling {sts_name} to {replicas}")
         kube.scale_sts(sts_name,replicas)
         logging.info(f"*** handling request to redeploy {sts_name} using scaledown/scaleup")
@@ -83,14 +182,7 @@ def restart_sts(sts_name):
         logging.error('*** failed to scale up/down %s: %s' % sts_name,e)
 
 def redeploy_controller(owner=None):
-    try:
-        logging.info("*** handling request to redeploy whisk controller")      
-        msg = openwhisk.create(owner)
-        logging.info(msg)
-        rollout("sts/controller")
-        logging.info("*** handled request to redeploy whisk controller") 
-    except Exception as e:
-        logging.error('*** failed to redeploy whisk controller: %s' % e) 
+    reapply("openwhisk", owner)
 
 def restart_whisk(owner=None):
     useInvoker = cfg.get('components.invoker') or False
@@ -113,7 +205,7 @@ def patch(diff, status, owner=None, name=None):
     provided diff object to identify which components needs to be added/removed.
     """
     logging.info(status)
-    what_to_do = kopf_util.detect_component_changes(diff)
+    what_to_do = kopf_util.detect_component_changes(diff, spec_inputs())
 
     if len(what_to_do) == 0:
         logging.warn("*** no relevant changes identified by the operator patcher. Skipping processing")
@@ -125,6 +217,11 @@ def patch(diff, status, owner=None, name=None):
     components_updated = False    
 
     # components 1st
+    # components changed only in their inputs are applied again
+    updates = [key for key in UPDATABLE if what_to_do.get(key) == "update"]
+    for key in updates:
+        del what_to_do[key]
+
     if "postgres" in what_to_do:
         postgres.patch(status,what_to_do['postgres'], owner)
         components_updated = True
@@ -162,13 +259,15 @@ def patch(diff, status, owner=None, name=None):
         components_updated = True 
 
     if "registry" in what_to_do:
-        registry.patch(status,what_to_do['milvus'], owner)
+        registry.patch(status,what_to_do['registry'], owner)
         components_updated = True                                      
 
-    # handle update action on openwhisk
-    if "openwhisk" in what_to_do and what_to_do['openwhisk'] == "update":        
-        redeploy_whisk(owner)
-        components_updated = True
+    # the invoker is updated before the controller, as in the creation
+    for key in updates:
+        if key != "openwhisk" and not cfg.get(f"components.{key}"):
+            logging.info(f"*** {key} is not enabled, skipping its update")
+            continue
+        components_updated = reapply(key, owner) or components_updated
 
     # handle update action on endpoint
     if "endpoint" in what_to_do and what_to_do['endpoint'] == "update":
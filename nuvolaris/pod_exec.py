@@ -0,0 +1,382 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# executes commands inside pods over a single exec websocket
+# the input (usually a rendered script) is streamed on stdin, so nothing
+# is copied in the pod or written to local temporary files
+# the exec stdin cannot be closed with the v4 protocol, so the input is framed
+# by its length and read with "head -c" in the pod before running the command
+#
+# check_output runs the commands in long lived shell sessions, kept in a pool
+# with a limited number of sessions for each pod, so many commands for the
+# same pod share one exec websocket
+# the admin clients in CLIENTS (redis-cli) are kept running in their own sessions,
+# reading the commands from stdin, so they are not started again for each call
+# (the connection is reset at each request and a failed AUTH fails the request)
+import base64, logging, os, threading, time, uuid
+import nuvolaris.kube as kube
+
+SERVICE_ACCOUNT_TOKEN = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+MAX_SESSIONS_PER_POD = int(os.environ.get("NUVOLARIS_EXEC_SESSIONS", "2"))
+SESSION_IDLE_SECONDS = 300
+
+# the clients kept running in a session, with the command echoing its argument
+# (its reply ends the output of a request)
+CLIENTS = {
+    "redis-cli": "ECHO",
+    "/bin/redis-cli": "ECHO"
+}
+
+_api = None
+_lock = threading.Lock()
+_pool = {}
+
+class ExecResult:
+    def __init__(self, stdout, stderr, returncode):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+
+    def __repr__(self):
+        return f"ExecResult(returncode={self.returncode}, stdout={self.stdout!r}, stderr={self.stderr!r})"
+
+class ExecError(Exception):
+    def __init__(self, result):
+        self.result = result
+        super().__init__(result.stderr.strip() or f"command terminated with exit code {result.returncode}")
+
+def _core_api():
+    global _api
+    with _lock:
+        if not _api:
+            import kubernetes
+            if os.path.isfile(SERVICE_ACCOUNT_TOKEN):
+                kubernetes.config.load_incluster_config()
+            else:
+                kubernetes.config.load_kube_config()
+            _api = kubernetes.client.CoreV1Api()
+    return _api
+
+# wrap a shell command so that it reads exactly the given input
+def shell_command(command, stdin=None):
+    """
+    >>> shell_command("redis-cli", "ACL LIST\\n")
+    ['/bin/sh', '-c', 'head -c 9 | { redis-cli; }']
+    >>> shell_command("ls")
+    ['/bin/sh', '-c', 'ls']
+    """
+    if stdin is None:
+        return ["/bin/sh", "-c", command]
+    size = len(stdin.encode("utf-8"))
+    return ["/bin/sh", "-c", f"head -c {size} | {{ {command}; }}"]
+
+def _connect(pod_name, argv, stdin, container, namespace):
+    from kubernetes.stream import stream
+    api = _core_api()
+    kwargs = container and {"container": container} or {}
+    return stream(api.connect_get_namespaced_pod_exec, pod_name, namespace,
+                  command=argv, stderr=True, stdin=stdin is not None, stdout=True, tty=False,
+                  _preload_content=False, **kwargs)
+
+def _run_websocket(ws, pod_name, stdin, timeout):
+    stdout, stderr = [], []
+    try:
+        if stdin:
+            ws.write_stdin(stdin)
+        deadline = timeout and time.time() + timeout
+        while ws.is_open():
+            ws.update(timeout=1)
+            if ws.peek_stdout():
+                stdout.append(ws.read_stdout())
+            if ws.peek_stderr():
+                stderr.append(ws.read_stderr())
+            if deadline and time.time() > deadline:
+                raise TimeoutError(f"exec in {pod_name} timed out after {timeout}s")
+        stdout.append(ws.read_stdout())
+        stderr.append(ws.read_stderr())
+        return ExecResult("".join(stdout), "".join(stderr), ws.returncode)
+    finally:
+        ws.close()
+
+# run the command with kubectl exec, the result is taken from the call (or its error)
+def _run_kubectl(pod_name, argv, stdin, container, namespace, timeout):
+    """
+    >>> kube.mocker.config("exec", "PONG")
+    >>> _run_kubectl("redis-0", ["redis-cli"], "PING\\n", None, "nuvolaris", None)
+    ExecResult(returncode=0, stdout='PONG', stderr='')
+    >>> kube.mocker.reset()
+    >>> def failing(*args, **kwargs): raise kube.KubectlError("command terminated with exit code 2", 2, "partial")
+    >>> kubectl, kube.kubectl = kube.kubectl, failing
+    >>> _run_kubectl("redis-0", ["redis-cli"], "PING\\n", None, "nuvolaris", None)
+    ExecResult(returncode=2, stdout='partial', stderr='command terminated with exit code 2')
+    >>> kube.kubectl = kubectl
+    """
+    args = ["exec", "-i", pod_name]
+    if container:
+        args += ["-c", container]
+    try:
+        out = kube.kubectl(*args, "--", *argv, namespace=namespace, input=stdin, timeout=timeout)
+        return ExecResult(out, "", 0)
+    except kube.KubectlError as e:
+        return ExecResult(e.output, e.error, e.returncode > 0 and e.returncode or 1)
+    except Exception as e:
+        return ExecResult("", str(e), 1)
+
+# run a shell command in a pod, streaming the optional input on its stdin
+# returns an ExecResult with stdout, stderr and the exit code
+def run(pod_name, command, stdin=None, container=None, namespace="nuvolaris", timeout=None):
+    argv = shell_command(command, stdin)
+    ws = None
+    if not kube.mocker.enabled:
+        try:
+            ws = _connect(pod_name, argv, stdin, container, namespace)
+        except Exception as e:
+            logging.warning(f"cannot open the exec websocket to {pod_name}, using kubectl: {e}")
+    if ws:
+        return _run_websocket(ws, pod_name, stdin, timeout)
+    return _run_kubectl(pod_name, argv, stdin, container, namespace, timeout)
+
+class SessionClosed(Exception):
+    pass
+
+# the shell line running a command in a session
+# the input is embedded base64 encoded, then the exit code and an end marker
+# are printed on stdout and the end marker on stderr
+def session_line(command, stdin, mark):
+    r"""
+    >>> print(session_line("redis-cli", "PING\n", "M"), end="")
+    printf '%s' 'UElORwo=' | base64 -d | { redis-cli ; }; printf '\nM %s\n' "$?"; printf '\nM\n' >&2
+    >>> import subprocess
+    >>> res = subprocess.run(["/bin/sh"], input=session_line("cat; exit 3", "hello", "M"), capture_output=True, text=True)
+    >>> session_output(res.stdout, "M"), res.stderr
+    (('hello', '3', ''), '\nM\n')
+    """
+    if stdin is None:
+        line = f"( {command} ) < /dev/null"
+    else:
+        data = base64.b64encode(stdin.encode("utf-8")).decode("ascii")
+        line = f"printf '%s' '{data}' | base64 -d | {{ {command} ; }}"
+    return line + f"; printf '\\n{mark} %s\\n' \"$?\"; printf '\\n{mark}\\n' >&2\n"
+
+# split the output of a command from the end marker, returns None if not yet complete
+def session_output(buffer, mark):
+    """
+    >>> session_output("OK\\nOK\\n\\nM 0\\nnext", "M")
+    ('OK\\nOK\\n', '0', 'next')
+    >>> session_output("OK\\n\\nM", "M") is None
+    True
+    """
+    pos = buffer.find(f"\n{mark}")
+    if pos < 0:
+        return None
+    end = buffer.find("\n", pos + 1 + len(mark))
+    if end < 0:
+        return None
+    status = buffer[pos + 1 + len(mark):end].strip()
+    return buffer[:pos], status, buffer[end + 1:]
+
+# the input sent to a running client, followed by the echo of the end marker
+def client_request(stdin, mark, echo):
+    r"""
+    >>> client_request("AUTH pwd\nPING", "M", "ECHO")
+    'AUTH pwd\nPING\nECHO M\n'
+    """
+    if stdin and not stdin.endswith("\n"):
+        stdin += "\n"
+    return f"{stdin or ''}{echo} {mark}\n"
+
+# split the output of a client request from the echoed end marker, returns None if not yet complete
+def client_output(buffer, mark):
+    r"""
+    >>> client_output("OK\nPONG\nM\nnext", "M")
+    ('OK\nPONG\n', 'next')
+    >>> client_output("M\n", "M"), client_output("OK\nM", "M")
+    (('', ''), None)
+    """
+    pos = (f"\n{buffer}").find(f"\n{mark}\n")
+    if pos < 0:
+        return None
+    return buffer[:pos], buffer[pos + len(mark) + 1:]
+
+# the steps of a client request, with the reply expected from each one (None when not checked)
+# each AUTH is sent and checked alone, so the commands after a failed one are not run
+def client_steps(stdin):
+    r"""
+    >>> client_steps("AUTH pwd\nACL SETUSER a on\nACL LIST\n")
+    [('AUTH pwd', 'OK'), ('ACL SETUSER a on\nACL LIST', None)]
+    >>> client_steps("PING\nauth user pwd\nPING")
+    [('PING', None), ('auth user pwd', 'OK'), ('PING', None)]
+    """
+    steps, lines = [], []
+    for line in (stdin or "").splitlines():
+        if line.strip().upper().startswith("AUTH "):
+            if lines:
+                steps.append(("\n".join(lines), None))
+                lines = []
+            steps.append((line.strip(), "OK"))
+        elif line.strip():
+            lines.append(line)
+    if lines:
+        steps.append(("\n".join(lines), None))
+    return steps
+
+class Session:
+    """
+    a long lived shell in a pod running one command at a time,
+    or a long lived client (see CLIENTS) running the commands of each request
+    """
+    def __init__(self, pod_name, container=None, namespace="nuvolaris", client=None):
+        self.pod_name = pod_name
+        self.client = client
+        argv = client and shell_command(client) or ["/bin/sh"]
+        self.ws = _connect(pod_name, argv, "", container, namespace)
+        self.last_used = time.time()
+
+    def alive(self):
+        return self.ws.is_open() and time.time() - self.last_used < SESSION_IDLE_SECONDS
+
+    def close(self):
+        try:
+            self.ws.close()
+        except Exception:
+            pass
+
+    # send some commands to the running client and read their replies
+    def _send(self, commands, deadline, timeout):
+        mark = f"__nuv_end_{uuid.uuid4().hex}"
+        try:
+            self.ws.write_stdin(client_request(commands, mark, CLIENTS[self.client]))
+        except Exception as e:
+            raise SessionClosed(str(e))
+        out, err, res = "", "", None
+        while res is None:
+            if not self.ws.is_open():
+                raise Exception(f"{self.client} in {self.pod_name} exited: {err.strip()}")
+            self.ws.update(timeout=1)
+            out += self.ws.read_stdout(timeout=0) if self.ws.peek_stdout() else ""
+            err += self.ws.read_stderr(timeout=0) if self.ws.peek_stderr() else ""
+            res = client_output(out, mark)
+            if deadline and time.time() > deadline:
+                self.close()
+                raise TimeoutError(f"{self.client} in {self.pod_name} timed out after {timeout}s")
+        return res[0], err
+
+    # send a request to the running client, the errors of the other commands are in the replies
+    # the connection is reset first, so a request never runs with the identity of a previous one,
+    # and a failed RESET or AUTH stops the request with a non zero exit code
+    def request(self, stdin, timeout=None):
+        deadline = timeout and time.time() + timeout
+        reply, err = self._send("RESET", deadline, timeout)
+        if reply.strip() != "RESET":
+            return ExecResult("", err + (reply.strip() or "RESET failed") + "\n", 1)
+        out = ""
+        for commands, expected in client_steps(stdin):
+            try:
+                reply, errors = self._send(commands, deadline, timeout)
+            except SessionClosed as e:
+                # the previous steps already ran, the request cannot be retried
+                raise Exception(f"{self.client} in {self.pod_name} closed during a request: {e}")
+            out, err = out + reply, err + errors
+            if expected and reply.strip() != expected:
+                self.last_used = time.time()
+                return ExecResult(out, err + (reply.strip() or f"{commands.split()[0]} failed") + "\n", 1)
+        self.last_used = time.time()
+        return ExecResult(out, err, 0)
+
+    def execute(self, command, stdin=None, timeout=None):
+        if self.client:
+            return self.request(stdin, timeout)
+        mark = f"__nuv_end_{uuid.uuid4().hex}"
+        try:
+            self.ws.write_stdin(session_line(command, stdin, mark))
+        except Exception as e:
+            raise SessionClosed(str(e))
+        out, err = "", ""
+        stdout, stderr = None, None
+        deadline = timeout and time.time() + timeout
+        while stdout is None or stderr is None:
+            if not self.ws.is_open():
+                raise Exception(f"exec session to {self.pod_name} closed while running {command}")
+            self.ws.update(timeout=1)
+            if stdout is None:
+                out += self.ws.read_stdout(timeout=0) if self.ws.peek_stdout() else ""
+                stdout = session_output(out, mark)
+            if stderr is None:
+                err += self.ws.read_stderr(timeout=0) if self.ws.peek_stderr() else ""
+                stderr = session_output(err, mark)
+            if deadline and time.time() > deadline:
+                self.close()
+                raise TimeoutError(f"exec in {self.pod_name} timed out after {timeout}s")
+        self.last_used = time.time()
+        return ExecResult(stdout[0], stderr[0], int(stdout[1] or 0))
+
+def _take(entry):
+    while entry["idle"]:
+        session = entry["idle"].pop()
+        if session.alive():
+            return session
+        session.close()
+    return None
+
+# run a command in a pooled shell session of the pod, or in a pooled running client
+# if the command is one of the CLIENTS with an input
+# sessions closed (for example by a pod restart) are replaced by new ones
+def session_run(pod_name, command, stdin=None, container=None, namespace="nuvolaris", timeout=None):
+    if kube.mocker.enabled:
+        return run(pod_name, command, stdin, container, namespace, timeout)
+    client = stdin is not None and command in CLIENTS and command or None
+    key = (namespace, pod_name, container, client)
+    with _lock:
+        entry = _pool.setdefault(key, {"idle": [], "slots": threading.BoundedSemaphore(MAX_SESSIONS_PER_POD)})
+    with entry["slots"]:
+        for attempt in range(2):
+            with _lock:
+                session = _take(entry)
+            if not session:
+                try:
+                    session = Session(pod_name, container, namespace, client)
+                except Exception as e:
+                    logging.warning(f"cannot open an exec session to {pod_name}: {e}")
+                    return run(pod_name, command, stdin, container, namespace, timeout)
+            try:
+                res = session.execute(command, stdin, timeout)
+            except SessionClosed:
+                # the command was not sent, retry with a new session
+                session.close()
+                continue
+            except Exception:
+                session.close()
+                raise
+            with _lock:
+                entry["idle"].append(session)
+            return res
+    return run(pod_name, command, stdin, container, namespace, timeout)
+
+def close_sessions():
+    with _lock:
+        for entry in _pool.values():
+            for session in entry["idle"]:
+                session.close()
+        _pool.clear()
+
+# like run, but returns the stdout and raises ExecError on a non zero exit code
+# the command runs in a pooled session
+def check_output(pod_name, command, stdin=None, container=None, namespace="nuvolaris", timeout=None):
+    res = session_run(pod_name, command, stdin, container, namespace, timeout)
+    if res.returncode != 0:
+        raise ExecError(res)
+    return res.stdout
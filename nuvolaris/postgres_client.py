@@ -16,7 +16,8 @@
 # under the License.
 #
 import logging, json,  os
-import psycopg
+import nuvolaris.lazy as lazy
+psycopg = lazy.module("psycopg")
 
 class PostgresClient:
     
@@ -16,8 +16,12 @@
 # under the License.
 #
 
-import kopf, json, time, logging, os
+import json, time, logging, os
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
+import nuvolaris.pod_exec as pod_exec
+import nuvolaris.annotator as annotator
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
 import nuvolaris.util as util
@@ -92,6 +96,7 @@ def create(owner=None):
 
     return res
 
+@annotator.batched
 def update_system_cm_for_pdb(data):
     """"
     Annotate the default ConfigMAp with default Nuvolaris user parameteres. The default user nuvolaris is setup by the Postgres setup script
@@ -174,23 +179,38 @@ def render_postgres_script(namespace,template,data):
     """
     uses the given template to render a sh script to execute via psql.
     """  
-    out = f"/tmp/__{namespace}_{template}"
-    file = ntp.spool_template(template, out, data)
-    return os.path.abspath(file)
+    return ntp.expand_template(template, data)
 
-def exec_psql_command(pod_name,path_to_psql_script,path_to_pgpass,additional_psql_args=''):
-    logging.info(f"passing script {path_to_psql_script} to pod {pod_name}")
-    res = kube.kubectl("cp",path_to_psql_script,f"{pod_name}:{path_to_psql_script}")
-    res = kube.kubectl("cp",path_to_pgpass,f"{pod_name}:/tmp/.pgpass")
-    res = kube.kubectl("exec","-it",pod_name,"--","/bin/bash","-c",f"chmod 600 /tmp/.pgpass")
+def pgpass_password(pgpass):
+    """
+    extracts the password from the last entry of a rendered .pgpass content
+    >>> pgpass_password("# comment\\n\\nlocalhost:5432:postgres:postgres:s3cr\\\\:et")
+    's3cr:et'
+    """
+    entry = [line for line in pgpass.splitlines() if line.strip() and not line.startswith("#")][-1]
+    fields, cur, escape = [], "", False
+    for c in entry:
+        if escape:
+            cur += c
+            escape = False
+        elif c == "\\":
+            escape = True
+        elif c == ":" and len(fields) < 4:
+            fields.append(cur)
+            cur = ""
+        else:
+            cur += c
+    return cur
 
-    cmd = f"PGPASSFILE='/tmp/.pgpass' psql --username postgres --dbname postgres {additional_psql_args} -f {path_to_psql_script}"
+# runs a psql script streamed on stdin, the password is sent as the first line
+def exec_psql(pod_name,db_name,psql_script,pgpass,additional_psql_args=''):
+    cmd = f"IFS= read -r PGPASSWORD && export PGPASSWORD && psql --username postgres --dbname {db_name} {additional_psql_args} -f -"
     logging.info(f"executing command: {cmd}")
-    res = kube.kubectl("exec","-it",pod_name,"--","/bin/bash","-c",cmd)
-    
-    os.remove(path_to_psql_script)
-    os.remove(path_to_pgpass)
-    return res
+    return pod_exec.check_output(pod_name, cmd, f"{pgpass_password(pgpass)}\n{psql_script}")
+
+def exec_psql_command(pod_name,psql_script,pgpass,additional_psql_args=''):
+    logging.info(f"streaming psql script to pod {pod_name}")
+    return exec_psql(pod_name, "postgres", psql_script, pgpass, additional_psql_args)
 
 def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
     database = ucfg.get('postgres.database')
@@ -203,24 +223,24 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
         data["password"]=ucfg.get('postgres.password')
         data["mode"]="create"       
 
-        path_to_pgpass = render_postgres_script(ucfg.get('namespace'),"pgpass_tpl.properties",data)
-        path_to_mdb_script = render_postgres_script(ucfg.get('namespace'),"postgres_manage_user_tpl.sql",data)
+        pgpass = render_postgres_script(ucfg.get('namespace'),"pgpass_tpl.properties",data)
+        mdb_script = render_postgres_script(ucfg.get('namespace'),"postgres_manage_user_tpl.sql",data)
         pod_name = util.get_pod_name_by_selector("app=nuvolaris-postgres","{.items[?(@.metadata.labels.replicationRole == 'primary')].metadata.name}")
 
         if(pod_name):
-            res = exec_psql_command(pod_name,path_to_mdb_script,path_to_pgpass)
+            res = exec_psql_command(pod_name,mdb_script,pgpass)
 
             if res:
                 _add_pdb_user_metadata(ucfg, user_metadata)
                 
-                path_to_pgpass = render_postgres_script(ucfg.get('namespace'),"dbname_pgpass_tpl.properties",data)
-                path_to_schema_script = render_postgres_script(ucfg.get('namespace'),"postgres_manage_user_schema_tpl.sql",data)
-                res = exec_psql_command_in_db(database,pod_name,path_to_schema_script,path_to_pgpass)
+                pgpass = render_postgres_script(ucfg.get('namespace'),"dbname_pgpass_tpl.properties",data)
+                schema_script = render_postgres_script(ucfg.get('namespace'),"postgres_manage_user_schema_tpl.sql",data)
+                res = exec_psql_command_in_db(database,pod_name,schema_script,pgpass)
 
                 data["extensions"]=["vector"]
-                path_to_pgpass = render_postgres_script(ucfg.get('namespace'),"dbname_pgpass_tpl.properties",data)
-                path_to_extensions_script = render_postgres_script(ucfg.get('namespace'),"postgres_manage_user_extension_tpl.sql",data)
-                res += exec_psql_command_in_db(database,pod_name,path_to_extensions_script,path_to_pgpass)
+                pgpass = render_postgres_script(ucfg.get('namespace'),"dbname_pgpass_tpl.properties",data)
+                extensions_script = render_postgres_script(ucfg.get('namespace'),"postgres_manage_user_extension_tpl.sql",data)
+                res += exec_psql_command_in_db(database,pod_name,extensions_script,pgpass)
                 
                 return res
             else:
@@ -231,6 +251,72 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata):
         logging.error(f"failed to add Postgres database {database}: {e}")
         return None
 
+# marker printed for each user whose role and database exist
+READY_MARKER = "NUVOLARIS_READY"
+
+# the query printing the marker of a user if its role and database exist
+def ready_query(username, database):
+    """
+    >>> print(ready_query("demo", "demo_db"))
+    SELECT 'NUVOLARIS_READY demo' WHERE EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'demo') AND EXISTS (SELECT 1 FROM pg_database WHERE datname = 'demo_db');
+    """
+    return (f"SELECT '{READY_MARKER} {username}' WHERE EXISTS (SELECT 1 FROM pg_roles WHERE rolname = '{username}')"
+            f" AND EXISTS (SELECT 1 FROM pg_database WHERE datname = '{database}');")
+
+# the users marked as ready in a psql output
+def ready_users(output):
+    """
+    >>> sorted(ready_users(" NUVOLARIS_READY demo\\nCREATE ROLE\\n NUVOLARIS_READY other\\n"))
+    ['demo', 'other']
+    """
+    return set(line.split()[1] for line in (output or "").splitlines() if line.strip().startswith(READY_MARKER))
+
+def create_db_users(entries):
+    """
+    Bulk version of create_db_user, entries are (state, ucfg, user_metadata) of many users.
+    The roles and databases are created in one admin session, then the schemas and extensions
+    of the created databases in a second session switching database, the result of each user is stored in its state
+    """
+    for state, _, _ in entries:
+        state['postgres'] = None
+    if not entries:
+        return
+
+    logging.info(f"authorizing {len(entries)} postgres databases")
+    try:
+        data = util.get_postgres_config_data()
+        users = []
+        for state, ucfg, user_metadata in entries:
+            user = dict(data, database=ucfg.get('postgres.database'), username=ucfg.get('namespace'),
+                        password=ucfg.get('postgres.password'), mode="create", extensions=["vector"])
+            users.append((state, ucfg, user_metadata, user))
+
+        pod_name = util.get_pod_name_by_selector("app=nuvolaris-postgres","{.items[?(@.metadata.labels.replicationRole == 'primary')].metadata.name}")
+        if not pod_name:
+            return
+
+        pgpass = render_postgres_script("postgres","pgpass_tpl.properties",data)
+        script = [render_postgres_script(user['username'],"postgres_manage_user_tpl.sql",user) for _, _, _, user in users]
+        script += [ready_query(user['username'], user['database']) for _, _, _, user in users]
+        ready = ready_users(exec_psql_command(pod_name,"\n".join(script),pgpass," -t "))
+
+        created = [entry for entry in users if entry[3]['username'] in ready]
+        script = []
+        for _, _, _, user in created:
+            script.append(f"\\c {user['database']}")
+            script.append(render_postgres_script(user['username'],"postgres_manage_user_schema_tpl.sql",user))
+            script.append(render_postgres_script(user['username'],"postgres_manage_user_extension_tpl.sql",user))
+        output = created and exec_psql_command(pod_name,"\n".join(script),pgpass) or ""
+
+        for state, ucfg, user_metadata, user in users:
+            if user['username'] in ready:
+                _add_pdb_user_metadata(ucfg, user_metadata)
+                state['postgres'] = output or f"{READY_MARKER} {user['username']}"
+            else:
+                logging.error(f"failed to add Postgres database {user['database']}")
+    except Exception as e:
+        logging.error(f"failed to add {len(entries)} Postgres databases: {e}")
+
 def delete_db_user(namespace, database):
     logging.info(f"removing postgres database {database}")
 
@@ -244,13 +330,13 @@ def delete_db_user(namespace, database):
         pod_name = util.get_pod_name_by_selector("app=nuvolaris-postgres","{.items[?(@.metadata.labels.replicationRole == 'primary')].metadata.name}")
 
         if(pod_name):
-            path_to_pgpass = render_postgres_script(namespace,"pgpass_tpl.properties",data)
-            path_to_ter_script = render_postgres_script(namespace,"postgres_terminate_tpl.sql",data)    
-            res = exec_psql_command(pod_name,path_to_ter_script,path_to_pgpass,' -q -t ')
+            pgpass = render_postgres_script(namespace,"pgpass_tpl.properties",data)
+            ter_script = render_postgres_script(namespace,"postgres_terminate_tpl.sql",data)    
+            res = exec_psql_command(pod_name,ter_script,pgpass,' -q -t ')
 
-            path_to_pgpass = render_postgres_script(namespace,"pgpass_tpl.properties",data)
-            path_to_mdb_script = render_postgres_script(namespace,"postgres_manage_user_tpl.sql",data)    
-            res += exec_psql_command(pod_name,path_to_mdb_script,path_to_pgpass)
+            pgpass = render_postgres_script(namespace,"pgpass_tpl.properties",data)
+            mdb_script = render_postgres_script(namespace,"postgres_manage_user_tpl.sql",data)    
+            res += exec_psql_command(pod_name,mdb_script,pgpass)
             return res 
 
         return None
@@ -313,12 +399,6 @@ def patch(status, action, owner=None):
         logging.error('*** failed to update postgres: %s' % e)        
         operator_util.patch_operator_status(status,'postgres','error')
 
-def exec_psql_command_in_db(db_name,pod_name,path_to_psql_script,path_to_pgpass):
-    logging.info(f"passing script {path_to_psql_script} to pod {pod_name}")
-    res = kube.kubectl("cp",path_to_psql_script,f"{pod_name}:{path_to_psql_script}")
-    res = kube.kubectl("cp",path_to_pgpass,f"{pod_name}:/tmp/.pgpass")
-    res = kube.kubectl("exec","-it",pod_name,"--","/bin/bash","-c",f"chmod 600 /tmp/.pgpass")
-    res = kube.kubectl("exec","-it",pod_name,"--","/bin/bash","-c",f"PGPASSFILE='/tmp/.pgpass' psql --username postgres --dbname {db_name} -f {path_to_psql_script}")
-    os.remove(path_to_psql_script)
-    os.remove(path_to_pgpass)
-    return res                               
\ No newline at end of file
+def exec_psql_command_in_db(db_name,pod_name,psql_script,pgpass):
+    logging.info(f"streaming psql script to pod {pod_name}")
+    return exec_psql(pod_name, db_name, psql_script, pgpass)                               
\ No newline at end of file
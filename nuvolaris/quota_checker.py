@@ -17,6 +17,7 @@
 #
 import logging, json,  os
 import nuvolaris.kube as kube
+import nuvolaris.annotator as annotator
 
 from nuvolaris.postgres_client import PostgresClient
 from nuvolaris.redis_client import RedisClient
@@ -32,7 +33,7 @@ def annotate(wsku_name, keyval):
     param: wksu_name the name of a wksu object too be annotated
     param: keyval a key value pair specifying the annotation to be set
     """
-    kube.kubectl("annotate", f"wsku/{wsku_name}",  keyval, "--overwrite")
+    annotator.annotate(f"wsku/{wsku_name}", keyval)
 
 def get_wsk_users(jsonpath,namespace="nuvolaris"):
     """
@@ -42,7 +43,7 @@ def get_wsk_users(jsonpath,namespace="nuvolaris"):
     return: an array of mathching record or emtpy [] if none is found
     """
     logging.info(f"querying wsku entries matching {jsonpath}")
-    users = kube.kubectl("get", "wsku", namespace=namespace, jsonpath=jsonpath)
+    users = kube.query("wsku", jsonpath, namespace=namespace)
     if(users):
         return users
 
@@ -182,6 +183,7 @@ def check_redis_quota(redis_client: RedisClient, redis_wsku):
 
         logging.info(f"***** REDIS prefix {prefix} size {current_redis_db_quota} is not exceeding quota limit {redis_quota} ****")   
 
+@annotator.batched
 def start():
     """
     Queries for wsku users resources having postgres db quota enables and 
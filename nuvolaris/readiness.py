@@ -0,0 +1,147 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# event driven waiters for pods, statefulsets and deployments
+# waiters are futures resolved by the events of the informers,
+# so any number of waiters share the same watch streams
+# a future resolves to True when the condition is met, False on timeout
+# when there is no informer for a kind the functions return None
+# and the caller should fall back to kube.wait
+import asyncio, logging, threading
+from concurrent.futures import Future
+import nuvolaris.informer as informer
+import nuvolaris.kube_api as kapi
+
+_lock = threading.Lock()
+_waiters = {}
+_attached = set()
+
+# true when a pod is ready, or a statefulset/deployment completed its rollout
+def ready(obj):
+    """
+    >>> ready({"kind": "Pod", "status": {"conditions": [{"type": "Ready", "status": "True"}]}})
+    True
+    >>> sts = {"kind": "StatefulSet", "metadata": {"generation": 2}, "spec": {"replicas": 2},
+    ...        "status": {"observedGeneration": 2, "readyReplicas": 1, "updatedReplicas": 2}}
+    >>> ready(sts)
+    False
+    >>> sts["status"]["readyReplicas"] = 2; ready(sts)
+    True
+    >>> ready(None)
+    False
+    """
+    if not obj:
+        return False
+    kind = obj.get("kind")
+    if kind == "Pod":
+        return kapi.condition_met(obj, "condition=ready")
+    status = obj.get("status") or {}
+    replicas = (obj.get("spec") or {}).get("replicas", 1)
+    if status.get("observedGeneration", 0) < obj.get("metadata", {}).get("generation", 0):
+        return False
+    if status.get("updatedReplicas", 0) < replicas:
+        return False
+    if kind == "Deployment":
+        return status.get("availableReplicas", 0) >= replicas
+    return status.get("readyReplicas", 0) >= replicas
+
+def deleted(obj):
+    return obj is None
+
+# the predicate for a kubectl wait condition (condition=ready, delete...)
+def predicate(condition):
+    if condition == "delete":
+        return deleted
+    if condition.lower() == "condition=ready":
+        return ready
+    return lambda obj: obj is not None and kapi.condition_met(obj, condition)
+
+def _resolve(fut, value):
+    try:
+        if not fut.done():
+            fut.set_result(value)
+    except Exception:
+        pass
+
+def _listener(inf):
+    def on_event(event, obj):
+        name = obj.get("metadata", {}).get("name")
+        with _lock:
+            waiters = list(_waiters.get((id(inf), name), []))
+        current = event != "DELETED" and obj or None
+        for check, fut in waiters:
+            try:
+                if check(current):
+                    _resolve(fut, True)
+            except Exception as e:
+                logging.error(f"readiness check for {name} failed: {e}")
+    return on_event
+
+def _attach(inf):
+    with _lock:
+        if id(inf) in _attached:
+            return
+        _attached.add(id(inf))
+    inf.add_listener(_listener(inf))
+
+# a future resolved when the predicate is true for the named object
+def when(kind, name, check, timeout=600, namespace="nuvolaris"):
+    inf = informer.find(kind, namespace)
+    if not inf:
+        return None
+    _attach(inf)
+    fut = Future()
+    key = (id(inf), name)
+    entry = (check, fut)
+    with _lock:
+        _waiters.setdefault(key, []).append(entry)
+    timer = threading.Timer(timeout, _resolve, [fut, False])
+    timer.daemon = True
+
+    def cleanup(_):
+        timer.cancel()
+        with _lock:
+            waiters = _waiters.get(key, [])
+            if entry in waiters:
+                waiters.remove(entry)
+            if not waiters:
+                _waiters.pop(key, None)
+    fut.add_done_callback(cleanup)
+    timer.start()
+    # the object could already be in the expected state
+    if check(inf.get(name)):
+        _resolve(fut, True)
+    return fut
+
+# a future for a kubectl wait target like pod/redis-0 and condition like condition=ready
+def when_condition(target, condition, timeout="600s", namespace="nuvolaris"):
+    kind, name = target.split("/", 1)
+    return when(kind, name, predicate(condition), kapi.parse_timeout(timeout), namespace)
+
+# block until the condition is met, None when the kind is not watched
+def wait(target, condition, timeout="600s", namespace="nuvolaris"):
+    fut = when_condition(target, condition, timeout, namespace)
+    if fut is None:
+        return None
+    return fut.result()
+
+# awaitable version of wait for async handlers
+async def wait_async(target, condition, timeout="600s", namespace="nuvolaris"):
+    fut = when_condition(target, condition, timeout, namespace)
+    if fut is None:
+        return None
+    return await asyncio.wrap_future(fut)
@@ -17,21 +17,27 @@
 #
 
 import nuvolaris.kustomize as kus
+import nuvolaris.annotator as annotator
 import nuvolaris.kube as kube
+import nuvolaris.pod_exec as pod_exec
 import nuvolaris.config as cfg
 import nuvolaris.template as ntp
 import nuvolaris.util as util
 import nuvolaris.openwhisk as openwhisk
 import urllib.parse
 import os, os.path
-import logging, json
-import kopf
+import logging, json, hashlib
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.operator_util as operator_util
 
 from nuvolaris.user_config import UserConfig
 from nuvolaris.user_metadata import UserMetadata
 
 
+# the spec subtrees the redis manifests are rendered from
+SPEC_INPUTS = ["spec.redis", "spec.nuvolaris.affinity", "spec.nuvolaris.tolerations", "spec.nuvolaris.storageclass"]
+
 def _add_redis_user_metadata(ucfg: UserConfig, user_metadata:UserMetadata):
     """
     adds an entry for the redis connectivity, i.e
@@ -94,15 +100,16 @@ def restore_nuvolaris_db_user():
     data = util.get_redis_config_data()
     create_nuvolaris_db_user(data)
 
+@annotator.batched
 def create_nuvolaris_db_user(data):
     logging.info(f"authorizing redis for namespace nuvolaris")
     try:        
         data['mode']="create"
-        path_to_script = render_redis_script(data['namespace'],"redis_manage_user_tpl.txt",data)
+        script = render_redis_script(data['namespace'],"redis_manage_user_tpl.txt",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
         if(pod_name):
-            res = exec_redis_command(pod_name,path_to_script)
+            res = exec_redis_command(pod_name,script)
 
             if(res):
                 redis_service =  util.get_service("{.items[?(@.spec.selector.name == 'redis')]}")
@@ -153,16 +160,11 @@ def render_redis_script(namespace,template,data):
     """
     uses the given template to render a redis-cli script to be executed.
     """  
-    out = f"/tmp/__{namespace}_{template}"
-    file = ntp.spool_template(template, out, data)
-    return os.path.abspath(file)
-
-def exec_redis_command(pod_name,path_to_script):
-    logging.info(f"passing script {path_to_script} to pod {pod_name}")
-    res = kube.kubectl("cp",path_to_script,f"{pod_name}:{path_to_script}")
-    res = kube.kubectl("exec","-it",pod_name,"--","/bin/bash","-c",f"cat {path_to_script} | redis-cli")
-    os.remove(path_to_script)
-    return res
+    return ntp.expand_template(template, data)
+
+def exec_redis_command(pod_name,script):
+    logging.info(f"streaming redis-cli script to pod {pod_name}")
+    return pod_exec.check_output(pod_name, "redis-cli", script)
 
 def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata, read_only_mode = False):
     logging.info(f"authorizing new redis namespace {ucfg.get('namespace')}")    
@@ -171,9 +173,7 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata, read_only_mode
         data = util.get_redis_config_data()
 
         # if prefix not provided defaults to user namespace
-        prefix = ucfg.get('redis.prefix') or ucfg.get('namespace') 
-        if(not prefix.endswith(":")):
-            prefix = f"{prefix}:"
+        prefix = _user_prefix(ucfg)
         data['prefix']=prefix
         data['namespace']=ucfg.get('namespace')
         data['password']=ucfg.get('redis.password')
@@ -183,11 +183,11 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata, read_only_mode
             logging.warn(f"activating {prefix} in read-only mode")
             data['mode']="create_readonly"
 
-        path_to_script = render_redis_script(ucfg.get('namespace'),"redis_manage_user_tpl.txt",data)
+        script = render_redis_script(ucfg.get('namespace'),"redis_manage_user_tpl.txt",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
         if(pod_name):
-            res = exec_redis_command(pod_name,path_to_script)
+            res = exec_redis_command(pod_name,script)
 
             if res:
                 user_metadata.add_metadata("REDIS_PREFIX",prefix)
@@ -201,6 +201,180 @@ def create_db_user(ucfg: UserConfig, user_metadata: UserMetadata, read_only_mode
         logging.error(f"failed to add redis namespace {ucfg.get('namespace')}: {e}")
         return None
 
+# the prefix of the keys of a user, defaults to its namespace
+def _user_prefix(ucfg: UserConfig):
+    prefix = ucfg.get('redis.prefix') or ucfg.get('namespace') 
+    if(not prefix.endswith(":")):
+        prefix = f"{prefix}:"
+    return prefix
+
+# split the replies of a redis-cli session among the scripts that produced them
+def split_replies(output, counts):
+    """
+    the first reply answers the AUTH, then each script gets as many replies as its commands
+    a script succeeded if all its replies are OK, None when the replies do not match the commands
+    >>> split_replies("OK\\nOK\\nOK\\nOK\\nERR bad\\n", [2, 2])
+    [['OK', 'OK'], None]
+    >>> split_replies("OK\\nOK\\n", [2, 2])
+    [None, None]
+    """
+    replies = [line.strip() for line in (output or "").splitlines() if line.strip()][1:]
+    if len(replies) != sum(counts):
+        return [None] * len(counts)
+    res = []
+    for count in counts:
+        mine, replies = replies[:count], replies[count:]
+        res.append(all(reply == "OK" for reply in mine) and mine or None)
+    return res
+
+def create_db_users(entries):
+    """
+    Bulk version of create_db_user, entries are (state, ucfg, user_metadata) of many users.
+    All the ACL SETUSER commands are sent in one redis-cli session, the result of each user is stored in its state
+    """
+    for state, _, _ in entries:
+        state['redis'] = None
+    if not entries:
+        return
+
+    logging.info(f"authorizing {len(entries)} redis namespaces")
+    try:
+        wait_for_redis_ready()
+        data = util.get_redis_config_data()
+        auth, commands = None, []
+        for _, ucfg, _ in entries:
+            user = dict(data, prefix=_user_prefix(ucfg), namespace=ucfg.get('namespace'), password=ucfg.get('redis.password'), mode="create")
+            lines = [line for line in render_redis_script(ucfg.get('namespace'),"redis_manage_user_tpl.txt",user).splitlines() if line.strip()]
+            auth = lines[0]
+            commands.append(lines[1:])
+
+        pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
+        if not pod_name:
+            return
+
+        script = "\n".join([auth] + [line for lines in commands for line in lines]) + "\n"
+        output = exec_redis_command(pod_name, script)
+        replies = split_replies(output, [len(lines) for lines in commands])
+        for (state, ucfg, user_metadata), reply in zip(entries, replies):
+            if reply:
+                user_metadata.add_metadata("REDIS_PREFIX",_user_prefix(ucfg))
+                _add_redis_user_metadata(ucfg, user_metadata)
+                state['redis'] = "\n".join(reply)
+            else:
+                logging.error(f"failed to add redis namespace {ucfg.get('namespace')}")
+    except Exception as e:
+        logging.error(f"failed to add {len(entries)} redis namespaces: {e}")
+
+# the permissions of a user, read-only when its quota is reached
+def _permissions(readonly):
+    return readonly and {"-@all", "+@read", "+info", "+del"} or {"+@all"}
+
+# the rules of each user in an ACL LIST output, as a set of tokens
+def parse_acl_list(output):
+    """
+    >>> acl = parse_acl_list("OK\\nuser default on nopass ~* &* +@all\\nuser demo on #ab12 ~demo:* resetchannels +@all\\n")
+    >>> sorted(acl), sorted(acl["demo"])
+    (['default', 'demo'], ['#ab12', '+@all', 'on', 'resetchannels', '~demo:*'])
+    """
+    res = {}
+    for line in (output or "").splitlines():
+        tokens = line.strip().split()
+        if len(tokens) > 1 and tokens[0] == "user":
+            res[tokens[1]] = set(tokens[2:])
+    return res
+
+# check if the current rules of a user match the desired ones
+def acl_matches(rules, password, prefix, readonly=False):
+    """
+    >>> import hashlib
+    >>> rules = {"on", "#" + hashlib.sha256(b"pwd").hexdigest(), "~demo:*", "resetchannels", "+@all"}
+    >>> acl_matches(rules, "pwd", "demo:"), acl_matches(rules, "other", "demo:"), acl_matches(rules, "pwd", "demo:", True)
+    (True, False, False)
+    >>> acl_matches(None, "pwd", "demo:"), acl_matches(rules, None, "demo:")
+    (False, False)
+    """
+    if not rules or "on" not in rules or password is None:
+        return False
+    hashes = {rule for rule in rules if rule.startswith("#")}
+    keys = {rule for rule in rules if rule[0] in "~%"}
+    permissions = {rule for rule in rules if rule[0] in "+-"}
+    return (hashes == {"#" + hashlib.sha256(password.encode("utf-8")).hexdigest()}
+            and keys == {f"~{prefix}*"} and permissions == _permissions(readonly))
+
+# the restore scripts (as lines, the first one is the AUTH) of the users whose ACL does not match, with their state
+# the users already matching are marked unchanged in their state, the ACL of a user without
+# a stored password is left untouched (a reset would drop its real password) and marked skipped,
+# and a user that cannot be checked is logged and skipped
+def restore_commands(current, entries, data):
+    """
+    >>> import hashlib
+    >>> current = {"demo": {"on", "#" + hashlib.sha256(b"pwd").hexdigest(), "~demo:*", "+@all"}}
+    >>> data = {"redis_password": "admin"}
+    >>> entries = [({}, UserConfig({"namespace": ns, "redis": {"password": pwd}}), False) for ns, pwd in [("demo", "pwd"), ("nopwd", None), ("other", "x")]]
+    >>> entries.append(({}, UserConfig({"redis": {"password": "y"}}), False))
+    >>> [lines[1:] for _, lines in restore_commands(current, entries, data)]
+    [['ACL SETUSER other reset on >x ~other:* +@all']]
+    >>> [state for state, _, _ in entries]
+    [{'redis': 'unchanged'}, {'redis': 'skipped'}, {}, {}]
+    >>> [line for line in render_redis_script("nopwd", "redis_manage_user_tpl.txt", dict(data, namespace="nopwd", password=None, mode="restore")).splitlines() if line.strip()]
+    ['AUTH admin']
+    """
+    res = []
+    for state, ucfg, readonly in entries:
+        namespace = ucfg.get('namespace')
+        try:
+            password, prefix = ucfg.get('redis.password'), _user_prefix(ucfg)
+            if password is None:
+                logging.warning(f"no redis password stored for {namespace}, its ACL is left untouched")
+                state['redis'] = "skipped"
+                continue
+            if acl_matches(current.get(namespace), password, prefix, readonly):
+                state['redis'] = "unchanged"
+                continue
+            if readonly:
+                logging.warn(f"activating {prefix} in read-only mode")
+            user = dict(data, prefix=prefix, namespace=namespace, password=password, mode=readonly and "restore_readonly" or "restore")
+            lines = [line for line in render_redis_script(namespace,"redis_manage_user_tpl.txt",user).splitlines() if line.strip()]
+            res.append((state, lines))
+        except Exception as e:
+            logging.error(f"cannot restore the redis namespace {namespace}: {e}")
+    return res
+
+def restore_db_users(entries):
+    """
+    Restore the ACLs of many users, entries are (state, ucfg, readonly).
+    The current ACLs are read with one ACL LIST and only the missing or changed users
+    are set again, all in one redis-cli session, the result of each user is stored in its state
+    """
+    for state, _, _ in entries:
+        state['redis'] = None
+    if not entries:
+        return
+
+    logging.info(f"restoring {len(entries)} redis namespaces")
+    try:
+        wait_for_redis_ready()
+        data = util.get_redis_config_data()
+        pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
+        if not pod_name:
+            return
+
+        current = parse_acl_list(exec_redis_command(pod_name, render_redis_script("default","redis_manage_user_tpl.txt",dict(data, mode="list"))))
+        restores = restore_commands(current, entries, data)
+        logging.info(f"{len(restores)} of {len(entries)} redis namespaces to restore")
+        if not restores:
+            return
+
+        auth = restores[0][1][0]
+        changed = [state for state, _ in restores]
+        commands = [lines[1:] for _, lines in restores]
+        script = "\n".join([auth] + [line for lines in commands for line in lines]) + "\n"
+        replies = split_replies(exec_redis_command(pod_name, script), [len(lines) for lines in commands])
+        for state, reply in zip(changed, replies):
+            state['redis'] = reply and "\n".join(reply)
+    except Exception as e:
+        logging.error(f"failed to restore {len(entries)} redis namespaces: {e}")
+
 def delete_db_user(namespace):
     logging.info(f"removing redis namespace {namespace}")
 
@@ -209,11 +383,11 @@ def delete_db_user(namespace):
         data["namespace"]=namespace
         data["mode"]="delete"
 
-        path_to_script = render_redis_script(namespace,"redis_manage_user_tpl.txt",data)
+        script = render_redis_script(namespace,"redis_manage_user_tpl.txt",data)
         pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
         if(pod_name):
-            res = exec_redis_command(pod_name,path_to_script)
+            res = exec_redis_command(pod_name,script)
             return res
 
         return None
@@ -17,7 +17,8 @@
 #
 import logging, json,  os
 
-import nuvolaris.redis as redis
+import nuvolaris.lazy as lazy
+redis = lazy.module("nuvolaris.redis")
 import nuvolaris.util as util
 import nuvolaris.kube as kube
 import nuvolaris.template as ntp
@@ -55,9 +56,7 @@ class RedisClient:
         """
         uses the given template to render a redis-cli script to be executed.
         """  
-        out = f"/tmp/__{template}"
-        file = ntp.spool_template(template, out, data)
-        return os.path.abspath(file)      
+        return ntp.spool_temp(template, data)
 
     def exec_lua_script(self, prefix):
         """
@@ -95,11 +94,11 @@ class RedisClient:
 
         try:
             redis.wait_for_redis_ready()
-            path_to_script = redis.render_redis_script(namespace,"redis_manage_user_tpl.txt",self._data)
+            script = redis.render_redis_script(namespace,"redis_manage_user_tpl.txt",self._data)
             pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
             if(pod_name):
-                res = redis.exec_redis_command(pod_name,path_to_script)              
+                res = redis.exec_redis_command(pod_name,script)              
                 return res
             return None
         except Exception as e:
@@ -118,11 +117,11 @@ class RedisClient:
 
         try:
             redis.wait_for_redis_ready()
-            path_to_script = redis.render_redis_script(namespace,"redis_manage_user_tpl.txt",self._data)
+            script = redis.render_redis_script(namespace,"redis_manage_user_tpl.txt",self._data)
             pod_name = util.get_pod_name("{.items[?(@.metadata.labels.name == 'redis')].metadata.name}")
 
             if(pod_name):
-                res = redis.exec_redis_command(pod_name,path_to_script)              
+                res = redis.exec_redis_command(pod_name,script)              
                 return res
             return None
         except Exception as e:
@@ -16,11 +16,13 @@
 # under the License.
 #
 import nuvolaris.kustomize as kus
+import nuvolaris.annotator as annotator
 import nuvolaris.kube as kube
 import nuvolaris.config as cfg
 import nuvolaris.util as util
 import logging
-import kopf
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import os
 import nuvolaris.apihost_util as apihost_util
 import nuvolaris.openwhisk as openwhisk
@@ -40,7 +42,7 @@ def create_external_registry(data, owner=None):
     registrySecret = SecretHtpasswordData(data['registryUsername'],data['registryPassword'])
     registrySecret.with_secret_name("registry-auth-secret")
     path_to_template_yaml = registrySecret.render_template("nuvolaris")
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     #set the registry pull secret
@@ -48,7 +50,7 @@ def create_external_registry(data, owner=None):
     registryPullSecret.with_secret_name("registry-pull-secret")
     path_to_template_yaml = registryPullSecret.render_template("nuvolaris")
     
-    res += kube.kubectl("apply", "-f",path_to_template_yaml)
+    res += kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
     _annotate_registry_metadata(data)
     
@@ -105,6 +107,7 @@ def create(owner=None):
     else:
         return create_external_registry(data, owner)
     
+@annotator.batched
 def _annotate_registry_metadata(data):
     """
     annotate nuvolaris configmap with entries for registry connectivity REGISTRY_ENDPOINT, REGISTRY_USERNAME, RESIGTRY_PASSWORD    
@@ -170,7 +173,7 @@ def deploy_registry_route(data, namespace="nuvolaris"):
 
     logging.info("*** configuring registry route for service nuvolaris-registry-svc:5000")
     path_to_template_yaml = route.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)        
     return res
 
@@ -194,12 +197,12 @@ def deploy_registry_ingress(data, namespace="nuvolaris"):
     if ingress.requires_traefik_middleware():
         logging.info("*** configuring traefik middleware for registry ingress")
         path_to_template_yaml = ingress.render_traefik_middleware_template(namespace)
-        res = kube.kubectl("apply", "-f",path_to_template_yaml)
+        res = kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)
 
     logging.info("*** configuring static ingress for registry")
     path_to_template_yaml = ingress.render_template(namespace)
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     return res
@@ -0,0 +1,264 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# content addressed cache of the rendered kustomizations
+# the key is the hash of everything the render reads: the kustomization,
+# the files of the folder and the expanded templates (so the data enters
+# the key already canonicalised by the expansion)
+# entries are kept in memory and on disk, both limited in size and evicting
+# the least recently used ones, and the key of the last render of each
+# folder of a workspace is remembered on disk, so a folder can be built again after a restart
+# the disk cache is private to the user (0700/0600) and renders with secrets are written
+# only without their data, usable to build again the folder but not as cache entries
+import os, json, hashlib, logging, threading
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get("NUVOLARIS_RENDER_CACHE", os.path.expanduser("~/.cache/nuvolaris/render"))
+MEMORY_LIMIT = int(os.environ.get("NUVOLARIS_RENDER_CACHE_MEMORY", str(32 * 1024 * 1024)))
+DISK_LIMIT = int(os.environ.get("NUVOLARIS_RENDER_CACHE_DISK", str(128 * 1024 * 1024)))
+
+_lock = threading.Lock()
+_memory = OrderedDict()
+_memory_size = 0
+_digests = {}
+_stats = {"hits": 0, "misses": 0}
+
+# digest of a source file, memoized on its size and modification time
+def _file_digest(path):
+    st = os.stat(path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _lock:
+        cached = _digests.get(path)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    with _lock:
+        _digests[path] = (stamp, digest)
+    return digest
+
+# the key of the render of a folder of the workspace
+# the written files are included only if referenced by the kustomization,
+# leftovers of other renders of the same folder do not change the key
+def key(ws, where):
+    """
+    >>> import nuvolaris.workspace as nws
+    >>> ws = nws.Workspace()
+    >>> ws.write("test/kustomization.yaml", "resources:\\n- pod.yaml\\n- __x.yaml\\n")
+    >>> ws.write("test/__x.yaml", "a")
+    >>> k1 = key(ws, "test")
+    >>> ws.write("test/__unused.yaml", "b")
+    >>> k1 == key(ws, "test")
+    True
+    >>> ws.write("test/__x.yaml", "c")
+    >>> k1 == key(ws, "test")
+    False
+    """
+    kust = ws.read(f"{where}/kustomization.yaml")
+    h = hashlib.sha256()
+    h.update(where.encode("utf-8"))
+    h.update(b"\0")
+    h.update(kust.encode("utf-8"))
+    written = ws.snapshot(where)
+    for name in ws.listdir(where):
+        if name == "kustomization.yaml":
+            continue
+        path = os.path.normpath(os.path.join(where, name))
+        if path in written:
+            if name not in kust:
+                continue
+            digest = hashlib.sha256(written[path].encode("utf-8")).hexdigest()
+        else:
+            file = os.path.join(ws.root, path)
+            if not os.path.isfile(file):
+                continue
+            digest = _file_digest(file)
+        h.update(f"\0{name}\0{digest}".encode("utf-8"))
+    return h.hexdigest()
+
+def _disk_path(*parts):
+    return os.path.join(CACHE_DIR, *parts)
+
+# the file of the last key of a folder of a workspace
+def _last_path(name, where):
+    return _disk_path("last", name.replace("/", "_"), where.replace("/", "_"))
+
+# the items without the data of the secrets
+def _redacted(items):
+    """
+    >>> _redacted([{"kind": "Secret", "metadata": {"name": "s"}, "data": {"p": "eA=="}}, {"kind": "Pod"}])
+    [{'kind': 'Secret', 'metadata': {'name': 's'}}, {'kind': 'Pod'}]
+    """
+    return [{k: v for k, v in item.items() if k not in ["data", "stringData"]} if item.get("kind") == "Secret" else item for item in items]
+
+# write a file readable only by the user, replacing it atomically
+def _write_private(path, text):
+    tmp = f"{path}.{threading.get_ident()}"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def _disk_get(k, suffix="json"):
+    if not CACHE_DIR:
+        return None
+    path = _disk_path(f"{k}.{suffix}")
+    try:
+        with open(path) as f:
+            text = f.read()
+        os.utime(path)
+        return text
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"cannot read the render cache entry {k}: {e}")
+        return None
+
+def _disk_evict():
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith("json"):
+            st = os.stat(_disk_path(name))
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(e[1] for e in entries)
+    for _, size, name in sorted(entries):
+        if total <= DISK_LIMIT:
+            break
+        os.remove(_disk_path(name))
+        total -= size
+
+# write an entry and the last key of the folder of the workspace
+# the render of secrets is written redacted, with another suffix
+def _disk_put(k, items, text, where, name):
+    if not CACHE_DIR:
+        return
+    try:
+        last = _last_path(name, where)
+        os.makedirs(os.path.dirname(last), mode=0o700, exist_ok=True)
+        os.chmod(CACHE_DIR, 0o700)
+        redacted = _redacted(items)
+        if redacted != items:
+            _write_private(_disk_path(f"{k}.redacted-json"), json.dumps(redacted))
+        else:
+            _write_private(_disk_path(f"{k}.json"), text)
+        _write_private(last, k)
+        _disk_evict()
+    except Exception as e:
+        logging.warning(f"cannot write the render cache entry {k}: {e}")
+
+def _memory_put(k, text):
+    global _memory_size
+    with _lock:
+        if k in _memory:
+            _memory.move_to_end(k)
+            return
+        _memory[k] = text
+        _memory_size += len(text)
+        while _memory_size > MEMORY_LIMIT and len(_memory) > 1:
+            _, old = _memory.popitem(last=False)
+            _memory_size -= len(old)
+
+# the cached items of a key, or None
+# every hit returns a new copy of the items, so callers can modify them
+def get(k):
+    with _lock:
+        text = _memory.get(k)
+        if text is not None:
+            _memory.move_to_end(k)
+    if text is None:
+        text = _disk_get(k)
+        if text is not None:
+            _memory_put(k, text)
+    with _lock:
+        _stats["hits" if text is not None else "misses"] += 1
+    if text is None:
+        return None
+    return json.loads(text)
+
+def put(k, where, items, name="default"):
+    try:
+        text = json.dumps(items)
+    except Exception as e:
+        logging.warning(f"cannot cache the render of {where}: {e}")
+        return
+    _memory_put(k, text)
+    _disk_put(k, items, text, where, name)
+
+# the items of the last render of a folder in the named workspace, also from a previous run
+# (the secrets without their data, if read from the disk)
+def last(where, name="default"):
+    if not CACHE_DIR:
+        return None
+    try:
+        with open(_last_path(name, where)) as f:
+            k = f.read().strip()
+    except FileNotFoundError:
+        return None
+    items = get(k)
+    if items is None:
+        text = _disk_get(k, "redacted-json")
+        items = text and json.loads(text)
+    return items
+
+# render a folder of the workspace, using the cache
+def render(ws, where, function):
+    """
+    >>> import nuvolaris.workspace as nws
+    >>> import uuid
+    >>> ws = nws.Workspace()
+    >>> ws.write("test/kustomization.yaml", f"# {uuid.uuid4()}\\nresources:\\n- pod.yaml\\n")
+    >>> calls = []
+    >>> def fn(): calls.append(1); return [{"kind": "Pod"}]
+    >>> render(ws, "test", fn) == render(ws, "test", fn), len(calls)
+    (True, 1)
+    >>> render(ws, "test", fn)[0]["kind"] = "Changed"
+    >>> render(ws, "test", fn)[0]["kind"], last("test")[0]["kind"]
+    ('Pod', 'Pod')
+
+    the secrets are not written on disk, and each workspace has its own last render
+
+    >>> other = nws.Workspace(name="wsku/other")
+    >>> other.write("test/kustomization.yaml", f"# {uuid.uuid4()}\\nresources:\\n- pod.yaml\\n")
+    >>> def secret(): return [{"kind": "Secret", "metadata": {"name": "s"}, "stringData": {"password": "p4ss"}}]
+    >>> render(other, "test", secret) == secret(), last("test")[0]["kind"]
+    (True, 'Pod')
+    >>> clear()
+    >>> get(key(other, "test")), last("test", "wsku/other")
+    (None, [{'kind': 'Secret', 'metadata': {'name': 's'}}])
+    >>> stat = os.stat(CACHE_DIR); oct(stat.st_mode & 0o777)
+    '0o700'
+    """
+    try:
+        k = key(ws, where)
+    except Exception as e:
+        logging.warning(f"cannot compute the render cache key of {where}: {e}")
+        return function()
+    items = get(k)
+    if items is None:
+        items = function()
+        put(k, where, items, ws.name)
+    return items
+
+def stats():
+    with _lock:
+        return dict(_stats, entries=len(_memory), size=_memory_size)
+
+def clear():
+    global _memory_size
+    with _lock:
+        _memory.clear()
+        _memory_size = 0
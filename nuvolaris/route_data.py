@@ -82,6 +82,4 @@ class RouteData:
         """
         uses the given template to render a final route template and returns the path to the template
         """  
-        out = f"/tmp/__{namespace}_{tpl}"
-        file = ntp.spool_template(tpl, out, self._data)
-        return os.path.abspath(file)                  
\ No newline at end of file
+        return ntp.spool_temp(tpl, self._data, f"{namespace}_")
\ No newline at end of file
@@ -15,8 +15,11 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, time, os
+import logging, time, os
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
+import nuvolaris.annotator as annotator
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
 import nuvolaris.util as util
@@ -92,6 +95,7 @@ def create(owner=None):
     logging.info("*** configured seaweedfs standalone")
     return res
 
+@annotator.batched
 def _annotate_nuv_metadata(data):
     """
     annotate nuvolaris configmap with entries for minio connectivity S3_ENDPOINT, S3_PORT, S3_ACCESS_KEY, S3_SECRET_KEY
@@ -24,6 +24,7 @@ import nuvolaris.template as ntp
 import nuvolaris.util as util
 import os
 import nuvolaris.kube as kube
+import nuvolaris.pod_exec as pod_exec
 from types import NoneType
 from typing import Optional
 
@@ -86,8 +87,7 @@ class SeaweedfsClient:
 
     def _exec_weed_command(self,command):
         logging.debug(f"executing command: {command} inside pod {self.pod_name}")
-        res = kube.kubectl("exec","-it",self.pod_name,"--","/bin/sh","-c",f"echo '{command}' | weed shell")
-        return res                               
+        return pod_exec.check_output(self.pod_name, "weed shell", f"{command}\n")                               
 
     def make_bucket(self, bucket_name, quota_in_mb=None):
         """
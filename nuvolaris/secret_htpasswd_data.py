@@ -60,9 +60,7 @@ class SecretHtpasswordData:
         uses the given template to render a final htpassword secret template and returns the path to the template
         """
         logging.info(f"*** Rendering htpassword secret template with name {self._data['secret_name']} via template {tpl}")
-        out = f"/tmp/__{namespace}_{tpl}"
-        file = ntp.spool_template(tpl, out, self._data)
-        return os.path.abspath(file)
+        return ntp.spool_temp(tpl, self._data, f"{namespace}_")
     
     def generateHtPasswordPatch(self):
         """
@@ -0,0 +1,205 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# accounting of the child processes (kubectl, mc, wsk) and of the kube api calls
+# every spawn (or call) is recorded with its argv class, the handler running it,
+# wall time, cpu time, output size and outcome (ok, error or timeout)
+# handlers decorated with @spawn.accounted log a summary when they end,
+# and the totals are available as json (dumped to NUVOLARIS_SPAWN_REPORT if set)
+import contextvars, functools, inspect, json, logging, os, resource, subprocess, threading, time
+
+UNATTRIBUTED = "-"
+OK, ERROR, TIMEOUT = "ok", "error", "timeout"
+# the prefix of the classes of the kube api calls
+API = "api "
+REPORT_FILE = os.environ.get("NUVOLARIS_SPAWN_REPORT")
+
+_handler = contextvars.ContextVar("nuvolaris_spawn_handler", default=None)
+_lock = threading.Lock()
+_totals = {}
+
+# kubectl flags taking a value, skipped when looking for the subcommand
+_global_flags = ["-n", "--namespace", "--apihost", "--auth", "-u", "--context", "--kubeconfig"]
+
+# the class of a command line: the program and its first subcommand
+def argv_class(cmd):
+    """
+    >>> argv_class(["kubectl", "-n", "nuvolaris", "apply", "-f", "-"])
+    'kubectl apply'
+    >>> argv_class(["wsk", "--apihost", "http://controller:3233", "--auth", "x", "action", "update"])
+    'wsk action'
+    >>> argv_class(["/usr/bin/mc"])
+    'mc'
+    """
+    prog = os.path.basename(cmd[0])
+    i = 1
+    while i < len(cmd):
+        arg = str(cmd[i])
+        if arg in _global_flags:
+            i += 2
+        elif arg.startswith("-"):
+            i += 1
+        else:
+            return f"{prog} {arg}"
+    return prog
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+class Recorder:
+    """
+    collects the spawns of one handler invocation
+
+    >>> r = Recorder("whisk_create")
+    >>> r.add("kubectl apply", 1.5, 0.2, 120)
+    >>> r.add("kubectl apply", 0.5, 0.1, 80, "error")
+    >>> r.add("kustomize build", 0.25, 0.2, 2000)
+    >>> r.summary()
+    'whisk_create: 3 spawns, 2.2s, 2.0s in kubectl apply (2, 1 error), 0.2s in kustomize build (1)'
+    >>> r.add("api GET pods", 0.05, 0.0, 300, "timeout")
+    >>> r.summary()
+    'whisk_create: 3 spawns, 1 api calls, 2.3s, 2.0s in kubectl apply (2, 1 error), 0.2s in kustomize build (1), 0.1s in api GET pods (1, 1 timeout)'
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def add(self, cls, wall, cpu, output, outcome=OK):
+        with self.lock:
+            _add(self.stats, cls, wall, cpu, output, outcome)
+
+    def summary(self):
+        count = sum(s["count"] for cls, s in self.stats.items() if not cls.startswith(API))
+        calls = sum(s["count"] for cls, s in self.stats.items() if cls.startswith(API))
+        wall = sum(s["wall"] for s in self.stats.values())
+        parts = [f"{self.handler}: {count} spawns"] + (calls and [f"{calls} api calls"] or []) + [f"{wall:.1f}s"]
+        for cls, s in sorted(self.stats.items(), key=lambda x: -x[1]["wall"]):
+            failures = "".join(f", {s[outcome]} {outcome}" for outcome in [ERROR, TIMEOUT] if s.get(outcome))
+            parts.append(f"{s['wall']:.1f}s in {cls} ({s['count']}{failures})")
+        return ", ".join(parts)
+
+def _add(stats, cls, wall, cpu, output, outcome):
+    s = stats.setdefault(cls, {"count": 0, "wall": 0.0, "cpu": 0.0, "output": 0})
+    s["count"] += 1
+    s["wall"] += wall
+    s["cpu"] += cpu
+    s["output"] += output
+    if outcome != OK:
+        s[outcome] = s.get(outcome, 0) + 1
+
+# record a spawn or a call, attributed to the current handler
+def record(cls, wall, cpu, output, outcome=OK):
+    recorder = _handler.get()
+    if recorder:
+        recorder.add(cls, wall, cpu, output, outcome)
+    name = recorder and recorder.handler or UNATTRIBUTED
+    with _lock:
+        _add(_totals.setdefault(name, {}), cls, wall, cpu, output, outcome)
+
+# same as subprocess.run, recording the cost of the spawn
+# also when it fails to start, raises or times out
+# the cpu time is taken from the children usage, so it is approximate
+# when other processes end at the same time
+def run(cmd, **kwargs):
+    """
+    >>> reset()
+    >>> run(["true"]).returncode, run(["false"]).returncode
+    (0, 1)
+    >>> try: run(["sleep", "5"], timeout=0.1)
+    ... except subprocess.TimeoutExpired: print("timeout")
+    timeout
+    >>> try: run(["/nonexistent"])
+    ... except FileNotFoundError: print("not found")
+    not found
+    >>> totals = report()[UNATTRIBUTED]
+    >>> totals["true"]["count"], totals["false"]["error"], totals["sleep 5"]["timeout"], totals["nonexistent"]["error"]
+    (1, 1, 1, 1)
+    """
+    start = time.monotonic()
+    cpu = _children_cpu()
+    res, outcome = None, ERROR
+    try:
+        res = subprocess.run(cmd, **kwargs)
+        outcome = res.returncode == 0 and OK or ERROR
+        return res
+    except subprocess.TimeoutExpired:
+        outcome = TIMEOUT
+        raise
+    finally:
+        wall = time.monotonic() - start
+        cpu = _children_cpu() - cpu
+        output = res and len(res.stdout or b"") + len(res.stderr or b"") or 0
+        record(argv_class(cmd), wall, cpu, output, outcome)
+
+# the totals by handler and argv class
+def report():
+    with _lock:
+        return json.loads(json.dumps(_totals))
+
+def report_json():
+    return json.dumps(report(), indent=2, sort_keys=True)
+
+def dump(path=None):
+    path = path or REPORT_FILE
+    if path:
+        with open(path, "w") as f:
+            f.write(report_json())
+
+def reset():
+    with _lock:
+        _totals.clear()
+
+def _report(recorder):
+    if recorder.stats:
+        logging.info(f"spawns {recorder.summary()}")
+        try:
+            dump()
+        except Exception as e:
+            logging.warning(f"cannot write the spawn report: {e}")
+
+# decorator attributing the spawns of the function (or coroutine) to a handler name
+def accounted(name):
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if _handler.get():
+                    return await function(*args, **kwargs)
+                recorder = Recorder(name)
+                token = _handler.set(recorder)
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    _handler.reset(token)
+                    _report(recorder)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _handler.get():
+                return function(*args, **kwargs)
+            recorder = Recorder(name)
+            token = _handler.set(recorder)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _handler.reset(token)
+                _report(recorder)
+        return wrapper
+    return decorator
@@ -15,7 +15,9 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import kopf, logging, json, os
+import logging, json, os
+import nuvolaris.lazy as lazy
+kopf = lazy.module("kopf")
 import nuvolaris.kube as kube
 import nuvolaris.kustomize as kus
 import nuvolaris.config as cfg
@@ -103,7 +105,7 @@ def deploy_content_route_template(namespace, bucket, url):
     
     path_to_template_yaml =  content.render_template(namespace)
     
-    res = kube.kubectl("apply", "-f",path_to_template_yaml)
+    res = kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
     return res
 
@@ -124,12 +126,12 @@ def deploy_content_ingress_template(namespace, bucket, url):
     if content.requires_traefik_middleware():
         logging.info("*** configuring traefik middleware")
         path_to_template_yaml = content.render_traefik_middleware_template(namespace)
-        res += kube.kubectl("apply", "-f",path_to_template_yaml)
+        res += kube.apply_file(path_to_template_yaml)
         os.remove(path_to_template_yaml)
 
     logging.info(f"*** configuring static ingress endpoint for {namespace}")
     path_to_template_yaml = content.render_template(namespace)
-    res += kube.kubectl("apply", "-f",path_to_template_yaml)
+    res += kube.apply_file(path_to_template_yaml)
     os.remove(path_to_template_yaml)
 
     return res
@@ -15,22 +15,80 @@
 # specific language governing permissions and limitations
 # under the License.
 #
-import os, re
+# the jinja environment shared by all the modules
+# compiled templates are stored in a bytecode cache (precompiled when the image is built)
+# and the output of the expansions is memoized on the template and the data
+import os, re, json, logging, tempfile, threading, atexit
+from collections import OrderedDict
+
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+BYTECODE_CACHE = os.environ.get("NUVOLARIS_TEMPLATE_CACHE", "./nuvolaris/__pycache__/jinja")
+RENDER_CACHE_SIZE = int(os.environ.get("NUVOLARIS_TEMPLATE_RENDERS", "256"))
+
+# a bytecode cache that is only read when the folder is not writable
+class _BytecodeCache(FileSystemBytecodeCache):
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError as e:
+            logging.debug(f"cannot store the bytecode of {bucket.key}: {e}")
+
+def _bytecode_cache():
+    try:
+        os.makedirs(BYTECODE_CACHE, exist_ok=True)
+    except OSError:
+        pass
+    if os.path.isdir(BYTECODE_CACHE):
+        return _BytecodeCache(BYTECODE_CACHE)
+    return None
 
-from jinja2 import Environment, FileSystemLoader
 loader = FileSystemLoader(["./nuvolaris/templates", "./nuvolaris/files", "./nuvolaris/policies"])
-env = Environment(loader=loader)
+env = Environment(loader=loader, bytecode_cache=_bytecode_cache())
+
+_renders = OrderedDict()
+_renders_lock = threading.Lock()
+
+# compile all the templates, storing them in the bytecode cache
+def precompile():
+    count = 0
+    for template in env.list_templates():
+        try:
+            env.get_template(template)
+            count += 1
+        except Exception as e:
+            logging.warning(f"cannot compile {template}: {e}")
+    return count
+
+# entrypoint used when building the image
+def main():
+    print(f"compiled {precompile()} templates in {BYTECODE_CACHE}")
 
 # expand template
+# the output is memoized when the data can be serialized
 def expand_template(template, data):
     """
     >>> import json
     >>> json.loads(expand_template("test.json", {"item": "hello"}))
     {'_id': 'test', 'value': 'hello'}
+    >>> expand_template("test.json", {"item": "hello"}) is expand_template("test.json", {"item": "hello"})
+    True
     """
-    tpl = env.get_template(template)
-    return tpl.render(data)
-    #doc = json.loads(tpl.render(data))
+    try:
+        key = (template, json.dumps(data, sort_keys=True))
+    except (TypeError, ValueError):
+        key = None
+    if key:
+        with _renders_lock:
+            if key in _renders:
+                _renders.move_to_end(key)
+                return _renders[key]
+    res = env.get_template(template).render(data)
+    if key:
+        with _renders_lock:
+            _renders[key] = res
+            while len(_renders) > RENDER_CACHE_SIZE:
+                _renders.popitem(last=False)
+    return res
 
 
 # expond template and save in a file
@@ -44,6 +102,48 @@ def spool_template(template, file, data):
         f.write(expand_template(template, data))
     return file
 
+_spooled = set()
+_spooled_lock = threading.Lock()
+
+# expand a template in a new file under /tmp, so concurrent renders never share a file
+# the file is removed by the caller (with discard or os.remove) or when the operator exits
+def spool_temp(template, data, prefix=""):
+    """
+    >>> import nuvolaris.testutil as tu
+    >>> a, b = spool_temp("test.json", {"item": "a"}), spool_temp("test.json", {"item": "b"})
+    >>> a != b, a.startswith("/tmp/__"), a.endswith("_test.json")
+    (True, True, True)
+    >>> tu.grep(tu.fread(b), r"value")
+    "value": "b"
+    >>> discard(a); discard(b); os.path.exists(a)
+    False
+    """
+    fd, file = tempfile.mkstemp(prefix=f"__{prefix}", suffix=f"_{template}", dir="/tmp")
+    with os.fdopen(fd, "w") as f:
+        f.write(expand_template(template, data))
+    with _spooled_lock:
+        # forget the files already removed by their callers
+        if len(_spooled) >= 256:
+            _spooled.difference_update([f for f in _spooled if not os.path.exists(f)])
+        _spooled.add(file)
+    return file
+
+# remove a file created by spool_temp, other files are left untouched
+def discard(file):
+    with _spooled_lock:
+        if file not in _spooled:
+            return
+        _spooled.discard(file)
+    try:
+        os.remove(file)
+    except OSError:
+        pass
+
+@atexit.register
+def _discard_all():
+    for file in list(_spooled):
+        discard(file)
+
 
 # expand a line of a .tpl.yml interpreting '#' comments as follows:
 # if there is #!, the entire line will be removed
@@ -81,4 +181,3 @@ def process_tpl_line(line):
         line = re.sub(r"-.*#-(.*)$", r"-\1", line, count=1)
     line = re.sub(r"#\\([!#-:~])", r"#\1", line)
     return line
-
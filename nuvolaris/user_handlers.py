@@ -16,7 +16,7 @@
 # under the License.
 #
 # Provides extra kopf handlers to manage nuvolaris users
-import logging
+import logging, os, json, functools
 from datetime import datetime
 
 import kopf
@@ -26,6 +26,11 @@ import nuvolaris.couchdb as cdb
 import nuvolaris.endpoint as endpoint
 import nuvolaris.ferretdb as mdb
 import nuvolaris.kube as kube
+import nuvolaris.spawn as spawn
+import nuvolaris.aio as aio
+import nuvolaris.depgraph as depgraph
+import nuvolaris.batch as batch
+import nuvolaris.workqueue as workqueue
 import nuvolaris.milvus_standalone as milvus
 import nuvolaris.minio_deploy as minio_deploy
 import nuvolaris.postgres_operator as postgres
@@ -39,125 +44,232 @@ from nuvolaris.user_config import UserConfig
 from nuvolaris.user_metadata import UserMetadata
 
 
+# the services provisioned for a user and the ones they depend on
+# the static endpoint serves the bucket created by the object storage
+USER_DEPENDENCIES = {
+    "static": ["minio", "seaweedfs"]
+}
+
+USER_WORKERS = int(os.environ.get("NUVOLARIS_USER_WORKERS", "4"))
+
+# the services provisioned with one call for a batch of users
+BULK_SERVICES = {
+    "couchdb": cdb.create_ow_users,
+    "redis": redis.create_db_users,
+    "postgres": postgres.create_db_users,
+    "minio": minio_deploy.create_ow_storages
+}
+
+# the users created within the window are provisioned as a batch, 0 disables the batches
+USER_BATCH_WINDOW = float(os.environ.get("NUVOLARIS_USER_BATCH_WINDOW", "0"))
+USER_BATCH_SIZE = int(os.environ.get("NUVOLARIS_USER_BATCH_SIZE", "100"))
+
+# the users resumed within the window restore their redis acls together
+RESUME_BATCH_WINDOW = float(os.environ.get("NUVOLARIS_RESUME_BATCH_WINDOW", "2"))
+RESUME_BATCH_SIZE = int(os.environ.get("NUVOLARIS_RESUME_BATCH_SIZE", "1000"))
+
+# the wsku events, admitted by priority within the limits of the "wsku" backend
+queue = workqueue.WorkQueue("wsku")
+
 def get_ucfg(spec):
     ucfg = UserConfig(spec)
     ucfg.dump_config()
     return ucfg
 
-@kopf.on.create('nuvolaris.org', 'v1', 'whisksusers')
-def whisk_user_create(spec, name, patch, **kwargs):
-    logging.info(f"*** whisk_user_create {name}")
-    conditions = []
-    state = {
-    }
-
-    conditions.append({        
-        "lastTransitionTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "status": "True",
-        "type": "Initialized"})
+# store in the state the result of a provisioning function
+def _provision(state, key, message, function, *args):
+    res = function(*args)
+    logging.info(f"{message} = {res}")
+    state[key] = res
+
+# provision (or tear down) the services concurrently, each one with its own state and user metadata
+# merged in a stable order when completed, then raise the first error if any
+# the services already provisioned (in bulk) are given with their parts and results
+def provision(services, state, user_metadata=None, reverse=False, parts=None, done=None):
+    done = done or {}
+    parts = parts or {name: ({}, user_metadata and user_metadata.fork()) for name in services}
+    tasks = {name: workqueue.throttled(name, functools.partial(function, *parts[name])) for name, function in services.items() if name not in done}
+    res = dict(done, **depgraph.run(tasks, USER_DEPENDENCIES, USER_WORKERS, reverse))
+    for name in services:
+        if res[name] is None:
+            state.update(parts[name][0])
+            if user_metadata:
+                user_metadata.merge(parts[name][1])
+    depgraph.check(res)
+
+# the services to create for a user
+def create_services(ucfg, owner):
+    namespace = ucfg.get('namespace')
+    services = {}
 
-    ucfg = get_ucfg(spec)
-    user_metadata = UserMetadata(ucfg)
-    owner = kube.get(f"wsku/{name}")
-    
     if(ucfg.get("namespace") and ucfg.get("auth")):
-        res = cdb.create_ow_user(ucfg,user_metadata)       
-        logging.info(f"OpenWhisk subject {ucfg.get('namespace')} added = {res}")
-        state['couchdb']= res
-
-        res = endpoint.create_ow_api_endpoint(ucfg,user_metadata)
-        logging.info(f"OpenWhisk api endpoints {ucfg.get('namespace')} added = {res}")
-        state['api']= res
+        services['couchdb'] = lambda st, md: _provision(st, 'couchdb', f"OpenWhisk subject {namespace} added", cdb.create_ow_user, ucfg, md)
+        services['api'] = lambda st, md: _provision(st, 'api', f"OpenWhisk api endpoints {namespace} added", endpoint.create_ow_api_endpoint, ucfg, md)
 
     if(cfg.get('components.minio') and (ucfg.get('object-storage.data.enabled') or ucfg.get('object-storage.route.enabled'))):        
-        minio_deploy.create_ow_storage(state, ucfg, user_metadata, owner)
+        services['minio'] = lambda st, md: minio_deploy.create_ow_storage(st, ucfg, md, owner)
 
     if(cfg.get('components.seaweedfs') and (ucfg.get('object-storage.data.enabled') or ucfg.get('object-storage.route.enabled'))):        
-        seaweedfs.create_ow_storage(state, ucfg, user_metadata, owner)        
+        services['seaweedfs'] = lambda st, md: seaweedfs.create_ow_storage(st, ucfg, md, owner)
 
     if((cfg.get('components.minio') or cfg.get('components.seaweedfs')) and ucfg.get('object-storage.route.enabled') and cfg.get('components.static')):
-        res = static.create_ow_static_endpoint(ucfg,user_metadata, owner)
-        logging.info("OpenWhisk static endpoint for %s added = %s", ucfg.get('namespace'), res)
-        state['static']= res
+        services['static'] = lambda st, md: _provision(st, 'static', f"OpenWhisk static endpoint for {namespace} added", static.create_ow_static_endpoint, ucfg, md, owner)
 
     if(cfg.get('components.mongodb') and ucfg.get('mongodb.enabled')):
-        res = mdb.create_db_user(ucfg,user_metadata)
-        logging.info(f"Mongodb setup for {ucfg.get('namespace')} added = {res}")
-        state['mongodb']= res
+        services['mongodb'] = lambda st, md: _provision(st, 'mongodb', f"Mongodb setup for {namespace} added", mdb.create_db_user, ucfg, md)
 
     if(cfg.get('components.redis') and ucfg.get('redis.enabled')):
-        res = redis.create_db_user(ucfg, user_metadata)
-        logging.info(f"Redis setup for {ucfg.get('namespace')} added = {res}")
-        state['redis']= res
+        services['redis'] = lambda st, md: _provision(st, 'redis', f"Redis setup for {namespace} added", redis.create_db_user, ucfg, md)
 
     if(cfg.get('components.postgres') and ucfg.get('postgres.enabled')):
-        res = postgres.create_db_user(ucfg, user_metadata)
-        logging.info(f"Postgres setup for {ucfg.get('namespace')} added = {res}")
-        state['postgres']= res 
+        services['postgres'] = lambda st, md: _provision(st, 'postgres', f"Postgres setup for {namespace} added", postgres.create_db_user, ucfg, md)
 
     if(cfg.get('components.milvus') and ucfg.get('milvus.enabled')):
-        res = milvus.create_ow_milvus(ucfg, user_metadata)
-        logging.info(f"Milvus setup for {ucfg.get('namespace')} added = {res}")
-        state['milvus']= res
+        services['milvus'] = lambda st, md: _provision(st, 'milvus', f"Milvus setup for {namespace} added", milvus.create_ow_milvus, ucfg, md)
+
+    return services
+
+def create_user(spec, name):
+    state = {}
+    ucfg = get_ucfg(spec)
+    user_metadata = UserMetadata(ucfg)
+    owner = kube.get(f"wsku/{name}")
+
+    provision(create_services(ucfg, owner), state, user_metadata)
 
     # finally persists user metadata into the internal couchdb database
     user_metadata.dump()
     res = userdb.save_user_metadata(user_metadata)
     state['user_metadata']= res
+    return state
 
-    conditions.append({        
+# create a batch of users (a list of spec and name), the BULK_SERVICES with one call
+# for all the users, the other services of each user as in create_user
+# returns the state of each user, or the exception that failed it
+def create_users(users):
+    logging.info(f"*** creating a batch of {len(users)} users")
+    prepared = []
+    for spec, name in users:
+        try:
+            ucfg = get_ucfg(spec)
+            user_metadata = UserMetadata(ucfg)
+            services = create_services(ucfg, kube.get(f"wsku/{name}"))
+            parts = {service: ({}, user_metadata.fork()) for service in services}
+            prepared.append((ucfg, user_metadata, services, parts))
+        except Exception as e:
+            logging.error(f"cannot prepare the creation of {name}: {e}")
+            prepared.append(e)
+    valid = [user for user in prepared if not isinstance(user, Exception)]
+
+    tasks = {}
+    for service, function in BULK_SERVICES.items():
+        entries = [(parts[service][0], ucfg, parts[service][1]) for ucfg, _, services, parts in valid if service in services]
+        if entries:
+            tasks[service] = workqueue.throttled(service, functools.partial(function, entries))
+    bulk = depgraph.run(tasks, workers=USER_WORKERS)
+
+    def create(user, state):
+        ucfg, user_metadata, services, parts = user
+        done = {service: bulk[service] for service in BULK_SERVICES if service in services}
+        provision(services, state, user_metadata, parts=parts, done=done)
+
+    states = [{} for _ in valid]
+    res = depgraph.run({str(i): functools.partial(create, user, states[i]) for i, user in enumerate(valid)}, workers=USER_WORKERS)
+
+    created = [i for i in range(len(valid)) if res[str(i)] is None]
+    saved = userdb.save_users_metadata([valid[i][1] for i in created])
+    for i, ok in zip(created, saved):
+        states[i]['user_metadata'] = ok
+
+    results, pos = [], 0
+    for user in prepared:
+        if isinstance(user, Exception):
+            results.append(user)
+            continue
+        results.append(res[str(pos)] or states[pos])
+        pos += 1
+    return results
+
+batcher = batch.Batcher(create_users, USER_BATCH_WINDOW, USER_BATCH_SIZE, backend="wsku")
+
+# restore the redis acls of a batch of users (a list of ucfg and read only flag)
+def restore_redis_users(users):
+    entries = [({}, ucfg, readonly) for ucfg, readonly in users]
+    with workqueue.backend("redis"):
+        redis.restore_db_users(entries)
+    return [state['redis'] for state, _, _ in entries]
+
+resume_batcher = batch.Batcher(restore_redis_users, RESUME_BATCH_WINDOW, RESUME_BATCH_SIZE, backend="wsku")
+
+def condition(type):
+    return {
         "lastTransitionTime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "status": "True",
-        "type": "Ready"})
+        "type": type}
+
+@kopf.on.create('nuvolaris.org', 'v1', 'whisksusers')
+@workqueue.queued(queue, "create", hold=USER_BATCH_WINDOW <= 0)
+@spawn.accounted("whisk_user_create")
+async def whisk_user_create(spec, name, patch, **kwargs):
+    logging.info(f"*** whisk_user_create {name}")
+    conditions = [condition("Initialized")]
+
+    if USER_BATCH_WINDOW > 0:
+        state = await batcher.submit((spec, name))
+    else:
+        state = await aio.offload(create_user, spec, name, backend="wsku", workspace=f"wsku/{name}")
 
+    conditions.append(condition("Ready"))
     patch.status['conditions']=conditions
     return state
 
 @kopf.on.delete('nuvolaris.org', 'v1', 'whisksusers')
+@workqueue.queued(queue, "delete")
+@aio.handler("wsku")
+@spawn.accounted("whisk_user_delete")
 def whisk_user_delete(spec, name, **kwargs):
     logging.info(f"*** whisk_user_delete {name}")
 
     ucfg = get_ucfg(spec)
 
-    if(ucfg.get("namespace")):
-        res = endpoint.delete_ow_api_endpoint(ucfg)
-        logging.info(f"OpenWhisk subject {ucfg.get('namespace')} api removed = {res}")
+    namespace = ucfg.get('namespace')
+    services = {}
 
-        res = cdb.delete_ow_user(ucfg.get("namespace"))
-        logging.info(f"OpenWhisk subject {ucfg.get('namespace')} removed = {res}")
+    if(ucfg.get("namespace")):
+        services['api'] = lambda st, md: _provision(st, 'api', f"OpenWhisk subject {namespace} api removed", endpoint.delete_ow_api_endpoint, ucfg)
+        services['couchdb'] = lambda st, md: _provision(st, 'couchdb', f"OpenWhisk subject {namespace} removed", cdb.delete_ow_user, namespace)
 
     if(cfg.get('components.minio') and (ucfg.get('object-storage.data.enabled') or ucfg.get('object-storage.route.enabled'))):        
-        res = minio_deploy.delete_ow_storage(ucfg)
-        logging.info(f"OpenWhisk namespace {ucfg.get('namespace')} MINIO storage removed = {res}")
+        services['minio'] = lambda st, md: _provision(st, 'minio', f"OpenWhisk namespace {namespace} MINIO storage removed", minio_deploy.delete_ow_storage, ucfg)
 
     if(cfg.get('components.seaweedfs') and (ucfg.get('object-storage.data.enabled') or ucfg.get('object-storage.route.enabled'))):        
-        res = seaweedfs.delete_ow_storage(ucfg)
-        logging.info(f"OpenWhisk namespace {ucfg.get('namespace')} SEAWEEDFS storage removed = {res}")         
+        services['seaweedfs'] = lambda st, md: _provision(st, 'seaweedfs', f"OpenWhisk namespace {namespace} SEAWEEDFS storage removed", seaweedfs.delete_ow_storage, ucfg)
 
     if((cfg.get('components.minio') or cfg.get('components.seaweedfs')) and ucfg.get('object-storage.route.enabled') and cfg.get('components.static')):
-        res = static.delete_ow_static_endpoint(ucfg)
-        logging.info(f"OpenWhisk static endpoint for {ucfg.get('namespace')} removed = {res}")
+        services['static'] = lambda st, md: _provision(st, 'static', f"OpenWhisk static endpoint for {namespace} removed", static.delete_ow_static_endpoint, ucfg)
 
     if(cfg.get('components.mongodb') and ucfg.get('mongodb.enabled')):
-        res = mdb.delete_db_user(ucfg.get('namespace'),ucfg.get('mongodb.database'))
-        logging.info(f"Mongodb setup for {ucfg.get('namespace')} removed = {res}")
+        services['mongodb'] = lambda st, md: _provision(st, 'mongodb', f"Mongodb setup for {namespace} removed", mdb.delete_db_user, namespace, ucfg.get('mongodb.database'))
 
     if(cfg.get('components.redis') and ucfg.get('redis.enabled')):
-        res = redis.delete_db_user(ucfg.get('namespace'))
-        logging.info(f"Redis setup for {ucfg.get('namespace')} removed = {res}")
+        services['redis'] = lambda st, md: _provision(st, 'redis', f"Redis setup for {namespace} removed", redis.delete_db_user, namespace)
 
     if(cfg.get('components.postgres') and ucfg.get('postgres.enabled')):
-        res = postgres.delete_db_user(ucfg.get('namespace'),ucfg.get('postgres.database'))
-        logging.info(f"Postgres setup for {ucfg.get('namespace')} removed = {res}")
+        services['postgres'] = lambda st, md: _provision(st, 'postgres', f"Postgres setup for {namespace} removed", postgres.delete_db_user, namespace, ucfg.get('postgres.database'))
 
     if(cfg.get('components.milvus') and ucfg.get('milvus.enabled')):
-        res = milvus.delete_ow_milvus(ucfg)
-        logging.info(f"Milvus setup for {ucfg.get('namespace')} removed = {res}")        
+        services['milvus'] = lambda st, md: _provision(st, 'milvus', f"Milvus setup for {namespace} removed", milvus.delete_ow_milvus, ucfg)
+
+    # the static endpoint is removed before the storage it serves
+    provision(services, {}, reverse=True)
 
     res = userdb.delete_user_metadata(ucfg.get('namespace'))
 
 
 @kopf.on.update('nuvolaris.org', 'v1', 'whisksusers')
+@workqueue.queued(queue, "update")
+@aio.handler("wsku")
+@spawn.accounted("whisk_user_update")
 def whisk_user_update(spec, status, namespace, diff, name, **kwargs):
     logging.info(f"*** detected an update of wsku/{name} under namespace {namespace}")
     
@@ -169,10 +281,11 @@ def whisk_user_update(spec, status, namespace, diff, name, **kwargs):
     user_patcher.patch(ucfg,user_metadata,diff, status, owner, name)
 
 @kopf.on.resume('nuvolaris.org', 'v1', 'whisksusers')
-def whisk_user_resume(spec, name, namespace,annotations, **kwargs):
+@workqueue.queued(queue, "resume", hold=False)
+@spawn.accounted("whisk_user_resume")
+async def whisk_user_resume(spec, name, namespace,annotations, **kwargs):
     logging.info(f"*** detected an update of wsku/{name} under namespace {namespace}")
     ucfg = get_ucfg(spec)
-    user_metadata = UserMetadata(ucfg)
     state = {}
     
     if(cfg.get('components.redis') and ucfg.get('redis.enabled')):
@@ -180,8 +293,9 @@ def whisk_user_resume(spec, name, namespace,annotations, **kwargs):
 
         if annotations and REDIS_DB_QUOTA_ANNOTATION in annotations:
             read_only_mode = annotations[REDIS_DB_QUOTA_ANNOTATION] in ["true"]
-            
-        res = redis.create_db_user(ucfg,user_metadata,read_only_mode)
+
+        # the acls of all the resumed users are restored together
+        res = await resume_batcher.submit((ucfg, read_only_mode))
         logging.info(f"Redis setup for {ucfg.get('namespace')} resumed = {res}")
         state['redis']= res
 
@@ -195,4 +309,9 @@ def whisk_user_resume(spec, name, namespace,annotations, **kwargs):
         state['milvus']= True 
 
     if(cfg.get('components.postgres') and ucfg.get('postgres.enabled')):
-        state['postgres']= True                          
\ No newline at end of file
+        state['postgres']= True
+
+
+@kopf.on.cleanup()
+def whisk_user_cleanup(**kwargs):
+    logging.info(f"wsku queue: {json.dumps(queue.stats())}, backends: {json.dumps(workqueue.backend_stats())}")
@@ -25,16 +25,23 @@ from nuvolaris.user_config import UserConfig
 
 
 class UserMetadata:
+    """
+    the password is hashed only when the metadata is persisted
+    >>> um = UserMetadata(UserConfig({"namespace": "demo", "password": "pwd", "bcrypt-rounds": 4}))
+    >>> "password" in um.get_metadata()
+    False
+    >>> um.hash_password()["password"][:7], bu.verify_password("pwd", um.get_metadata()["password"])
+    ('$2b$04$', True)
+    """
     _data = {}
 
     def __init__(self, ucfg: UserConfig):
 
-        password = ucfg.get('password')
-        salted_password = bu.hash_password(password)
+        self._password = ucfg.get('password')
+        self._rounds = bu.rounds_of(ucfg.get('bcrypt-rounds'))
 
         self._data = {
             "login":ucfg.get('namespace'),
-            "password":salted_password,
             "password_timestamp": datetime.now().isoformat(),
             "email":ucfg.get('email'),
             "metadata":[],
@@ -72,6 +79,39 @@ class UserMetadata:
 
     def get_metadata(self):
         return self._data
+
+    def hash_password(self):
+        """
+        hash the password, if not yet done, and return the metadata to persist
+        """
+        hash_passwords([self])
+        return self._data
+
+    def fork(self):
+        """
+        an empty copy of this user metadata collecting the entries of one service,
+        added back with merge so entries collected concurrently keep a stable order
+        >>> ucfg = UserConfig({"namespace": "demo", "password": "pwd"})
+        >>> um = UserMetadata(ucfg)
+        >>> part = um.fork()
+        >>> part.add_metadata("REDIS_URL", "redis://demo")
+        >>> len(um.get_metadata()['metadata'])
+        0
+        >>> um.merge(part)
+        >>> um.get_metadata()['metadata']
+        [{'key': 'REDIS_URL', 'value': 'redis://demo'}]
+        """
+        part = object.__new__(UserMetadata)
+        part._password, part._rounds = self._password, self._rounds
+        part._data = dict(self._data, metadata=[], quota=[])
+        return part
+
+    def merge(self, part):
+        """
+        append the entries collected by a fork
+        """
+        self._data['metadata'].extend(part._data['metadata'])
+        self._data['quota'].extend(part._data['quota'])
     
     def add_safely_from_cm(self,metadata_key,json_path):
         try: 
@@ -79,6 +119,11 @@ class UserMetadata:
             if value:
                 self.add_metadata(metadata_key, value)
         except Exception as e:
-            logging.warn(e)     
-    
+            logging.warn(e)
 
+# hash the passwords of the user metadata not hashed yet, concurrently in the process pool
+def hash_passwords(users_metadata: list):
+    pending = [um for um in users_metadata if "password" not in um._data]
+    hashed = bu.hash_passwords([(um._password, um._rounds) for um in pending])
+    for um, password in zip(pending, hashed):
+        um._data["password"] = password
@@ -18,6 +18,7 @@
 import logging, time
 import nuvolaris.kopf_util as kopf_util
 import nuvolaris.userdb_util as userdb
+import nuvolaris.bcrypt_util as bu
 
 from nuvolaris.user_config import UserConfig
 from nuvolaris.user_metadata import UserMetadata
@@ -40,7 +41,7 @@ def patch(ucfg: UserConfig, user_metadata: UserMetadata, diff, status, owner=Non
 
     # supporting updating password and quota info
     if "password" in what_to_do:
-        userdb.update_user_metadata_password(ucfg.get('namespace'), ucfg.get('password'))
+        userdb.update_user_metadata_password(ucfg.get('namespace'), ucfg.get('password'), bu.rounds_of(ucfg.get('bcrypt-rounds')))
 
     if "quota" in what_to_do:
         userdb.update_user_metadata_quota(ucfg.get('namespace'),user_metadata.get_metadata()["quota"])
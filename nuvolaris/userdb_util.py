@@ -21,8 +21,9 @@ import logging
 import nuvolaris.couchdb as cdb
 import nuvolaris.couchdb_util as couchdb_util
 import nuvolaris.util as util
+import nuvolaris.template as ntp
 from nuvolaris.nuvolaris_metadata import NuvolarisMetadata
-from nuvolaris.user_metadata import UserMetadata
+from nuvolaris.user_metadata import UserMetadata, hash_passwords
 import nuvolaris.bcrypt_util as bu
 USER_META_DBN = "users_metadata"
 
@@ -45,12 +46,30 @@ def save_user_metadata(user_metadata: UserMetadata):
 
     try:
         db = couchdb_util.CouchDB()
-        return _add_metadata(db, metadata)
+        return _add_metadata(db, user_metadata.hash_password())
     except Exception as e:
         logging.error(f"failed to store Nuvolaris metadata for {metadata['login']}. Cause: {e}")
         return None
 
 
+def save_users_metadata(users_metadata: list):
+    """
+    Add the metadata of many users into the internal CouchDB with one _bulk_docs request,
+    returns the outcome of each user
+    """
+    logging.info(f"Storing Nuvolaris metadata for {len(users_metadata)} users")
+
+    try:
+        db = couchdb_util.CouchDB()
+        util.check(db.wait_db_ready(60), "wait_db_ready", True)
+        hash_passwords(users_metadata)
+        docs = [json.loads(ntp.expand_template("user_metadata.json", um.get_metadata())) for um in users_metadata]
+        return db.update_docs(USER_META_DBN, docs)
+    except Exception as e:
+        logging.error(f"failed to store Nuvolaris metadata for {len(users_metadata)} users. Cause: {e}")
+        return [None] * len(users_metadata)
+
+
 def save_nuvolaris_metadata(nuvolaris_metadata: NuvolarisMetadata):
     """
     Add nuvolaris user metadata into the internal CouchDB 
@@ -88,7 +107,7 @@ def delete_user_metadata(login):
         return None
 
 
-def update_user_metadata_password(login, password):
+def update_user_metadata_password(login, password, rounds=None):
     logging.info(f"updating Nuvolaris password for user {login}")
 
     try:
@@ -101,7 +120,7 @@ def update_user_metadata_password(login, password):
             if (len(docs) > 0):
                 doc = docs[0]
                 logging.info(f"updating user credentials {doc['_id']}")
-                doc['password'] = bu.hash_password(password)
+                doc['password'] = bu.hash_passwords([(password, rounds)])[0]
                 return db.update_doc(USER_META_DBN, doc)
 
         logging.warn(f"Nuvolaris metadata for user {login} not found!")
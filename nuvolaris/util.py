@@ -32,7 +32,8 @@ from urllib3.exceptions import NewConnectionError, MaxRetryError, ProtocolError
 import nuvolaris.apihost_util as apihost_util
 import nuvolaris.config as cfg
 import nuvolaris.kube as kube
-import nuvolaris.template as template
+import nuvolaris.lazy as lazy
+template = lazy.module("nuvolaris.template")
 
 # Implements truncated exponential backoff from
 # https://cloud.google.com/storage/docs/retry-strategy#exponential-backoff
@@ -67,12 +68,32 @@ def nuv_retry(deadline_seconds=120, max_backoff=5):
     return decorator
 
 
+DEFAULT_CLASS_JSONPATHS = [
+    r"{.items[?(@.metadata.annotations.storageclass\.kubernetes\.io\/is-default-class=='true')]}",
+    r"{.items[?(@.metadata.annotations.storageclass\.beta\.kubernetes\.io\/is-default-class=='true')]}"
+]
+
+# the default storage classes, evaluated on a single fetch of the storage classes
+def get_default_storage_classes():
+    """
+    >>> import nuvolaris.kube as kube, json
+    >>> classes = {"items": [{"metadata": {"name": "local-path", "annotations": {"storageclass.kubernetes.io/is-default-class": "true"}}, "provisioner": "rancher.io/local-path"},
+    ...                      {"metadata": {"name": "slow"}, "provisioner": "example.com/slow"}]}
+    >>> kube.mocker.config("get storageclass", json.dumps(classes))
+    >>> get_default_storage_class(), get_default_storage_provisioner()
+    ('local-path', 'rancher.io/local-path')
+    >>> kube.mocker.reset()
+    """
+    res = []
+    for found in kube.select("storageclass", DEFAULT_CLASS_JSONPATHS):
+        res += found
+    return res
+
 def get_default_storage_class():
     """
     Get the storage class attempting to get the default storage class defined on the configured kubernetes environment
     """
-    storage_class = kube.kubectl("get", "storageclass", jsonpath=r"{.items[?(@.metadata.annotations.storageclass\.kubernetes\.io\/is-default-class=='true')].metadata.name}")
-    storage_class += kube.kubectl("get", "storageclass", jsonpath=r"{.items[?(@.metadata.annotations.storageclass\.beta\.kubernetes\.io\/is-default-class=='true')].metadata.name}")
+    storage_class = [c["metadata"]["name"] for c in get_default_storage_classes()]
     if(storage_class):
         return storage_class[0]
 
@@ -82,8 +103,7 @@ def get_default_storage_provisioner():
     """
     Get the storage provisioner
     """
-    provisioner = kube.kubectl("get", "storageclass", jsonpath=r"{.items[?(@.metadata.annotations.storageclass\.kubernetes\.io\/is-default-class=='true')].provisioner}")
-    provisioner += kube.kubectl("get", "storageclass", jsonpath=r"{.items[?(@.metadata.annotations.storageclass\.beta\.kubernetes\.io\/is-default-class=='true')].metadata.name}")
+    provisioner = [c.get("provisioner") for c in get_default_storage_classes()]
     if(provisioner):
         return provisioner[0]
 
@@ -183,7 +203,7 @@ def get_ingress_yaml(runtime):
 # wait for a pod name
 @nuv_retry()
 def get_pod_name(jsonpath,namespace="nuvolaris"):
-    pod_name = kube.kubectl("get", "pods", namespace=namespace, jsonpath=jsonpath)
+    pod_name = kube.query("pods", jsonpath, namespace=namespace)
     if(pod_name):
         return pod_name[0]
 
@@ -194,12 +214,17 @@ def wait_for_pod_ready(pod_name_jsonpath, timeout="600s", namespace="nuvolaris")
     try:
         pod_name = get_pod_name(pod_name_jsonpath, namespace)
         logging.info(f"checking pod {pod_name}")
-        while not kube.wait(f"pod/{pod_name}", "condition=ready", timeout, namespace):
-            logging.info(f"waiting for {pod_name} to be ready...")
-            time.sleep(1)
+        wait_for_ready(f"pod/{pod_name}", timeout, namespace)
     except Exception as e:
         logging.error(e)
 
+# block until the target (pod/name, sts/name) is ready
+# the waits are resolved by watch events, the pause only applies when the target is not found
+def wait_for_ready(target, timeout="600s", namespace="nuvolaris"):
+    while not kube.wait(target, "condition=ready", timeout, namespace):
+        logging.info(f"waiting for {target} to be ready...")
+        time.sleep(1)
+
 
 def status_matches(code: int, allowed: List[Union[int, str]]) -> bool:
     """Check if the status code matches any allowed pattern."""
@@ -406,7 +431,7 @@ def get_redis_config_data():
     return data
 
 def get_service(jsonpath,namespace="nuvolaris"):
-    services= kube.kubectl("get", "svc", namespace=namespace, jsonpath=jsonpath)
+    services= kube.query("svc", jsonpath, namespace=namespace)
     if(services):
         return services[0]
 
@@ -465,7 +490,7 @@ def get_postgres_backup_data():
 # wait for a service matching the given jsonpath name
 @nuv_retry()
 def wait_for_service(jsonpath,namespace="nuvolaris"):
-    service_names = kube.kubectl("get", "svc", namespace=namespace, jsonpath=jsonpath)
+    service_names = kube.query("svc", jsonpath, namespace=namespace)
     if(service_names):
         return service_names[0]
 
@@ -475,14 +500,14 @@ def get_controller_http_timeout():
     return cfg.get("configs.limits.time.limit-max") or "5min"
 
 def get_apihost_from_config_map(namespace="nuvolaris"):
-    annotations= kube.kubectl("get", "cm/config", namespace=namespace, jsonpath='{.metadata.annotations.apihost}')
+    annotations= kube.query("cm/config", '{.metadata.annotations.apihost}', namespace=namespace)
     if(annotations):
         return annotations[0]
 
     raise Exception("Could not find apihost annotation inside internal cm/config config Map")
 
 def get_value_from_config_map(namespace="nuvolaris", path='{.metadata.annotations.apihost}'):
-    annotations= kube.kubectl("get", "cm/config", namespace=namespace, jsonpath=path)
+    annotations= kube.query("cm/config", path, namespace=namespace)
     if(annotations):
         return annotations[0]
 
@@ -502,7 +527,7 @@ def get_enable_pod_security():
 def get_runtimes_json_from_config_map(namespace="nuvolaris", path=r'{.data.runtimes\.json}'):
     """ Return the configured runtimes.json from the config map cm/openwhisk-runtimes
     """
-    runtimes= kube.kubectl("get", "cm/openwhisk-runtimes", namespace=namespace, jsonpath=path)
+    runtimes= kube.query("cm/openwhisk-runtimes", path, namespace=namespace)
     if(runtimes):
         return runtimes[0]
 
@@ -607,7 +632,7 @@ def get_pod_name_by_selector(selector, jsonpath, namespace="nuvolaris"):
     param: jsonpath (eg "{.items[?(@.metadata.labels.replicationRole == 'primary')].metadata.name}")
     return: 1st mathing pod name
     """
-    pod_names = kube.kubectl("get", "pods","-l", selector, namespace=namespace, jsonpath=jsonpath)
+    pod_names = kube.query("pods", jsonpath, selector, namespace=namespace)
     if(pod_names):
         return pod_names[0]
 
@@ -622,7 +647,7 @@ def get_service_by_selector(selector,jsonpath,namespace="nuvolaris"):
     param: jsonpath (eg "{.items[?(@.metadata.labels.replicationRole == 'primary')].metadata.name}")
     return: 1st mathing service name
     """
-    services= kube.kubectl("get", "svc","-l",selector, namespace=namespace, jsonpath=jsonpath)
+    services= kube.query("svc", jsonpath, selector, namespace=namespace)
     if(services):
         return services[0]
 
@@ -662,7 +687,7 @@ def get_object_storage_class():
     """
     Get the object storage class attempting to get the default storage class defined on the configured kubernetes environment
     """
-    storage_class = kube.kubectl("get", "storageclass", jsonpath="{.items[?(@.parameters.objectStoreName=='nuvolaris-s3-store')].metadata.name}")
+    storage_class, = kube.select("storageclass", ["{.items[?(@.parameters.objectStoreName=='nuvolaris-s3-store')].metadata.name}"])
     if(storage_class):
         return storage_class[0]
 
@@ -682,7 +707,7 @@ def get_object_storage_rgw_srv_name():
     """
     Get the object store RGW service URL, to be used to configure the static nginx services when running on top of a CEPH OBJECT STORE
     """
-    rgw_urls = kube.kubectl("get", "svc",namespace="rook-ceph",jsonpath="{.items[?(@.metadata.labels.rgw=='nuvolaris-s3-store')].metadata.name}")
+    rgw_urls, = kube.select("svc", ["{.items[?(@.metadata.labels.rgw=='nuvolaris-s3-store')].metadata.name}"], namespace="rook-ceph")
     if(rgw_urls):
         return rgw_urls[0]
 
@@ -692,7 +717,7 @@ def get_object_storage_rgw_srv_http_port():
     """
     Get the object store RGW service URL, to be used to configure the static nginx services when running on top of a CEPH OBJECT STORE
     """
-    rgw_ports = kube.kubectl("get", "svc",namespace="rook-ceph",jsonpath="{.items[?(@.metadata.labels.rgw=='nuvolaris-s3-store')].spec.ports[?(@.name=='http')].port}")
+    rgw_ports, = kube.select("svc", ["{.items[?(@.metadata.labels.rgw=='nuvolaris-s3-store')].spec.ports[?(@.name=='http')].port}"], namespace="rook-ceph")
     if(rgw_ports):
         return rgw_ports[0]
 
@@ -24,6 +24,7 @@ import nuvolaris.config as cfg
 import nuvolaris.template as ntp
 import nuvolaris.util as util
 import nuvolaris.kustomize as kust
+import nuvolaris.workspace as nws
 import os
 
 from nuvolaris.whisk_system_util import WhiskSystemClient
@@ -194,10 +195,10 @@ def process_wsk_result(result: CompletedProcess, expected_success_msg: str):
     logging.info(f"successfully validated wsk response {result}")
 
 @nuv_retry()
-def safe_deploy(wskClient):
-    logging.info("*** deploying deploy/whisk-system project")
+def safe_deploy(wskClient, project="deploy/whisk-system"):
+    logging.info(f"*** deploying {project} project")
 
-    deployProjectResponse = wskClient.wsk("project","deploy","--project","deploy/whisk-system")
+    deployProjectResponse = wskClient.wsk("project","deploy","--project",project)
     process_wsk_result(deployProjectResponse, "Success")
 
     actionListResult = wskClient.wsk("action","list") 
@@ -212,7 +213,9 @@ def deploy_whisk_system_action():
         tplres = kust.processTemplate("whisk-system","whisk-system-manifest-tpl.yaml",data,"manifest.yaml")
 
         wskClient = WhiskSystemClient(auth)
-        result = safe_deploy(wskClient)
+        # wsk reads the project from a folder, with the manifest rendered in the workspace
+        with nws.current().materialized("whisk-system") as project:
+            result = safe_deploy(wskClient, project)
         return result
     except Exception as e:
         logging.error("Error detected when deploying system actions", e)
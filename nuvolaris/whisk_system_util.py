@@ -17,7 +17,7 @@
 #
 # this module wraps a wsk client communicating with the internal OW controller using admin credentials 
 import logging
-import subprocess
+import nuvolaris.spawn as spawn
 import nuvolaris.config as cfg
 
 class WhiskSystemClient:
@@ -40,5 +40,5 @@ class WhiskSystemClient:
 
         # executing
         logging.debug(cmd)
-        return subprocess.run(cmd, capture_output=True)
+        return spawn.run(cmd, capture_output=True)
         
\ No newline at end of file
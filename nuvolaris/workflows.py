@@ -19,12 +19,14 @@ import kopf
 import logging, time, yaml, json, flatdict, os, os.path, random, string
 import nuvolaris.config as cfg
 import nuvolaris.kube as kube
+import nuvolaris.aio as aio
+import nuvolaris.spawn as spawn
 import nuvolaris.template as tpl
 
-def status():
+async def status():
     jpath = '{.items[*].metadata.name}'
-    total = len(kube.kubectl("get", "workflows", jsonpath=jpath))
-    count = len(kube.kubectl("get", "jobs", jsonpath=jpath))
+    total = len(await kube.kubectl_async("get", "workflows", jsonpath=jpath))
+    count = len(await kube.kubectl_async("get", "jobs", jsonpath=jpath))
     return {
         "total": total,
         "count": count
@@ -75,22 +77,26 @@ def generate_job(name, spec, action):
     
 # tested by an integration test
 @kopf.on.create('nuvolaris.org', 'v1', 'workflows')
-def workflows_create(spec, name, **kwargs):
+@spawn.accounted("workflows_create")
+async def workflows_create(spec, name, **kwargs):
     logging.info(f"*** workflows_create {name}")
-    try:
-        kube.kubectl("delete", f"job/{name}-delete")
-    except:
-        pass
-    kube.apply(generate_job(name, spec, "create"))
-    return status()
+    async with aio.limited("workflows"):
+        try:
+            await kube.kubectl_async("delete", f"job/{name}-delete")
+        except:
+            pass
+        await kube.apply_async(generate_job(name, spec, "create"))
+        return await status()
 
 @kopf.on.delete('nuvolaris.org', 'v1', 'workflows')
-def workflows_delete(spec, name, **kwargs):
+@spawn.accounted("workflows_delete")
+async def workflows_delete(spec, name, **kwargs):
     logging.info(f"*** workflows_delete {name}")
     job_name = f"{name}-create"
-    try:
-        kube.kubectl("delete", f"job/{name}-create")
-    except:
-        pass
-    kube.apply(generate_job(name, spec, "delete"))
-    return status()
+    async with aio.limited("workflows"):
+        try:
+            await kube.kubectl_async("delete", f"job/{name}-create")
+        except:
+            pass
+        await kube.apply_async(generate_job(name, spec, "delete"))
+        return await status()
@@ -0,0 +1,293 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# flow control of the events hitting the shared backends
+# the events wait in a priority queue and are admitted in order of priority
+# (then of arrival), within a concurrency limit and the rate of a token bucket
+# the blocking code provisioning a backend (couchdb, redis, postgres...)
+# runs within the concurrency limit and the rate of that backend
+# the rates (per second) can be changed with NUVOLARIS_RATE_<BACKEND>, 0 disables them
+# the concurrency limits are the ones of aio (NUVOLARIS_CONCURRENCY_<BACKEND>)
+import os, time, heapq, asyncio, functools, itertools, logging, threading
+from contextlib import contextmanager, asynccontextmanager
+import nuvolaris.aio as aio
+
+# the priority of the events, lower first
+PRIORITIES = {
+    "create": 0,
+    "delete": 1,
+    "update": 1,
+    "resume": 2,
+}
+
+DEFAULT_RATE = 0
+RATES = {
+    "wsku": 50,
+    "couchdb": 20,
+    "redis": 20,
+    "postgres": 20,
+    "mongodb": 20,
+    "minio": 20,
+    "seaweedfs": 20,
+    "milvus": 10,
+}
+
+# the events waiting longer than this are logged
+SLOW_WAIT = 1.0
+
+def rate_of(backend):
+    """
+    >>> rate_of("wsku"), rate_of("unknown")
+    (50.0, 0.0)
+    """
+    value = os.environ.get(f"NUVOLARIS_RATE_{backend.upper()}")
+    return float(value or RATES.get(backend, DEFAULT_RATE))
+
+class TokenBucket:
+    """
+    a token bucket refilled at rate tokens per second, up to burst tokens
+
+    >>> clock = [0.0]
+    >>> b = TokenBucket(2, 2, clock=lambda: clock[0])
+    >>> b.take(), b.take(), b.take()
+    (0.0, 0.0, 0.5)
+    >>> clock[0] = 0.5
+    >>> b.take(), b.take()
+    (0.0, 0.5)
+    """
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.clock = clock
+        self.tokens = self.burst
+        self.last = clock()
+        self.lock = threading.Lock()
+
+    # take a token and return 0, or return the seconds to wait for the next one
+    def take(self):
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    # take a token, sleeping until available
+    def wait(self):
+        delay = self.take()
+        while delay > 0:
+            time.sleep(delay)
+            delay = self.take()
+        return delay
+
+def bucket(backend):
+    rate = rate_of(backend)
+    return rate > 0 and TokenBucket(rate) or None
+
+class Stats:
+    """
+    the counters of the events (or calls) of each kind
+
+    >>> s = Stats()
+    >>> s.add("create", 0.5); s.add("create", 1.5); s.add("resume", 0)
+    >>> s.get()
+    {'create': {'count': 2, 'wait': 2.0, 'max_wait': 1.5}, 'resume': {'count': 1, 'wait': 0.0, 'max_wait': 0.0}}
+    """
+    def __init__(self):
+        self.kinds = {}
+        self.lock = threading.Lock()
+
+    def add(self, kind, wait):
+        with self.lock:
+            s = self.kinds.setdefault(kind, {"count": 0, "wait": 0.0, "max_wait": 0.0})
+            s["count"] += 1
+            s["wait"] += wait
+            s["max_wait"] = max(s["max_wait"], wait)
+
+    def get(self):
+        with self.lock:
+            return {kind: dict(s) for kind, s in self.kinds.items()}
+
+class WorkQueue:
+    """
+    the events of a backend, admitted by priority within its concurrency limit and rate
+
+    >>> q = WorkQueue("test", limit=1)
+    >>> order = []
+    >>> async def event(kind, name):
+    ...     async with q.slot(kind):
+    ...         order.append(name)
+    ...         await asyncio.sleep(0.01)
+    >>> async def burst():
+    ...     await asyncio.gather(event("resume", "r1"), event("resume", "r2"), event("update", "u1"), event("create", "c1"))
+    >>> asyncio.run(burst())
+    >>> order
+    ['r1', 'c1', 'u1', 'r2']
+    >>> q.stats()["depth"], q.stats()["running"], q.stats()["kinds"]["resume"]["count"]
+    (0, 0, 2)
+    """
+    def __init__(self, name, limit=None, rate=None):
+        self.name = name
+        self.limit = limit or aio.limit_of(name)
+        rate = rate_of(name) if rate is None else rate
+        self.bucket = rate > 0 and TokenBucket(rate) or None
+        self.loop = None
+        self.seq = itertools.count()
+        self.metrics = Stats()
+        self._reset()
+
+    def _reset(self):
+        self.waiting = []
+        self.running = 0
+        self.timer = None
+
+    # wait for the turn of an event of the kind
+    async def acquire(self, kind):
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop = loop
+            self._reset()
+        future = loop.create_future()
+        start = time.monotonic()
+        heapq.heappush(self.waiting, (PRIORITIES.get(kind, len(PRIORITIES)), next(self.seq), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # admitted while being cancelled, give back the slot
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+        wait = time.monotonic() - start
+        self.metrics.add(kind, wait)
+        if wait > SLOW_WAIT:
+            logging.info(f"{self.name} {kind} admitted after {wait:.1f}s, {len(self.waiting)} waiting")
+        return wait
+
+    def release(self):
+        self.running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.waiting and self.running < self.limit:
+            _, _, future = self.waiting[0]
+            if future.done():
+                heapq.heappop(self.waiting)
+                continue
+            delay = self.bucket and self.bucket.take() or 0
+            if delay > 0:
+                if self.timer is None:
+                    self.timer = self.loop.call_later(delay, self._wakeup)
+                return
+            heapq.heappop(self.waiting)
+            self.running += 1
+            future.set_result(None)
+
+    def _wakeup(self):
+        self.timer = None
+        self._dispatch()
+
+    # run the block as an event of the kind
+    @asynccontextmanager
+    async def slot(self, kind):
+        await self.acquire(kind)
+        try:
+            yield
+        finally:
+            self.release()
+
+    # wait for the turn of an event of the kind, without holding a slot
+    # for the events handing their work to a batch, limited on its own
+    async def admit(self, kind):
+        wait = await self.acquire(kind)
+        self.release()
+        return wait
+
+    # the queue depth, the running events and the wait times by kind
+    def stats(self):
+        return {
+            "depth": sum(1 for _, _, future in self.waiting if not future.done()),
+            "running": self.running,
+            "limit": self.limit,
+            "kinds": self.metrics.get()
+        }
+
+# decorator queueing a coroutine handler as an event of the kind
+# when hold is false the event is only admitted, then runs outside the limit
+def queued(queue, kind, hold=True):
+    """
+    >>> q = WorkQueue("test")
+    >>> @queued(q, "create")
+    ... async def create(name, **kwargs): return f"created {name}"
+    >>> asyncio.run(create(name="demo")), q.stats()["kinds"]["create"]["count"]
+    ('created demo', 1)
+    >>> from kopf._core.actions.invocation import is_async_fn
+    >>> is_async_fn(create)
+    True
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            if not hold:
+                await queue.admit(kind)
+                return await function(*args, **kwargs)
+            async with queue.slot(kind):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+_backends = {}
+_backends_lock = threading.Lock()
+_backend_stats = Stats()
+
+def _backend(name):
+    with _backends_lock:
+        entry = _backends.get(name)
+        if entry is None:
+            entry = _backends[name] = (threading.BoundedSemaphore(aio.limit_of(name)), bucket(name))
+        return entry
+
+# run the blocking block within the concurrency limit and the rate of the backend
+@contextmanager
+def backend(name):
+    """
+    >>> with backend("redis"):
+    ...     "provisioned"
+    'provisioned'
+    >>> backend_stats()["redis"]["count"] >= 1
+    True
+    """
+    semaphore, tokens = _backend(name)
+    start = time.monotonic()
+    with semaphore:
+        if tokens:
+            tokens.wait()
+        _backend_stats.add(name, time.monotonic() - start)
+        yield
+
+# a function running within the limits of the backend
+def throttled(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with backend(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+def backend_stats():
+    return _backend_stats.get()
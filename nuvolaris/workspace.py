@@ -0,0 +1,126 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+# copy on write views of the deploy folder
+# rendered files (kustomizations, patches, generated resources) are kept
+# in memory over the files of the source tree, which is never modified
+# each thread has its own workspace, and isolated() gives a block a fresh one,
+# so the same component can be rendered concurrently without locks
+# a workspace has a name (the resource it renders for), keying what outlives it
+import os, shutil, tempfile, threading
+from contextlib import contextmanager
+
+DEPLOY = "deploy"
+
+_local = threading.local()
+
+class Workspace:
+    """
+    >>> ws = Workspace()
+    >>> ws.write("test/__x.yaml", "kind: Pod\\n")
+    >>> ws.read("test/__x.yaml")
+    'kind: Pod\\n'
+    >>> "__x.yaml" in ws.listdir("test"), "pod.yaml" in ws.listdir("test")
+    (True, True)
+    >>> os.path.exists("deploy/test/__x.yaml")
+    False
+    """
+    def __init__(self, root=DEPLOY, files=None, name="default"):
+        self.root = root
+        self.files = dict(files or {})
+        self.name = name
+
+    def _key(self, path):
+        return os.path.normpath(path)
+
+    def write(self, path, content):
+        self.files[self._key(path)] = content
+
+    def read(self, path):
+        key = self._key(path)
+        if key in self.files:
+            return self.files[key]
+        with open(os.path.join(self.root, key)) as f:
+            return f.read()
+
+    def exists(self, path):
+        key = self._key(path)
+        return key in self.files or os.path.exists(os.path.join(self.root, key))
+
+    def listdir(self, where):
+        dir = self._key(where)
+        names = set()
+        if os.path.isdir(os.path.join(self.root, dir)):
+            names.update(os.listdir(os.path.join(self.root, dir)))
+        names.update(os.path.basename(k) for k in self.files if os.path.dirname(k) == dir)
+        return sorted(names)
+
+    # a function reading the files relative to a folder
+    def reader(self, where):
+        return lambda path: self.read(os.path.join(where, path))
+
+    # the files written in a folder
+    def snapshot(self, where):
+        dir = self._key(where)
+        return {k: v for k, v in self.files.items() if os.path.dirname(k) == dir}
+
+    # a temporary folder with the content of the workspace folder, for external tools
+    # the source files are linked, the written ones are copied, and it is removed at the end
+    @contextmanager
+    def materialized(self, where):
+        tmp = tempfile.mkdtemp(prefix="nuv-ws-")
+        try:
+            src = os.path.abspath(os.path.join(self.root, where))
+            if os.path.isdir(src):
+                for name in os.listdir(src):
+                    os.symlink(os.path.join(src, name), os.path.join(tmp, name))
+            for key, content in self.snapshot(where).items():
+                target = os.path.join(tmp, os.path.basename(key))
+                if os.path.islink(target):
+                    os.unlink(target)
+                with open(target, "w") as f:
+                    f.write(content)
+            yield tmp
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+# the workspace of the current block, or the one of the thread
+def current():
+    ws = getattr(_local, "workspace", None)
+    if ws is None:
+        ws = _local.workspace = Workspace()
+    return ws
+
+# run the block in a fresh workspace, with the given name or the one of the current workspace
+@contextmanager
+def isolated(name=None):
+    """
+    >>> current().write("test/__a.yaml", "a")
+    >>> with isolated("wsk/controller") as ws:
+    ...     ws.exists("test/__a.yaml")
+    ...     with isolated() as inner: inner.name
+    False
+    'wsk/controller'
+    >>> current().exists("test/__a.yaml"), current().name
+    (True, 'default')
+    """
+    previous = getattr(_local, "workspace", None)
+    ws = _local.workspace = Workspace(name=name or (previous.name if previous else "default"))
+    try:
+        yield ws
+    finally:
+        _local.workspace = previous